@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from collections import deque
+
+
+class EventLoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a task that sleeps for a fixed
+    interval. Lag means something ran on the loop without yielding, which
+    stalls websocket messages, downloads and every other request.
+    """
+    def __init__(self, interval=0.25, warn_threshold=0.5, window=240):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.recent = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.samples = 0
+        self.stalls = 0
+
+    def record(self, lag):
+        self.recent.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+        self.total_lag += lag
+        self.samples += 1
+        if lag >= self.warn_threshold:
+            self.stalls += 1
+            logging.warning("Event loop was blocked for {:.0f} ms".format(lag * 1000))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - start - self.interval))
+
+    def get_stats(self):
+        return {
+            "lag_ms": self.recent[-1] * 1000 if self.recent else 0.0,
+            "recent_max_lag_ms": max(self.recent) * 1000 if self.recent else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+            "avg_lag_ms": self.total_lag / self.samples * 1000 if self.samples else 0.0,
+            "stalls": self.stalls,
+            "interval_ms": self.interval * 1000,
+        }
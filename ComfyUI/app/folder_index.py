@@ -0,0 +1,413 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def read_dir(path, excluded_dir_names=(), exclude_hidden_dirs=False):
+    """
+    Lists one directory. Returns (mtime, {file name: (size, mtime)}, subdir names). Symlinks are followed;
+    entries that can't be accessed, such as broken links, are listed as files of size 0 like os.walk does.
+    """
+    mtime = os.path.getmtime(path)
+    files = {}
+    subdirs = set()
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                if entry.name not in excluded_dir_names and not (exclude_hidden_dirs and entry.name.startswith(".")):
+                    subdirs.add(entry.name)
+                continue
+            try:
+                stat = entry.stat()
+                files[entry.name] = (stat.st_size, stat.st_mtime)
+            except OSError:
+                files[entry.name] = (0, 0.0)
+    return mtime, files, subdirs
+
+def get_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class DirectoryIndex:
+    """
+    File listing of one directory tree, kept as the entries of each directory so that a change only rescans
+    the directories it touched. Paths are relative to the root, like the ones from folder_paths.recursive_search.
+    Directories are read in parallel when an executor is given. Not thread safe, FolderIndex locks around it.
+    """
+    SNAPSHOT_FORMAT = 1
+
+    def __init__(self, root, excluded_dir_names=(), exclude_hidden_dirs=False):
+        self.root = root
+        self.excluded_dir_names = set(excluded_dir_names)
+        self.exclude_hidden_dirs = exclude_hidden_dirs
+        # relative dir -> (mtime, {file name: (size, mtime)}, subdir names)
+        self.dirs = {}
+        self.files = set()
+        self.version = 0
+
+    def read(self, rel):
+        return read_dir(os.path.join(self.root, rel), self.excluded_dir_names, self.exclude_hidden_dirs)
+
+    def scan_dir(self, rel):
+        """Rescans the entries of one directory. Returns (new subdirs, removed dirs), both relative."""
+        try:
+            listing = self.read(rel)
+        except OSError:
+            return [], self.remove_dir(rel)
+        return self.apply_dir(rel, listing)
+
+    def apply_dir(self, rel, listing):
+        mtime, files, subdirs = listing
+        old = self.dirs.get(rel)
+        old_files, old_subdirs = (old[1], old[2]) if old is not None else ({}, set())
+        removed = []
+        for name in old_subdirs - subdirs:
+            removed += self.remove_dir(os.path.join(rel, name))
+        for name in old_files.keys() - files.keys():
+            self.files.discard(os.path.join(rel, name))
+        for name in files.keys() - old_files.keys():
+            self.files.add(os.path.join(rel, name))
+        if old is None or files.keys() != old_files.keys() or subdirs != old_subdirs:
+            self.version += 1
+        self.dirs[rel] = (mtime, files, subdirs)
+        return [os.path.join(rel, name) for name in subdirs - old_subdirs], removed
+
+    def scan_tree(self, rel="", executor=None):
+        """Scans a directory and everything below it. Returns the directories that were added."""
+        added = []
+        if executor is None:
+            pending = [rel]
+            while len(pending) > 0:
+                d = pending.pop()
+                new_dirs, _ = self.scan_dir(d)
+                if d in self.dirs:
+                    added.append(d)
+                pending += new_dirs
+            return added
+
+        # Fan out over subdirectories as soon as their parent has been read
+        futures = {executor.submit(self.read, rel): rel}
+        while len(futures) > 0:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                d = futures.pop(future)
+                try:
+                    new_dirs, _ = self.apply_dir(d, future.result())
+                except OSError:
+                    self.remove_dir(d)
+                    continue
+                added.append(d)
+                for new_dir in new_dirs:
+                    futures[executor.submit(self.read, new_dir)] = new_dir
+        return added
+
+    def remove_dir(self, rel):
+        if rel not in self.dirs:
+            return []
+        removed = [d for d in self.dirs if d == rel or d.startswith(os.path.join(rel, ""))] if rel != "" else list(self.dirs)
+        for d in removed:
+            _, files, _ = self.dirs.pop(d)
+            for name in files:
+                self.files.discard(os.path.join(d, name))
+        self.version += 1
+        return removed
+
+    def refresh(self, executor=None):
+        """Rescans directories whose mtime changed. Returns (added dirs, removed dirs)."""
+        rels = list(self.dirs.keys())
+        paths = [os.path.join(self.root, rel) for rel in rels]
+        mtimes = executor.map(get_mtime, paths) if executor is not None else map(get_mtime, paths)
+        changed = [rel for rel, mtime in zip(rels, mtimes) if mtime is None or mtime != self.dirs[rel][0]]
+
+        added = []
+        removed = []
+        for rel in changed:
+            if rel not in self.dirs:
+                continue
+            new_dirs, gone = self.scan_dir(rel)
+            removed += gone
+            for d in new_dirs:
+                added += self.scan_tree(d, executor)
+        return added, removed
+
+    def dir_mtimes(self):
+        """{directory: mtime} with the same keys as folder_paths.recursive_search."""
+        return {os.path.join(self.root, rel) if rel != "" else self.root: mtime for rel, (mtime, _, _) in self.dirs.items()}
+
+    def snapshot_name(self):
+        key = json.dumps([self.root, sorted(self.excluded_dir_names), self.exclude_hidden_dirs])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json"
+
+    def save_snapshot(self, path):
+        data = {
+            "format": self.SNAPSHOT_FORMAT,
+            "root": self.root,
+            "dirs": {rel: [mtime, files, sorted(subdirs)] for rel, (mtime, files, subdirs) in self.dirs.items()},
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+
+    def load_snapshot(self, path):
+        """Fills the index from a snapshot. Returns False if there is no usable snapshot."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != self.SNAPSHOT_FORMAT or data.get("root") != self.root:
+                return False
+            for rel, (mtime, files, subdirs) in data["dirs"].items():
+                self.apply_dir(rel, (mtime, {name: tuple(v) for name, v in files.items()}, set(subdirs)))
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.debug("Ignoring folder snapshot {}: {}".format(path, e))
+            self.dirs.clear()
+            self.files.clear()
+            return False
+        return True
+
+
+scan_executor = None
+scan_executor_lock = threading.Lock()
+
+def get_scan_executor(workers):
+    global scan_executor
+    if workers <= 1:
+        return None
+    with scan_executor_lock:
+        if scan_executor is None:
+            scan_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="folder-scan")
+        return scan_executor
+
+def crawl(root, excluded_dir_names=(), exclude_hidden_dirs=False, workers=8, snapshot_dir=None):
+    """
+    Lists a directory tree with workers threads. With snapshot_dir, the listing is saved there and the next
+    crawl of the same tree starts from it, only rereading directories whose mtime changed.
+    """
+    index = DirectoryIndex(root, excluded_dir_names, exclude_hidden_dirs)
+    executor = get_scan_executor(workers)
+    snapshot_path = None
+    if snapshot_dir is not None:
+        snapshot_path = os.path.join(snapshot_dir, index.snapshot_name())
+        if index.load_snapshot(snapshot_path):
+            version = index.version
+            index.refresh(executor)
+            if index.version == version:
+                return index
+        else:
+            index.scan_tree("", executor)
+        if len(index.dirs) > 0:
+            try:
+                index.save_snapshot(snapshot_path)
+            except OSError as e:
+                logging.warning("Could not save folder snapshot {}: {}".format(snapshot_path, e))
+        return index
+
+    index.scan_tree("", executor)
+    return index
+
+
+class Inotify:
+    """Minimal inotify binding, raises OSError where inotify isn't available."""
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_ONLYDIR = 0x1000000
+    WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(path))
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Returns [(wd, mask)] of the events that arrive within timeout seconds."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            events.append((wd, mask))
+            offset += self.EVENT.size + length
+        return events
+
+
+class FolderIndex:
+    """
+    Keeps the file lists of model folders in memory and up to date, so that listing and looking up models
+    doesn't touch the disk. Directories are watched with inotify where available; every poll_interval
+    seconds the mtimes of all indexed directories are also checked in the background, which catches changes
+    inotify doesn't report (network filesystems) and is the only mechanism elsewhere.
+    """
+    def __init__(self, poll_interval=5.0, use_inotify=True, workers=8, snapshot_dir=None):
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.workers = workers
+        self.snapshot_dir = snapshot_dir
+        self.lock = threading.Lock()
+        # (root, excluded dir names) -> DirectoryIndex
+        self.indexes = {}
+        self.inotify = None
+        # watch descriptor -> (index, relative dir), and the reverse
+        self.watches = {}
+        self.watch_descriptors = {}
+        self.watch_limit_reached = False
+        self.thread = None
+
+    def start(self):
+        if self.use_inotify:
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                logging.info("Not watching model folders with inotify ({}), polling them instead".format(e))
+        self.thread = threading.Thread(target=self.run, name="folder-index", daemon=True)
+        self.thread.start()
+
+    def get(self, root, excluded_dir_names=()):
+        """Returns the index of root, listing it on first use."""
+        key = (root, tuple(sorted(excluded_dir_names)))
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                return index
+            if self.thread is None:
+                self.start()
+            index = crawl(root, excluded_dir_names, workers=self.workers, snapshot_dir=self.snapshot_dir)
+            self.watch(index, list(index.dirs))
+            self.indexes[key] = index
+            return index
+
+    def list_files(self, root, excluded_dir_names=()):
+        """Like folder_paths.recursive_search: (relative file paths, {directory: mtime})."""
+        index = self.get(root, excluded_dir_names)
+        with self.lock:
+            return list(index.files), index.dir_mtimes()
+
+    def version(self, roots):
+        """Changes whenever the files under one of roots change. None if one isn't indexed yet."""
+        with self.lock:
+            versions = []
+            for root in roots:
+                found = [index.version for (r, _), index in self.indexes.items() if r == root]
+                if len(found) == 0 and os.path.isdir(root):
+                    return None
+                versions.append(tuple(found))
+            return tuple(versions)
+
+    def changes(self):
+        """Changes whenever a folder is indexed or any indexed folder changes, without touching the disk."""
+        with self.lock:
+            return (len(self.indexes), sum(index.version for index in self.indexes.values()))
+
+    def find(self, roots, filename):
+        """Full path of filename (relative, normalized) in the first root that has it, None if unknown."""
+        with self.lock:
+            for root in roots:
+                for (r, _), index in self.indexes.items():
+                    if r == root and filename in index.files:
+                        return os.path.join(root, filename)
+        return None
+
+    def watch(self, index, dirs):
+        if self.inotify is None or self.watch_limit_reached:
+            return
+        for rel in dirs:
+            try:
+                wd = self.inotify.add_watch(os.path.join(index.root, rel))
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    self.watch_limit_reached = True
+                    logging.warning("Reached the inotify watch limit, model folder changes will be found by polling every {} seconds".format(self.poll_interval))
+                    return
+                continue
+            self.watches[wd] = (index, rel)
+            self.watch_descriptors[(id(index), rel)] = wd
+
+    def unwatch(self, index, dirs):
+        for rel in dirs:
+            wd = self.watch_descriptors.pop((id(index), rel), None)
+            if wd is not None:
+                self.watches.pop(wd, None)
+                self.inotify.rm_watch(wd)
+
+    def apply(self, index, added, removed):
+        self.unwatch(index, removed)
+        self.watch(index, added)
+
+    def refresh(self):
+        with self.lock:
+            for index in self.indexes.values():
+                self.apply(index, *index.refresh(get_scan_executor(self.workers)))
+
+    def handle_events(self, events):
+        with self.lock:
+            if any(mask & Inotify.IN_Q_OVERFLOW for _, mask in events):
+                for index in self.indexes.values():
+                    self.apply(index, *index.refresh())
+                return
+            changed = {self.watches[wd] for wd, _ in events if wd in self.watches}
+            for index, rel in changed:
+                if rel not in index.dirs:
+                    continue
+                new_dirs, removed = index.scan_dir(rel)
+                added = []
+                for d in new_dirs:
+                    added += index.scan_tree(d)
+                self.apply(index, added, removed)
+
+    def run(self):
+        while True:
+            try:
+                if self.inotify is not None:
+                    events = self.inotify.read(self.poll_interval)
+                    if len(events) > 0:
+                        self.handle_events(events)
+                        continue
+                else:
+                    time.sleep(self.poll_interval)
+                self.refresh()
+            except Exception:
+                logging.exception("Error updating the model folder index")
+                time.sleep(self.poll_interval)
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class HistoryStore:
+    """
+    Prompt history kept in SQLite, so that it survives restarts and lookups don't scan or copy the whole
+    history. Entries are indexed by prompt id, status, completion time and output filenames, and the most
+    recent ones are also kept in memory. Entries must not be modified after being added.
+
+    path can be ":memory:" to keep the history for the lifetime of the process only.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            prompt_id TEXT NOT NULL UNIQUE,
+            status TEXT,
+            completed_at REAL NOT NULL,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_status ON history (status, seq);
+        CREATE INDEX IF NOT EXISTS history_completed_at ON history (completed_at);
+        CREATE TABLE IF NOT EXISTS history_outputs (
+            seq INTEGER NOT NULL REFERENCES history (seq) ON DELETE CASCADE,
+            filename TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_outputs_filename ON history_outputs (filename);
+        CREATE INDEX IF NOT EXISTS history_outputs_seq ON history_outputs (seq);
+    """
+
+    def __init__(self, path=":memory:", max_items=10000, max_age=None, hot_size=256):
+        self.max_items = max_items
+        self.max_age = max_age
+        self.hot_size = hot_size
+        self.lock = threading.Lock()
+        # prompt_id -> (seq, entry) for the latest entries, oldest first
+        self.hot = OrderedDict()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        try:
+            self.db = self._connect(path)
+        except sqlite3.DatabaseError as e:
+            logging.error("Prompt history database {} is unreadable, keeping history in memory: {}".format(path, e))
+            self.db = self._connect(":memory:")
+
+        for seq, prompt_id, entry in reversed(self.db.execute("SELECT seq, prompt_id, entry FROM history ORDER BY seq DESC LIMIT ?", (hot_size,)).fetchall()):
+            self.hot[prompt_id] = (seq, json.loads(entry))
+
+    @classmethod
+    def _connect(cls, path):
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA foreign_keys=ON")
+        db.executescript(cls.SCHEMA)
+        return db
+
+    @staticmethod
+    def output_filenames(entry):
+        filenames = set()
+        for node_output in entry.get("outputs", {}).values():
+            for items in node_output.values():
+                if isinstance(items, list):
+                    for item in items:
+                        if isinstance(item, dict) and isinstance(item.get("filename"), str):
+                            filenames.add(item["filename"])
+        return filenames
+
+    def put(self, prompt_id, entry):
+        status = (entry.get("status") or {}).get("status_str")
+        data = json.dumps(entry, default=str)
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.execute("DELETE FROM history WHERE prompt_id = ?", (prompt_id,))
+                seq = self.db.execute("INSERT INTO history (prompt_id, status, completed_at, entry) VALUES (?, ?, ?, ?)",
+                                      (prompt_id, status, now, data)).lastrowid
+                self.db.executemany("INSERT INTO history_outputs (seq, filename) VALUES (?, ?)",
+                                    [(seq, filename) for filename in self.output_filenames(entry)])
+                self._apply_retention(seq, now)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+            self.hot.pop(prompt_id, None)
+            self.hot[prompt_id] = (seq, entry)
+            while len(self.hot) > self.hot_size:
+                self.hot.popitem(last=False)
+
+    def _apply_retention(self, seq, now):
+        removed = self.db.execute("DELETE FROM history WHERE seq <= ?", (seq - self.max_items,)).rowcount
+        if self.max_age is not None:
+            removed += self.db.execute("DELETE FROM history WHERE completed_at < ?", (now - self.max_age,)).rowcount
+        if removed > 0:
+            oldest = self.db.execute("SELECT MIN(seq) FROM history").fetchone()[0]
+            for prompt_id in [k for k, (s, _) in self.hot.items() if oldest is None or s < oldest]:
+                del self.hot[prompt_id]
+
+    def get(self, prompt_id):
+        with self.lock:
+            if prompt_id in self.hot:
+                return self.hot[prompt_id][1]
+            row = self.db.execute("SELECT entry FROM history WHERE prompt_id = ?", (prompt_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _query(self, where, params, order, limit, offset=0):
+        sql = "SELECT seq, prompt_id, entry FROM history"
+        if len(where) > 0:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY seq {} LIMIT ? OFFSET ?".format(order)
+        with self.lock:
+            rows = self.db.execute(sql, params + [-1 if limit is None else limit, offset]).fetchall()
+            hot = {prompt_id: entry for prompt_id, (_, entry) in self.hot.items()}
+        # Recent entries are served from memory without parsing them again
+        return [(seq, prompt_id, hot[prompt_id] if prompt_id in hot else json.loads(entry)) for seq, prompt_id, entry in rows]
+
+    def get_page(self, max_items=None, offset=-1, status=None, before=None, after=None, filename=None):
+        """
+        Returns a list of (cursor, prompt_id, entry) in the order the prompts finished. Pass the first cursor as
+        before (or the last as after) to get the neighbouring page. Without a cursor, offset counts from the oldest
+        entry, and a negative offset with max_items returns the latest max_items entries.
+        """
+        where = []
+        params = []
+        if status is not None:
+            where.append("status = ?")
+            params.append(status)
+        if before is not None:
+            where.append("seq < ?")
+            params.append(before)
+        if after is not None:
+            where.append("seq > ?")
+            params.append(after)
+        if filename is not None:
+            where.append("seq IN (SELECT seq FROM history_outputs WHERE filename = ?)")
+            params.append(filename)
+
+        if (before is not None or offset < 0) and after is None and max_items is not None:
+            return list(reversed(self._query(where, params, "DESC", max_items)))
+        return self._query(where, params, "ASC", max_items, max(offset, 0))
+
+    def delete(self, prompt_id):
+        with self.lock:
+            self.db.execute("DELETE FROM history WHERE prompt_id = ?", (prompt_id,))
+            self.hot.pop(prompt_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM history")
+            self.hot.clear()
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def __contains__(self, prompt_id):
+        return self.get(prompt_id) is not None
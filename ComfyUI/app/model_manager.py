@@ -4,7 +4,6 @@ import os
 import base64
 import json
 import time
-import logging
 import folder_paths
 import glob
 import comfy.utils
@@ -12,6 +11,8 @@ from aiohttp import web
 from PIL import Image
 from io import BytesIO
 from folder_paths import map_legacy, filter_files_extensions, filter_files_content_types
+from comfy.cli_args import args
+from app.folder_index import crawl
 
 
 class ModelFileManager:
@@ -99,8 +100,6 @@ class ModelFileManager:
             return None
         if not os.path.isdir(folder):
             return None
-        if os.path.getmtime(folder) != model_file_list_cache[1]:
-            return None
         for x in model_file_list_cache[1]:
             time_modified = model_file_list_cache[1][x]
             folder = x
@@ -117,34 +116,14 @@ class ModelFileManager:
         # TODO use settings
         include_hidden_files = False
 
-        result: list[str] = []
-        dirs: dict[str, float] = {}
-
-        for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-            subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-            if not include_hidden_files:
-                subdirs[:] = [d for d in subdirs if not d.startswith(".")]
-                filenames = [f for f in filenames if not f.startswith(".")]
-
-            filenames = filter_files_extensions(filenames, folder_paths.supported_pt_extensions)
-
-            for file_name in filenames:
-                try:
-                    relative_path = os.path.relpath(os.path.join(dirpath, file_name), directory)
-                    result.append(relative_path)
-                except:
-                    logging.warning(f"Warning: Unable to access {file_name}. Skipping this file.")
-                    continue
-
-            for d in subdirs:
-                path: str = os.path.join(dirpath, d)
-                try:
-                    dirs[path] = os.path.getmtime(path)
-                except FileNotFoundError:
-                    logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                    continue
+        index = crawl(directory, excluded_dir_names, exclude_hidden_dirs=not include_hidden_files,
+                      workers=args.folder_scan_workers, snapshot_dir=args.folder_snapshot_dir)
+        result = index.files
+        if not include_hidden_files:
+            result = [f for f in result if not os.path.basename(f).startswith(".")]
+        result = filter_files_extensions(result, folder_paths.supported_pt_extensions)
 
-        return [{"name": f, "pathIndex": pathIndex} for f in result], dirs, time.perf_counter()
+        return [{"name": f, "pathIndex": pathIndex} for f in result], index.dir_mtimes(), time.perf_counter()
 
     def get_model_previews(self, filepath: str) -> list[str | BytesIO]:
         dirname = os.path.dirname(filepath)
@@ -0,0 +1,113 @@
+import gzip
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+
+class ObjectInfo(NamedTuple):
+    revision: str
+    etag: str
+    body: bytes
+    gzip_body: bytes
+    # class name -> JSON text of its node info
+    nodes: dict
+
+
+def join_nodes(nodes):
+    return "{" + ",".join("{}:{}".format(json.dumps(name), text) for name, text in nodes.items()) + "}"
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches etag."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == "*" or tag == etag:
+            return True
+    return False
+
+
+class ObjectInfoCache:
+    """
+    The serialized /object_info payload, kept together with its gzipped variant and an ETag. build() returns
+    the info of every node and is only called again when get_version() returns something new, the revision
+    only goes up when the payload actually changed. The node hashes of the last max_history revisions are kept
+    so clients can ask for the nodes that changed since the revision they have. Revisions are "<epoch>-<n>" with
+    an epoch that is new for every cache, so a revision from before a restart is never mistaken for a current one.
+    """
+    def __init__(self, build: Callable[[], dict], get_version: Callable[[], object], max_history=16, compresslevel=6):
+        self.build = build
+        self.get_version = get_version
+        self.max_history = max_history
+        self.compresslevel = compresslevel
+        self.epoch = uuid.uuid4().hex[:8]
+        self.count = 0
+        self.lock = threading.Lock()
+        self.version = None
+        self.current: Optional[ObjectInfo] = None
+        # revision -> {class name: hash of its JSON text}
+        self.history = OrderedDict()
+
+    def get(self) -> ObjectInfo:
+        """Returns the current payload, rebuilding it if the registry or a file list changed. Blocks while building."""
+        with self.lock:
+            version = self.get_version()
+            if self.current is not None and version == self.version:
+                return self.current
+
+            nodes = {name: json.dumps(info) for name, info in self.build().items()}
+            body = join_nodes(nodes).encode("utf-8")
+            current = self.current
+            if current is None or body != current.body:
+                self.count += 1
+                revision = "{}-{}".format(self.epoch, self.count)
+                digest = hashlib.sha256(body).hexdigest()[:16]
+                current = ObjectInfo(revision=revision,
+                                     etag='"{}-{}"'.format(revision, digest),
+                                     body=body,
+                                     gzip_body=gzip.compress(body, compresslevel=self.compresslevel),
+                                     nodes=nodes)
+                self.history[revision] = {name: hash(text) for name, text in nodes.items()}
+                while len(self.history) > self.max_history:
+                    self.history.popitem(last=False)
+            self.current = current
+            self.version = version
+            return current
+
+    def invalidate(self):
+        """Forces the next get() to rebuild the payload."""
+        with self.lock:
+            self.version = None
+
+    def diff(self, since: str):
+        """
+        Returns (info, changed, removed): the current payload, the class names that were added or changed
+        since revision since and the ones that were removed. changed is None if that revision is too old,
+        clients need the full payload then.
+        """
+        info = self.get()
+        with self.lock:
+            previous = self.history.get(since)
+            current = self.history.get(info.revision)
+        if previous is None or current is None:
+            return info, None, []
+        changed = [name for name, digest in current.items() if previous.get(name) != digest]
+        removed = [name for name in previous if name not in current]
+        return info, changed, removed
+
+    def diff_body(self, since: str) -> tuple[ObjectInfo, bytes]:
+        """The JSON body of a diff response, see diff()."""
+        info, changed, removed = self.diff(since)
+        full = changed is None
+        if full:
+            changed = list(info.nodes)
+        nodes = join_nodes({name: info.nodes[name] for name in changed})
+        body = '{{"revision": {}, "since": {}, "full": {}, "changed": {}, "removed": {}}}'.format(
+            json.dumps(info.revision), json.dumps(since), json.dumps(full), nodes, json.dumps(removed))
+        return info, body.encode("utf-8")
@@ -0,0 +1,106 @@
+import struct
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+# Image type sent in the header of binary preview messages
+PREVIEW_TYPES = {"JPEG": 1, "PNG": 2}
+
+
+def encode_preview(image, max_size, image_format="JPEG", quality=95):
+    """
+    Shrinks a PIL preview to fit max_size and encodes it as the payload of a PREVIEW_IMAGE message. Smaller
+    previews are sent as they are, clients scale them.
+    """
+    if max_size is not None and max(image.size) > max_size:
+        if hasattr(Image, 'Resampling'):
+            resampling = Image.Resampling.BILINEAR
+        else:
+            resampling = Image.Resampling.LANCZOS
+
+        image = ImageOps.contain(image, (max_size, max_size), resampling)
+
+    bytesIO = BytesIO()
+    bytesIO.write(struct.pack(">I", PREVIEW_TYPES[image_format]))
+    image.save(bytesIO, format=image_format, quality=quality, compress_level=1)
+    return bytesIO.getvalue()
+
+
+class PreviewThrottle:
+    """
+    Preview settings and rate limit of each client. A client gets at most max_fps previews per second
+    (0 for no limit) and no new preview while its previous one is still being encoded, so steps are skipped
+    instead of previews piling up behind a slow encoder. Used from both the sampler and the server thread.
+    """
+    def __init__(self, max_fps=0, image_format=None, quality=95):
+        self.defaults = {"max_fps": max_fps, "format": image_format, "quality": quality}
+        self.lock = threading.Lock()
+        # sid -> settings of the clients that sent their own. None is for broadcasts.
+        self.clients = {}
+        # sid -> [time of the last preview, whether a preview is being encoded]. Entries are dropped once they
+        # no longer hold a client back, so clients that never connect a websocket don't pile up here.
+        self.previews = {}
+
+    def _ready(self, sid, now):
+        preview = self.previews.get(sid)
+        if preview is None:
+            return True
+        last, encoding = preview
+        if encoding:
+            return False
+        max_fps = self.clients.get(sid, self.defaults)["max_fps"]
+        return max_fps <= 0 or now - last >= 1.0 / max_fps
+
+    def _prune(self, now):
+        for sid in [sid for sid in self.previews if self._ready(sid, now)]:
+            del self.previews[sid]
+
+    def configure(self, sid, settings):
+        """Updates the settings of a client from a dict with any of max_fps, format and quality."""
+        update = {}
+        if "max_fps" in settings:
+            update["max_fps"] = float(settings["max_fps"])
+            if update["max_fps"] < 0:
+                raise ValueError("max_fps must not be negative")
+        if "format" in settings:
+            update["format"] = str(settings["format"]).upper()
+            if update["format"] not in PREVIEW_TYPES:
+                raise ValueError("Unsupported preview format {}".format(settings["format"]))
+        if "quality" in settings:
+            update["quality"] = int(settings["quality"])
+            if not 1 <= update["quality"] <= 100:
+                raise ValueError("quality must be between 1 and 100")
+        with self.lock:
+            self.clients[sid] = dict(self.clients.get(sid, self.defaults), **update)
+
+    def remove(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+            self.previews.pop(sid, None)
+
+    def wants_preview(self, sid):
+        """Whether the next step should be decoded into a preview for the client."""
+        with self.lock:
+            return self._ready(sid, time.monotonic())
+
+    def begin(self, sid, default_format="JPEG"):
+        """
+        Claims the client's encoder. Returns (format, quality) to encode the preview with, or None to skip it.
+        Every claim must be followed by a call to end.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not self._ready(sid, now):
+                return None
+            self._prune(now)
+            self.previews[sid] = [now, True]
+            settings = self.clients.get(sid, self.defaults)
+            return (settings["format"] or default_format, settings["quality"])
+
+    def end(self, sid):
+        with self.lock:
+            preview = self.previews.get(sid)
+            if preview is not None:
+                preview[1] = False
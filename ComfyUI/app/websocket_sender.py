@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from collections import deque
+
+import aiohttp
+
+
+class WebSocketSender:
+    """
+    Bounded outbound queue of one websocket, drained by its own task so that a slow client only delays
+    itself. Messages put with a coalescing key replace the queued message with the same key where it is in the
+    queue, so a client that falls behind gets the latest progress, status and preview instead of every one of
+    them, still in order with the messages around them.
+
+    When the queue is full the oldest coalescable message is dropped. A client whose queue is full of
+    messages that can't be dropped, or that doesn't accept a message within send_timeout seconds,
+    is disconnected.
+    """
+    def __init__(self, ws, max_queue=256, send_timeout=10.0):
+        self.ws = ws
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        # [key, message] entries, message is None once superseded or dropped
+        self.queue = deque()
+        self.latest = {}
+        self.depth = 0
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = None
+
+        self.max_depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def put(self, message, key=None):
+        """Queues a json-able dict or bytes. Returns False if the client was disconnected."""
+        if self.closed:
+            return False
+        if key is not None:
+            previous = self.latest.get(key)
+            if previous is not None and previous[1] is not None:
+                previous[1] = message
+                self.coalesced += 1
+                return True
+        if self.depth >= self.max_queue and not self.drop_oldest():
+            logging.warning("Disconnecting websocket client that has {} messages waiting".format(self.depth))
+            self.dropped += 1
+            self.close()
+            return False
+
+        entry = [key, message]
+        self.queue.append(entry)
+        if key is not None:
+            self.latest[key] = entry
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.ready.set()
+        return True
+
+    def drop_oldest(self):
+        for entry in self.queue:
+            if entry[0] is not None and entry[1] is not None:
+                entry[1] = None
+                self.depth -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    async def send(self, message):
+        if isinstance(message, (bytes, bytearray)):
+            await self.ws.send_bytes(message)
+        else:
+            await self.ws.send_json(message)
+
+    async def run(self):
+        while not self.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            while len(self.queue) > 0 and not self.closed:
+                entry = self.queue.popleft()
+                key, message = entry
+                if key is not None and self.latest.get(key) is entry:
+                    del self.latest[key]
+                if message is None:
+                    continue
+                self.depth -= 1
+                try:
+                    await asyncio.wait_for(self.send(message), self.send_timeout)
+                    self.sent += 1
+                except asyncio.TimeoutError:
+                    logging.warning("Disconnecting websocket client that didn't accept a message for {} seconds".format(self.send_timeout))
+                    self.close()
+                except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError) as err:
+                    logging.warning("send error: {}".format(err))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.latest.clear()
+        self.depth = 0
+        self.ready.set()
+        asyncio.ensure_future(self.ws.close())
+
+    def stop(self):
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+
+    def get_stats(self):
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
@@ -41,6 +41,8 @@ parser.add_argument("--tls-keyfile", type=str, help="Path to TLS (SSL) key file.
 parser.add_argument("--tls-certfile", type=str, help="Path to TLS (SSL) certificate file. Enables TLS, makes app accessible at https://... requires --tls-keyfile to function")
 parser.add_argument("--enable-cors-header", type=str, default=None, metavar="ORIGIN", nargs="?", const="*", help="Enable CORS (Cross-Origin Resource Sharing) with optional origin or allow all with default '*'.")
 parser.add_argument("--max-upload-size", type=float, default=100, help="Set the maximum upload size in MB.")
+parser.add_argument("--validation-workers", type=int, default=4, help="Threads used to validate queued prompts off the server event loop.")
+parser.add_argument("--max-client-validations", type=int, default=2, help="Maximum number of prompts from one client that are validated at the same time.")
 
 parser.add_argument("--base-directory", type=str, default=None, help="Set the ComfyUI base directory for models, custom_nodes, input, output, temp, and user directories.")
 parser.add_argument("--extra-model-paths-config", type=str, default=None, metavar="PATH", nargs='+', action='append', help="Load one or more extra_model_paths.yaml files.")
@@ -99,12 +101,32 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--preview-max-fps", type=float, default=0, help="Default maximum number of sampler previews sent to a client per second, 0 for no limit. Clients can change it with a preview_settings websocket message.")
+parser.add_argument("--preview-grid", action="store_true", help="Preview every image of a batch (up to 16) as a grid instead of only the first one.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
+cache_group.add_argument("--cache-memory", type=float, default=0, metavar="GB", help="Use LRU caching that evicts cached node results once they hold more than GB of RAM/VRAM.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
 
+parser.add_argument("--exact-tensor-hash", action="store_true", help="Hash every element of tensors used as node inputs when building cache keys. By default large tensors are hashed from samples.")
+parser.add_argument("--disk-cache-dir", type=str, default=None, help="Persist serializable node outputs (conditioning, latents, images) to this directory so they survive restarts.")
+parser.add_argument("--disk-cache-size", type=float, default=10.0, metavar="GB", help="Maximum size of the --disk-cache-dir cache.")
+parser.add_argument("--disk-cache-include", type=str, nargs="+", default=None, metavar="NODE_CLASS", help="Only persist outputs of these node classes.")
+parser.add_argument("--disk-cache-exclude", type=str, nargs="+", default=[], metavar="NODE_CLASS", help="Never persist outputs of these node classes.")
+parser.add_argument("--parallel-execution", type=int, default=0, metavar="WORKERS", help="Run independent branches of a workflow concurrently on this many threads. Only one GPU node runs at a time, CPU and IO nodes (see RESOURCE_TYPE) overlap with it. 0 executes one node at a time.")
+parser.add_argument("--pipeline-prompts", action="store_true", help="Overlap consecutive queued prompts: load the inputs of the next prompt while the current one runs and write output images in the background while the next prompt starts.")
+parser.add_argument("--batch-prompts", type=int, default=0, metavar="MAX_BATCH", help="Sample up to MAX_BATCH queued prompts that share the model and sampler settings of a single KSampler in one batch. Each prompt keeps its own conditioning, seed and outputs. 0 disables batching.")
+parser.add_argument("--batch-window", type=float, default=0, metavar="MS", help="How long --batch-prompts waits for more compatible prompts to be queued before sampling a batch.")
+parser.add_argument("--history-db", type=str, default=None, metavar="PATH", help="SQLite file the prompt history is kept in, so that it survives restarts. Defaults to history.sqlite3 in the user directory, use :memory: to keep the history in memory only.")
+parser.add_argument("--history-max-items", type=int, default=10000, help="Maximum number of prompts kept in the history.")
+parser.add_argument("--history-max-age", type=float, default=None, metavar="DAYS", help="Remove prompts from the history once they finished more than DAYS ago.")
+parser.add_argument("--watch-model-folders", action="store_true", help="Keep the file lists of model folders in memory, updated through inotify where available and by polling directory mtimes in the background, instead of checking every folder each time a list is requested.")
+parser.add_argument("--folder-poll-interval", type=float, default=5.0, metavar="SECONDS", help="How often --watch-model-folders checks indexed folders for changes inotify doesn't report, such as on network filesystems.")
+parser.add_argument("--folder-scan-workers", type=int, default=8, help="Number of threads listing the subdirectories of model folders in parallel. 1 lists them one at a time.")
+parser.add_argument("--folder-snapshot-dir", type=str, default=None, metavar="PATH", help="Save the listings of model folders to this directory. On the next start only the directories that changed since are listed again.")
+
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
 attn_group.add_argument("--use-quad-cross-attention", action="store_true", help="Use the sub-quadratic cross attention optimization . Ignored when xformers is used.")
@@ -132,6 +154,7 @@ parser.add_argument("--reserve-vram", type=float, default=None, help="Set the am
 parser.add_argument("--async-offload", action="store_true", help="Use async weight offloading.")
 
 parser.add_argument("--default-hashing-function", type=str, choices=['md5', 'sha1', 'sha256', 'sha512'], default='sha256', help="Allows you to choose the hash function to use for duplicate filename / contents comparison. Default is sha256.")
+parser.add_argument("--file-hash-workers", type=int, default=2, help="Threads used to hash uploaded and loaded input files in the background. 0 hashes files only when a node needs the hash.")
 
 parser.add_argument("--disable-smart-memory", action="store_true", help="Force ComfyUI to agressively offload to regular ram instead of keeping models in vram when it can.")
 parser.add_argument("--deterministic", action="store_true", help="Make pytorch use slower deterministic algorithms when it can. Note that this might not make images deterministic in all cases.")
@@ -152,6 +175,7 @@ parser.add_argument("--windows-standalone-build", action="store_true", help="Win
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
 parser.add_argument("--disable-all-custom-nodes", action="store_true", help="Disable loading all custom nodes.")
 parser.add_argument("--disable-api-nodes", action="store_true", help="Disable loading all api nodes.")
+parser.add_argument("--lazy-node-imports", action="store_true", help="Register the built-in extra and api nodes from a manifest saved in the user directory and only import a node's module when the node is first used. The manifest is updated when the modules change. Custom nodes are still imported at startup, and the extra nodes' modules are imported by the first /object_info request.")
 
 parser.add_argument("--multi-user", action="store_true", help="Enables per-user storage.")
 
@@ -195,6 +219,9 @@ parser.add_argument(
 parser.add_argument("--user-directory", type=is_valid_directory, default=None, help="Set the ComfyUI user directory with an absolute path. Overrides --base-directory.")
 
 parser.add_argument("--enable-compress-response-body", action="store_true", help="Enable compressing response body.")
+parser.add_argument("--enable-prompt-webhooks", action="store_true", help="Allow prompts to set a webhook URL in extra_data that the server POSTs the outputs to when the prompt finishes.")
+parser.add_argument("--websocket-queue-size", type=int, default=256, help="Maximum number of messages waiting to be sent to one websocket client. Older progress, status and preview messages are dropped first, a client that still falls behind is disconnected.")
+parser.add_argument("--websocket-send-timeout", type=float, default=10.0, metavar="SECONDS", help="Disconnect websocket clients that don't accept a message for this long.")
 
 parser.add_argument(
     "--comfy-api-base",
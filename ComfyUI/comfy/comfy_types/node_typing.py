@@ -236,6 +236,15 @@ class ComfyNodeABC(ABC):
     """Flags a node as deprecated, indicating to users that they should find alternatives to this node."""
     API_NODE: Optional[bool]
     """Flags a node as an API node. See: https://docs.comfy.org/tutorials/api-nodes/overview."""
+    RESOURCE_TYPE: Literal["cpu", "gpu", "io"]
+    """The main resource this node uses, consulted when ``--parallel-execution`` runs independent branches concurrently.
+
+    Only one ``"gpu"`` node runs at a time, while ``"cpu"`` and ``"io"`` nodes (image loading, mask ops, file writes, HTTP calls)
+    may overlap with it and with each other.  Nodes without this attribute are treated as ``"gpu"``, except API nodes which
+    default to ``"io"``.  Usage::
+
+        RESOURCE_TYPE = "io"
+    """
 
     @classmethod
     @abstractmethod
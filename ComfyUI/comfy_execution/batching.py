@@ -0,0 +1,134 @@
+import logging
+import time
+
+import nodes
+from comfy_execution.graph_utils import is_link
+
+# Samplers that don't draw new noise while sampling. With these, every prompt in a batch gets exactly
+# the result it would have had on its own, since its initial noise is generated from its own seed.
+BATCHABLE_SAMPLERS = {
+    "euler", "euler_cfg_pp", "heun", "heunpp2", "dpm_2", "lms", "dpmpp_2m", "dpmpp_2m_cfg_pp",
+    "ipndm", "ipndm_v", "deis", "gradient_estimation", "gradient_estimation_cfg_pp", "uni_pc", "uni_pc_bh2",
+}
+
+SHARED_SAMPLER_INPUTS = ("steps", "cfg", "sampler_name", "scheduler", "denoise")
+
+def find_sampler(prompt):
+    samplers = [node_id for node_id, node in prompt.items() if node.get("class_type") == "KSampler"]
+    if len(samplers) != 1:
+        return None
+    return samplers[0]
+
+def _subgraph_signature(prompt, value):
+    if not is_link(value):
+        return value
+    node = prompt[value[0]]
+    return ("LINK", value[1], node["class_type"], tuple(sorted((k, _subgraph_signature(prompt, v)) for k, v in node["inputs"].items())))
+
+def batch_key(prompt):
+    """
+    Prompts with equal keys can share one sampler call: they have a single KSampler, which loads the same
+    model with the same sampling settings. Their conditioning, seed and latent may differ. Returns None for
+    prompts that can't be batched.
+    """
+    if "BatchedKSampler" not in nodes.NODE_CLASS_MAPPINGS:
+        return None
+    sampler_id = find_sampler(prompt)
+    if sampler_id is None:
+        return None
+    inputs = prompt[sampler_id]["inputs"]
+    if inputs.get("sampler_name") not in BATCHABLE_SAMPLERS:
+        return None
+    if not all(is_link(inputs.get(name)) for name in ("model", "positive", "negative", "latent_image")):
+        return None
+    # The seeds are passed to the batched sampler as a list of values
+    if is_link(inputs.get("seed")):
+        return None
+    try:
+        key = (_subgraph_signature(prompt, inputs["model"]),) + tuple(inputs.get(name) for name in SHARED_SAMPLER_INPUTS)
+        hash(key)
+    except (KeyError, TypeError, RecursionError):
+        return None
+    return key
+
+def fuse_prompts(prompts):
+    """
+    Builds one prompt that computes the inputs of every prompt's KSampler and samples them together with a
+    BatchedKSampler. The nodes of prompt i are renamed "i.<node id>"; identical nodes only run once because
+    the output cache is keyed by their inputs. Returns the fused prompt and the id of the batched sampler.
+    """
+    fused = {}
+    sampler_inputs = {}
+    seeds = []
+    for index, prompt in enumerate(prompts):
+        prefix = "{}.".format(index)
+        sampler_id = find_sampler(prompt)
+        inputs = prompt[sampler_id]["inputs"]
+
+        pending = [v[0] for v in inputs.values() if is_link(v)]
+        while len(pending) > 0:
+            node_id = pending.pop()
+            if prefix + node_id in fused:
+                continue
+            node = prompt[node_id]
+            node_inputs = {}
+            for name, value in node["inputs"].items():
+                if is_link(value):
+                    pending.append(value[0])
+                    value = [prefix + value[0], value[1]]
+                node_inputs[name] = value
+            fused[prefix + node_id] = {"class_type": node["class_type"], "inputs": node_inputs}
+
+        if index == 0:
+            sampler_inputs["model"] = [prefix + inputs["model"][0], inputs["model"][1]]
+            for name in SHARED_SAMPLER_INPUTS:
+                if name in inputs:
+                    sampler_inputs[name] = inputs[name]
+        for name in ("positive", "negative", "latent_image"):
+            sampler_inputs["{}_{}".format(name, index)] = [prefix + inputs[name][0], inputs[name][1]]
+        seeds.append(inputs["seed"])
+
+    sampler_inputs["seeds"] = seeds
+    fused["batch"] = {"class_type": "BatchedKSampler", "inputs": sampler_inputs}
+    return fused, "batch"
+
+
+class PromptBatcher:
+    """
+    Takes queued prompts that are compatible with the one about to run out of the queue (up to max_size
+    in total, waiting at most window seconds for more to arrive) and samples them in one batch. The prompts
+    then run one by one as usual, with the output of their KSampler already in the cache.
+    """
+    def __init__(self, max_size, window=0.0):
+        self.max_size = max_size
+        self.window = window
+
+    def collect(self, q, queue_item):
+        item, _ = queue_item
+        key = batch_key(item[2])
+        if key is None:
+            return [queue_item]
+        return [queue_item] + q.get_matching(lambda other: batch_key(other[2]) == key, self.max_size - 1, timeout=self.window)
+
+    def sample(self, executor, items):
+        """
+        Returns the KSampler output of each prompt by prompt id, {} if the batch failed and the prompts should
+        run on their own, or None if it was interrupted.
+        """
+        start = time.perf_counter()
+        fused, sampler_id = fuse_prompts([item[2] for item in items])
+        # The fused prompt has no client, without this its progress and previews would go to everyone
+        executor.server.progress_enabled = False
+        try:
+            executor.execute(fused, items[0][1], {}, [sampler_id])
+        finally:
+            executor.server.progress_enabled = True
+        if not executor.success:
+            if any(event == "execution_interrupted" for event, _ in executor.status_messages):
+                return None
+            logging.warning("Sampling {} prompts as one batch failed, running them separately".format(len(items)))
+            return {}
+
+        latents = executor.caches.outputs.get(sampler_id)[0][0]
+        logging.info("Sampled {} prompts in one batch in {:.2f} seconds".format(len(items), time.perf_counter() - start))
+        return {item[1]: {find_sampler(item[2]): [[latent]]} for item, latent in zip(items, latents)}
@@ -1,7 +1,16 @@
+import hashlib
 import itertools
+import logging
+import weakref
 from typing import Sequence, Mapping, Dict
 from comfy_execution.graph import DynamicPrompt
 
+import numpy as np
+import torch
+
+import comfy.model_management
+import comfy.model_patcher
+from comfy.cli_args import args
 import nodes
 
 from comfy_execution.graph_utils import is_link
@@ -43,6 +52,65 @@ class Unhashable:
     def __init__(self):
         self.value = float("NaN")
 
+# Tensors larger than this are fingerprinted from evenly spaced samples unless --exact-tensor-hash is set
+TENSOR_HASH_SAMPLE_BYTES = 16 * 1024 * 1024
+TENSOR_HASH_SAMPLES = 65536
+
+# id(tensor) -> (weakref, tensor._version, {exact: fingerprint})
+_tensor_fingerprints = {}
+
+def _content_digest(flat, exact):
+    nbytes = flat.numel() * flat.element_size()
+    if not exact and nbytes > TENSOR_HASH_SAMPLE_BYTES:
+        index = torch.linspace(0, flat.numel() - 1, TENSOR_HASH_SAMPLES, device=flat.device).long()
+        flat = flat[index]
+    data = flat.detach().to("cpu").contiguous().view(torch.uint8).numpy()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def tensor_fingerprint(tensor, exact=None):
+    """
+    Hashable stand-in for a tensor: its shape, dtype and a digest of its
+    contents. Large tensors are hashed from evenly strided samples unless
+    exact (or --exact-tensor-hash) is set. Results are memoized per tensor
+    object and kind of digest, and recomputed if the tensor is modified in
+    place.
+    """
+    if exact is None:
+        exact = bool(args.exact_tensor_hash)
+    key = id(tensor)
+    memo = _tensor_fingerprints.get(key)
+    if memo is not None and memo[0]() is tensor and memo[1] == tensor._version:
+        if exact in memo[2]:
+            return memo[2][exact]
+    else:
+        memo = None
+
+    if tensor.device.type == "meta" or tensor.layout != torch.strided:
+        return Unhashable()
+    flat = tensor.reshape(-1)
+    fingerprint = ("TENSOR", tuple(tensor.shape), str(tensor.dtype), _content_digest(flat, exact))
+    # Tensors that aren't sampled have the same digest either way
+    modes = (exact,) if flat.numel() * flat.element_size() > TENSOR_HASH_SAMPLE_BYTES else (False, True)
+    if memo is not None:
+        memo[2].update((mode, fingerprint) for mode in modes)
+        return fingerprint
+    try:
+        ref = weakref.ref(tensor, lambda _, key=key: _tensor_fingerprints.pop(key, None))
+        _tensor_fingerprints[key] = (ref, tensor._version, {mode: fingerprint for mode in modes})
+    except TypeError:
+        pass
+    return fingerprint
+
+def ndarray_fingerprint(array, exact=None):
+    if exact is None:
+        exact = args.exact_tensor_hash
+    if array.dtype.hasobject:
+        return Unhashable()
+    flat = np.ascontiguousarray(array).reshape(-1)
+    if not exact and flat.nbytes > TENSOR_HASH_SAMPLE_BYTES:
+        flat = np.ascontiguousarray(flat[np.linspace(0, flat.size - 1, TENSOR_HASH_SAMPLES).astype(np.int64)])
+    return ("NDARRAY", tuple(array.shape), array.dtype.str, hashlib.blake2b(flat.view(np.uint8), digest_size=16).hexdigest())
+
 def to_hashable(obj):
     # So that we don't infinitely recurse since frozenset and tuples
     # are Sequences.
@@ -52,8 +120,18 @@ def to_hashable(obj):
         return frozenset([(to_hashable(k), to_hashable(v)) for k, v in sorted(obj.items())])
     elif isinstance(obj, Sequence):
         return frozenset(zip(itertools.count(), [to_hashable(i) for i in obj]))
+    elif isinstance(obj, torch.Tensor):
+        return tensor_fingerprint(obj)
+    elif isinstance(obj, np.ndarray):
+        return ndarray_fingerprint(obj)
+    elif hasattr(type(obj), "__comfy_hash__"):
+        # Objects can describe their cache identity with primitives, mappings, sequences or tensors
+        try:
+            return ("COMFY_HASH", type(obj).__module__, type(obj).__qualname__, to_hashable(obj.__comfy_hash__()))
+        except Exception as e:
+            logging.warning("__comfy_hash__ failed for {}: {}".format(type(obj).__qualname__, e))
+            return Unhashable()
     else:
-        # TODO - Support other objects like tensors?
         return Unhashable()
 
 class CacheKeySetID(CacheKeySet):
@@ -201,6 +279,11 @@ class BasicCache:
         else:
             return None
 
+    def get_cache_key(self, node_id):
+        if not self.initialized:
+            return None
+        return self.cache_key_set.get_data_key(node_id)
+
     def _ensure_subcache(self, node_id, children_ids):
         subcache_key = self.cache_key_set.get_subcache_key(node_id)
         subcache = self.subcaches.get(subcache_key, None)
@@ -259,6 +342,12 @@ class HierarchicalCache(BasicCache):
         assert cache is not None
         cache._set_immediate(node_id, value)
 
+    def get_cache_key(self, node_id):
+        cache = self._get_cache_for(node_id)
+        if cache is None:
+            return None
+        return cache.cache_key_set.get_data_key(node_id)
+
     def ensure_subcache_for(self, node_id, children_ids):
         cache = self._get_cache_for(node_id)
         assert cache is not None
@@ -317,6 +406,133 @@ class LRUCache(BasicCache):
         return self
 
 
+def collect_output_storages(obj, storages=None, seen=None):
+    """
+    Find the memory kept alive by a cached value.
+
+    Returns a dict mapping a storage identity to (bytes, kind) where kind is the
+    tensor device type ("cpu", "cuda", ...) or "model" for model weights. Tensors
+    are keyed by their underlying storage so views and shared tensors are only
+    counted once, and models by the module they patch so clones of a
+    ModelPatcher share the cost of the weights.
+    """
+    if storages is None:
+        storages = {}
+        seen = set()
+    if isinstance(obj, (int, float, str, bool, bytes, type(None))) or id(obj) in seen:
+        return storages
+    seen.add(id(obj))
+
+    if isinstance(obj, torch.Tensor):
+        if obj.device.type != "meta":
+            storage = obj.untyped_storage()
+            storages[("tensor", obj.device.type, obj.device.index, storage.data_ptr())] = (storage.nbytes(), obj.device.type)
+    elif isinstance(obj, np.ndarray):
+        base = obj if obj.base is None else obj.base
+        storages[("ndarray", id(base))] = (getattr(base, "nbytes", obj.nbytes), "cpu")
+    elif isinstance(obj, comfy.model_patcher.ModelPatcher):
+        storages[("model", id(obj.model))] = (obj.model_size(), "model")
+        collect_output_storages(obj.patches, storages, seen)
+    elif isinstance(obj, torch.nn.Module):
+        storages[("model", id(obj))] = (comfy.model_management.module_size(obj), "model")
+    elif isinstance(obj, Mapping):
+        for value in obj.values():
+            collect_output_storages(value, storages, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for value in obj:
+            collect_output_storages(value, storages, seen)
+    elif isinstance(getattr(obj, "patcher", None), comfy.model_patcher.ModelPatcher):
+        # CLIP, VAE and similar wrappers
+        collect_output_storages(obj.patcher, storages, seen)
+    return storages
+
+class MemoryBudgetCache(LRUCache):
+    """
+    LRU cache bounded by the memory held by cached outputs instead of by entry
+    count. Each entry is measured when it is set (see collect_output_storages)
+    and entries from older prompts are evicted once the total exceeds
+    max_bytes: least recently used generation first, and within a generation
+    the entries that free the most memory first. Entries used by the current
+    prompt are never evicted, so a single prompt may exceed the budget.
+    """
+    def __init__(self, key_class, max_bytes):
+        super().__init__(key_class, max_size=0)
+        self.max_bytes = max_bytes
+        self.entry_storages = {}
+        self.storage_refs = {}
+        self.total_bytes = 0
+        self.evicted = 0
+
+    def _add_storages(self, cache_key, storages):
+        self.entry_storages[cache_key] = storages
+        for storage_id, (size, kind) in storages.items():
+            ref = self.storage_refs.get(storage_id)
+            if ref is None:
+                self.storage_refs[storage_id] = [1, size, kind]
+                self.total_bytes += size
+            else:
+                ref[0] += 1
+
+    def _release_storages(self, cache_key):
+        for storage_id in self.entry_storages.pop(cache_key, {}):
+            ref = self.storage_refs[storage_id]
+            ref[0] -= 1
+            if ref[0] == 0:
+                self.total_bytes -= ref[1]
+                del self.storage_refs[storage_id]
+
+    def _exclusive_bytes(self, cache_key):
+        return sum(size for storage_id, (size, _) in self.entry_storages.get(cache_key, {}).items()
+                   if self.storage_refs[storage_id][0] == 1)
+
+    def _remove(self, cache_key):
+        self._release_storages(cache_key)
+        del self.cache[cache_key]
+        self.used_generation.pop(cache_key, None)
+        self.children.pop(cache_key, None)
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        candidates = [key for key in self.cache if self.used_generation.get(key, 0) < self.generation]
+        candidates.sort(key=lambda key: (self.used_generation.get(key, 0), -self._exclusive_bytes(key)))
+        for key in candidates:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+            self.evicted += 1
+        if self.total_bytes > self.max_bytes:
+            logging.debug("Node output cache holds {} bytes, over its budget of {} bytes, for the current prompt".format(self.total_bytes, self.max_bytes))
+
+    def clean_unused(self):
+        self._evict()
+        self._clean_subcaches()
+
+    def set(self, node_id, value):
+        self._mark_used(node_id)
+        cache_key = self.cache_key_set.get_data_key(node_id)
+        self._release_storages(cache_key)
+        self._set_immediate(node_id, value)
+        self._add_storages(cache_key, collect_output_storages(value))
+        self._evict()
+
+    def get_memory_usage(self):
+        usage = {}
+        for _, size, kind in self.storage_refs.values():
+            usage[kind] = usage.get(kind, 0) + size
+        return usage
+
+    def recursive_debug_dump(self):
+        result = super().recursive_debug_dump()
+        result.append({
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "usage": self.get_memory_usage(),
+            "evicted": self.evicted,
+        })
+        return result
+
+
 class DependencyAwareCache(BasicCache):
     """
     A cache implementation that tracks dependencies between nodes and manages
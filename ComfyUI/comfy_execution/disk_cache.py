@@ -0,0 +1,295 @@
+import os
+import json
+import math
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+import nodes
+
+FORMAT_VERSION = "1"
+FILE_SUFFIX = ".safetensors"
+
+
+class NotPersistable(Exception):
+    pass
+
+
+def _encode_signature(obj, out):
+    # bool must come before int since bool is a subclass of int
+    if obj is None:
+        out.append(b"N")
+    elif isinstance(obj, bool):
+        out.append(b"B1" if obj else b"B0")
+    elif isinstance(obj, int):
+        out.append(b"I%d;" % obj)
+    elif isinstance(obj, float):
+        if math.isnan(obj):
+            raise NotPersistable()
+        out.append(b"F" + repr(obj).encode() + b";")
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        out.append(b"S%d:" % len(data) + data)
+    elif isinstance(obj, frozenset):
+        parts = []
+        for item in obj:
+            item_out = []
+            _encode_signature(item, item_out)
+            parts.append(b"".join(item_out))
+        out.append(b"{" + b",".join(sorted(parts)) + b"}")
+    elif isinstance(obj, (tuple, list)):
+        out.append(b"(")
+        for item in obj:
+            _encode_signature(item, out)
+            out.append(b",")
+        out.append(b")")
+    else:
+        raise NotPersistable()
+
+
+def signature_digest(signature) -> Optional[str]:
+    """
+    Stable digest of a CacheKeySetInputSignature key, or None if the key
+    contains something that is not the same across restarts (NaN from a node
+    that always changes, Unhashable inputs, ...).
+    """
+    out = [FORMAT_VERSION.encode()]
+    try:
+        _encode_signature(signature, out)
+    except NotPersistable:
+        return None
+    return hashlib.sha256(b"".join(out)).hexdigest()
+
+
+def _flatten_output(value, tensors, storages):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return {"v": value}
+    if isinstance(value, torch.Tensor):
+        if value.layout != torch.strided or value.device.type == "meta":
+            raise NotPersistable()
+        tensor = value.detach().to("cpu").contiguous()
+        storage = tensor.untyped_storage()
+        # safetensors refuses tensors that share memory, and would write the whole storage of a view
+        if storage.data_ptr() in storages or storage.nbytes() != tensor.numel() * tensor.element_size():
+            tensor = tensor.clone()
+        storages.add(tensor.untyped_storage().data_ptr())
+        name = str(len(tensors))
+        tensors[name] = tensor
+        return {"t": name}
+    if isinstance(value, list):
+        return {"l": [_flatten_output(item, tensors, storages) for item in value]}
+    if isinstance(value, tuple):
+        return {"u": [_flatten_output(item, tensors, storages) for item in value]}
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {"d": {key: _flatten_output(item, tensors, storages) for key, item in value.items()}}
+    raise NotPersistable()
+
+
+def _unflatten_output(structure, reader):
+    if "v" in structure:
+        return structure["v"]
+    if "t" in structure:
+        return reader.get_tensor(structure["t"])
+    if "l" in structure:
+        return [_unflatten_output(item, reader) for item in structure["l"]]
+    if "u" in structure:
+        return tuple(_unflatten_output(item, reader) for item in structure["u"])
+    return {key: _unflatten_output(item, reader) for key, item in structure["d"].items()}
+
+
+class DiskCache:
+    """
+    Size-capped LRU store of node outputs on disk, keyed by the digest of the
+    node's input signature. Outputs made only of tensors, primitives, lists,
+    tuples and string-keyed dicts are written as safetensors files; anything
+    else (MODEL, CLIP, VAE, ...) is skipped. Tensors are read back through a
+    memory map and always come back on the CPU.
+
+    Node classes can opt out with DISK_CACHE = False. include_classes, when
+    given, restricts the cache to those classes; exclude_classes always wins.
+    Output nodes and NOT_IDEMPOTENT nodes are never cached.
+    """
+    def __init__(self, directory, max_bytes, include_classes=None, exclude_classes=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.include_classes = set(include_classes) if include_classes else None
+        self.exclude_classes = set(exclude_classes or [])
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.skipped = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        found = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    os.remove(entry.path)
+                elif entry.name.endswith(FILE_SUFFIX):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(FILE_SUFFIX)], stat.st_size))
+        for _, digest, size in sorted(found):
+            self.entries[digest] = size
+            self.total_bytes += size
+        logging.info("Disk node cache: {} entries, {:.1f} MB in {}".format(len(self.entries), self.total_bytes / (1024 * 1024), self.directory))
+        self._evict()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest + FILE_SUFFIX)
+
+    def is_cacheable(self, class_type):
+        if class_type in self.exclude_classes:
+            return False
+        if self.include_classes is not None and class_type not in self.include_classes:
+            return False
+        class_def = nodes.NODE_CLASS_MAPPINGS.get(class_type)
+        if class_def is None:
+            return False
+        if getattr(class_def, "OUTPUT_NODE", False) or getattr(class_def, "NOT_IDEMPOTENT", False):
+            return False
+        return getattr(class_def, "DISK_CACHE", True)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self.entries:
+            digest, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+    def get(self, digest):
+        with self.lock:
+            if digest not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(digest)
+        path = self._path(digest)
+        try:
+            with safe_open(path, framework="pt", device="cpu") as reader:
+                value = _unflatten_output(json.loads(reader.metadata()["structure"]), reader)
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Disk node cache: dropping unreadable entry {}: {}".format(path, e))
+            with self.lock:
+                size = self.entries.pop(digest, None)
+                if size is not None:
+                    self.total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        with self.lock:
+            self.hits += 1
+        return value
+
+    def set(self, digest, class_type, value):
+        with self.lock:
+            if digest in self.entries:
+                return
+        tensors = {}
+        try:
+            structure = _flatten_output(value, tensors, set())
+        except NotPersistable:
+            with self.lock:
+                self.skipped += 1
+            return
+
+        path = self._path(digest)
+        tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+        metadata = {"format": FORMAT_VERSION, "class_type": class_type, "structure": json.dumps(structure)}
+        try:
+            save_file(tensors, tmp_path, metadata=metadata)
+            size = os.path.getsize(tmp_path)
+            if size > self.max_bytes:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Disk node cache: failed to write {} output: {}".format(class_type, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self.lock:
+            self.entries[digest] = size
+            self.total_bytes += size
+            self.writes += 1
+            self._evict()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "skipped": self.skipped,
+            }
+
+
+class DiskTieredCache:
+    """
+    Wraps an in-memory output cache with a DiskCache. Memory misses are looked
+    up on disk and promoted into the wrapped cache; every output stored in the
+    wrapped cache is also written to disk if its node class is cacheable.
+    """
+    def __init__(self, cache, disk_cache):
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.digests = {}
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def set_prompt(self, dynprompt, node_ids, is_changed_cache):
+        self.digests = {}
+        self.cache.set_prompt(dynprompt, node_ids, is_changed_cache)
+
+    def _digest(self, node_id):
+        if node_id in self.digests:
+            return self.digests[node_id]
+        digest = None
+        class_type = self.cache.dynprompt.get_node(node_id)["class_type"]
+        if self.disk_cache.is_cacheable(class_type):
+            cache_key = self.cache.get_cache_key(node_id)
+            if cache_key is not None:
+                digest = signature_digest(cache_key)
+        self.digests[node_id] = digest
+        return digest
+
+    def get(self, node_id):
+        value = self.cache.get(node_id)
+        if value is not None:
+            return value
+        digest = self._digest(node_id)
+        if digest is None:
+            return None
+        value = self.disk_cache.get(digest)
+        if value is not None:
+            self.cache.set(node_id, value)
+        return value
+
+    def set(self, node_id, value):
+        self.cache.set(node_id, value)
+        digest = self._digest(node_id)
+        if digest is not None:
+            self.disk_cache.set(digest, self.cache.dynprompt.get_node(node_id)["class_type"], value)
+
+    def ensure_subcache_for(self, node_id, children_ids):
+        return self.cache.ensure_subcache_for(node_id, children_ids)
@@ -187,28 +187,31 @@ class ExecutionList(TopologicalSort):
             return None, None, None
         available = self.get_ready_nodes()
         if len(available) == 0:
-            cycled_nodes = self.get_nodes_in_cycle()
-            # Because cycles composed entirely of static nodes are caught during initial validation,
-            # we will 'blame' the first node in the cycle that is not a static node.
-            blamed_node = cycled_nodes[0]
-            for node_id in cycled_nodes:
-                display_node_id = self.dynprompt.get_display_node_id(node_id)
-                if display_node_id != node_id:
-                    blamed_node = display_node_id
-                    break
-            ex = DependencyCycleError("Dependency cycle detected")
-            error_details = {
-                "node_id": blamed_node,
-                "exception_message": str(ex),
-                "exception_type": "graph.DependencyCycleError",
-                "traceback": [],
-                "current_inputs": []
-            }
-            return None, error_details, ex
+            return None, *self.get_cycle_error()
 
         self.staged_node_id = self.ux_friendly_pick_node(available)
         return self.staged_node_id, None, None
 
+    def get_cycle_error(self):
+        cycled_nodes = self.get_nodes_in_cycle()
+        # Because cycles composed entirely of static nodes are caught during initial validation,
+        # we will 'blame' the first node in the cycle that is not a static node.
+        blamed_node = cycled_nodes[0]
+        for node_id in cycled_nodes:
+            display_node_id = self.dynprompt.get_display_node_id(node_id)
+            if display_node_id != node_id:
+                blamed_node = display_node_id
+                break
+        ex = DependencyCycleError("Dependency cycle detected")
+        error_details = {
+            "node_id": blamed_node,
+            "exception_message": str(ex),
+            "exception_type": "graph.DependencyCycleError",
+            "traceback": [],
+            "current_inputs": []
+        }
+        return error_details, ex
+
     def ux_friendly_pick_node(self, node_list):
         # If an output node is available, do that first.
         # Technically this has no effect on the overall length of execution, but it feels better as a user
@@ -269,6 +272,40 @@ class ExecutionList(TopologicalSort):
             to_remove = [node_id for node_id in blocked_by if len(blocked_by[node_id]) == 0]
         return list(blocked_by.keys())
 
+class ConcurrentExecutionList(ExecutionList):
+    """
+    ExecutionList that allows several nodes to be staged at once so that independent branches of the graph
+    can run concurrently. Staged nodes are identified explicitly instead of through staged_node_id.
+    """
+    def __init__(self, dynprompt, output_cache):
+        super().__init__(dynprompt, output_cache)
+        self.staged_node_ids = set()
+
+    def stage_node_execution(self, can_run=None):
+        """
+        Stages one ready node that isn't already staged and passes can_run (if given). Returns (None, None, None)
+        when nothing can be started right now, which is only an error if nothing is running either.
+        """
+        if self.is_empty():
+            return None, None, None
+        ready = [node_id for node_id in self.get_ready_nodes() if node_id not in self.staged_node_ids]
+        if len(ready) == 0 and len(self.staged_node_ids) == 0:
+            return None, *self.get_cycle_error()
+        if can_run is not None:
+            ready = [node_id for node_id in ready if can_run(node_id)]
+        if len(ready) == 0:
+            return None, None, None
+        node_id = self.ux_friendly_pick_node(ready)
+        self.staged_node_ids.add(node_id)
+        return node_id, None, None
+
+    def unstage_node_execution(self, node_id):
+        self.staged_node_ids.remove(node_id)
+
+    def complete_node_execution(self, node_id):
+        self.staged_node_ids.remove(node_id)
+        self.pop_node(node_id)
+
 class ExecutionBlocker:
     """
     Return this from a node and any users will be blocked with the given error message.
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections.abc import ItemsView, KeysView, ValuesView
+from typing import Callable, Optional
+
+MANIFEST_VERSION = 2
+
+
+class LazyModule:
+    """A node module that is known from the manifest and hasn't been imported yet."""
+    def __init__(self, path: str, nodes: dict, load: Callable[[], bool]):
+        self.path = path
+        # class name -> node info, None for nodes whose info has to be computed by the imported class
+        self.nodes = nodes
+        self.load = load
+        self.loaded = False
+
+
+class NodeClassMappings(dict):
+    """
+    NODE_CLASS_MAPPINGS. Nodes of lazy modules are listed like any other node, their module is imported the first
+    time one of them is looked up. Iterating over values() or items() imports every module.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy: dict[str, LazyModule] = {}
+        self.lock = threading.RLock()
+
+    def add_lazy(self, module: LazyModule):
+        with self.lock:
+            for name in module.nodes:
+                dict.pop(self, name, None)
+                self.lazy[name] = module
+
+    def load_module(self, module: LazyModule):
+        with self.lock:
+            if module.loaded:
+                return
+            try:
+                logging.debug("Importing {} for node {}".format(module.path, next(iter(module.nodes), None)))
+                module.load()
+            finally:
+                module.loaded = True
+                for name in module.nodes:
+                    if self.lazy.get(name) is module:
+                        del self.lazy[name]
+
+    def static_info(self, name: str) -> Optional[dict]:
+        """The recorded node info of a node that hasn't been imported, None if there is none."""
+        module = self.lazy.get(name)
+        if module is None:
+            return None
+        return module.nodes.get(name)
+
+    def version(self):
+        """Changes whenever a node is registered, replaced, imported or removed."""
+        with self.lock:
+            return hash((tuple((name, id(node_class)) for name, node_class in dict.items(self)), tuple(self.lazy)))
+
+    def __missing__(self, name):
+        module = self.lazy.get(name)
+        if module is None:
+            raise KeyError(name)
+        self.load_module(module)
+        return dict.__getitem__(self, name)
+
+    def __setitem__(self, name, node_class):
+        dict.__setitem__(self, name, node_class)
+        self.lazy.pop(name, None)
+
+    def __delitem__(self, name):
+        if self.lazy.pop(name, None) is None:
+            dict.__delitem__(self, name)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.lazy
+
+    def __iter__(self):
+        return iter(list(dict.keys(self)) + list(self.lazy))
+
+    def __len__(self):
+        return dict.__len__(self) + len(self.lazy)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def update(self, *args, **kwargs):
+        for name, node_class in dict(*args, **kwargs).items():
+            self[name] = node_class
+
+    def keys(self):
+        return KeysView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def copy(self):
+        return {name: self[name] for name in self}
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def source_fingerprint(directories, exclude=(), extra=()):
+    """A hash of the size and mtime of every .py file in directories, except the files in exclude."""
+    exclude = set(os.path.abspath(p) for p in exclude)
+    digest = hashlib.sha256(json.dumps(list(extra)).encode("utf-8"))
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(files):
+                path = os.path.abspath(os.path.join(root, name))
+                if name.endswith(".py") and path not in exclude:
+                    digest.update("{}:{}\n".format(path, file_fingerprint(path)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def directory_fingerprint(directories):
+    """The names and mtimes of the entries directly in directories, changes when one is added, removed or replaced."""
+    entries = []
+    for directory in directories:
+        try:
+            with os.scandir(directory) as it:
+                entries += sorted([os.path.join(directory, e.name), e.stat().st_mtime_ns] for e in it)
+        except OSError:
+            entries.append([directory, None])
+    return entries
+
+
+class NodeManifest:
+    """
+    The class names and node info of the nodes of each module, saved as JSON. An entry is only used while both the
+    module file and the shared source it was recorded with are unchanged.
+    """
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.modules = {}
+        self.changed = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION and data.get("source") == source:
+                self.modules = data["modules"]
+            else:
+                logging.info("Node manifest is out of date, node modules will be imported to update it.")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning("Could not read node manifest {}: {}".format(path, e))
+
+    def get(self, key, fingerprint) -> Optional[dict]:
+        entry = self.modules.get(key)
+        if entry is None or entry["fingerprint"] != fingerprint:
+            return None
+        return entry
+
+    def set(self, key, fingerprint, nodes: dict, display_names: dict):
+        self.modules[key] = {"fingerprint": fingerprint, "nodes": nodes, "display_names": display_names}
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "source": self.source, "modules": self.modules}, f)
+            os.replace(temp_path, self.path)
+            self.changed = False
+        except OSError as e:
+            logging.warning("Could not save node manifest {}: {}".format(self.path, e))
+
+
+def record_node_info(get_info: Callable[[str], dict], name: str) -> Optional[dict]:
+    """
+    The node info of a node as it can be kept in the manifest, None if it can't be computed or stored as JSON.
+    The node's module is imported when its info is needed then.
+    """
+    try:
+        return json.loads(json.dumps(get_info(name)))
+    except Exception:
+        return None
@@ -9,7 +9,6 @@ import os
 import io
 import json
 import random
-import hashlib
 import node_helpers
 from comfy.cli_args import args
 from comfy.comfy_types import FileLocator
@@ -310,10 +309,7 @@ class LoadAudio:
     @classmethod
     def IS_CHANGED(s, audio):
         image_path = folder_paths.get_annotated_filepath(audio)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return node_helpers.file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, audio):
@@ -109,6 +109,7 @@ class MaskToImage:
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "mask_to_image"
+    RESOURCE_TYPE = "cpu"
 
     def mask_to_image(self, mask):
         result = mask.reshape((-1, 1, mask.shape[-2], mask.shape[-1])).movedim(1, -1).expand(-1, -1, -1, 3)
@@ -128,6 +129,7 @@ class ImageToMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
+    RESOURCE_TYPE = "cpu"
 
     def image_to_mask(self, image, channel):
         channels = ["red", "green", "blue", "alpha"]
@@ -148,6 +150,7 @@ class ImageColorToMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
+    RESOURCE_TYPE = "cpu"
 
     def image_to_mask(self, image, color):
         temp = (torch.clamp(image, 0, 1.0) * 255.0).round().to(torch.int)
@@ -171,6 +174,7 @@ class SolidMask:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "solid"
+    RESOURCE_TYPE = "cpu"
 
     def solid(self, value, width, height):
         out = torch.full((1, height, width), value, dtype=torch.float32, device="cpu")
@@ -190,6 +194,7 @@ class InvertMask:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "invert"
+    RESOURCE_TYPE = "cpu"
 
     def invert(self, mask):
         out = 1.0 - mask
@@ -213,6 +218,7 @@ class CropMask:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "crop"
+    RESOURCE_TYPE = "cpu"
 
     def crop(self, mask, x, y, width, height):
         mask = mask.reshape((-1, mask.shape[-2], mask.shape[-1]))
@@ -237,6 +243,7 @@ class MaskComposite:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "combine"
+    RESOURCE_TYPE = "cpu"
 
     def combine(self, destination, source, x, y, operation):
         output = destination.reshape((-1, destination.shape[-2], destination.shape[-1])).clone()
@@ -284,6 +291,7 @@ class FeatherMask:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "feather"
+    RESOURCE_TYPE = "cpu"
 
     def feather(self, mask, left, top, right, bottom):
         output = mask.reshape((-1, mask.shape[-2], mask.shape[-1])).clone()
@@ -327,6 +335,7 @@ class GrowMask:
     RETURN_TYPES = ("MASK",)
 
     FUNCTION = "expand_mask"
+    RESOURCE_TYPE = "cpu"
 
     def expand_mask(self, mask, expand, tapered_corners):
         c = 0 if tapered_corners else 1
@@ -360,6 +369,7 @@ class ThresholdMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "image_to_mask"
+    RESOURCE_TYPE = "cpu"
 
     def image_to_mask(self, mask, value):
         mask = (mask > value).float()
@@ -0,0 +1,101 @@
+import math
+import logging
+
+import torch
+
+import comfy.sample
+import comfy.samplers
+import comfy.utils
+import latent_preview
+import nodes
+
+
+def batch_conditioning(conds, batch_sizes):
+    """
+    Concatenates the conditioning of several prompts along the batch dimension so that item i of the latent
+    batch is guided by conds[i]. Returns None if the conditionings can't be combined.
+    """
+    if any(len(c) != len(conds[0]) for c in conds):
+        return None
+    out = []
+    for entries in zip(*conds):
+        tensors = [t for t, _ in entries]
+        options = [o for _, o in entries]
+        if any(t.ndim != 3 or t.shape[0] != 1 or t.shape[2] != tensors[0].shape[2] for t in tensors):
+            return None
+        if any(o.keys() != options[0].keys() for o in options):
+            return None
+        # Padding cross attention by repeating the tokens doesn't change the result
+        length = math.lcm(*[t.shape[1] for t in tensors])
+        cond = torch.cat([t.repeat(size, length // t.shape[1], 1) for t, size in zip(tensors, batch_sizes)])
+
+        combined = {}
+        for key, value in options[0].items():
+            values = [o[key] for o in options]
+            if key == "pooled_output" and all(isinstance(v, torch.Tensor) and v.shape[0] == 1 and v.shape[1:] == value.shape[1:] for v in values):
+                combined[key] = torch.cat([v.repeat(size, *([1] * (v.ndim - 1))) for v, size in zip(values, batch_sizes)])
+            elif all(v is value for v in values) or (not isinstance(value, torch.Tensor) and all(not isinstance(v, torch.Tensor) and v == value for v in values)):
+                combined[key] = value
+            else:
+                return None
+        out.append([cond, combined])
+    return out
+
+
+class BatchedKSampler:
+    """
+    Samples the latents of several queued prompts in one batch. Created by comfy_execution.batching when
+    --batch-prompts merges compatible prompts; the inputs of prompt i are positive_i, negative_i and latent_image_i.
+    """
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "model": ("MODEL",),
+                "seeds": ("SEED_LIST",),
+                "steps": ("INT", {"default": 20, "min": 1, "max": 10000}),
+                "cfg": ("FLOAT", {"default": 8.0, "min": 0.0, "max": 100.0, "step": 0.1, "round": 0.01}),
+                "sampler_name": (comfy.samplers.KSampler.SAMPLERS,),
+                "scheduler": (comfy.samplers.KSampler.SCHEDULERS,),
+                "denoise": ("FLOAT", {"default": 1.0, "min": 0.0, "max": 1.0, "step": 0.01}),
+            }
+        }
+
+    RETURN_TYPES = ("LATENT_LIST",)
+    FUNCTION = "sample"
+
+    CATEGORY = "_for_testing"
+    DESCRIPTION = "Used by --batch-prompts to sample several queued prompts at once."
+
+    def sample(self, model, seeds, steps, cfg, sampler_name, scheduler, denoise=1.0, **kwargs):
+        positives = [kwargs["positive_{}".format(i)] for i in range(len(seeds))]
+        negatives = [kwargs["negative_{}".format(i)] for i in range(len(seeds))]
+        latents = [kwargs["latent_image_{}".format(i)] for i in range(len(seeds))]
+
+        latent_images = [comfy.sample.fix_empty_latent_channels(model, latent["samples"]) for latent in latents]
+        batch_sizes = [latent_image.shape[0] for latent_image in latent_images]
+        positive = batch_conditioning(positives, batch_sizes)
+        negative = batch_conditioning(negatives, batch_sizes)
+        if positive is None or negative is None or any("noise_mask" in latent for latent in latents) or any(x.shape[1:] != latent_images[0].shape[1:] for x in latent_images):
+            logging.info("Prompts can't share a batch, sampling them one by one")
+            return ([nodes.common_ksampler(model, seed, steps, cfg, sampler_name, scheduler, p, n, latent, denoise=denoise)[0] for seed, p, n, latent in zip(seeds, positives, negatives, latents)],)
+
+        # Every prompt gets exactly the noise it would have had if sampled on its own
+        noise = torch.cat([comfy.sample.prepare_noise(latent_image, seed, latent.get("batch_index", None)) for latent_image, seed, latent in zip(latent_images, seeds, latents)])
+        latent_image = torch.cat(latent_images)
+
+        callback = latent_preview.prepare_callback(model, steps)
+        disable_pbar = not comfy.utils.PROGRESS_BAR_ENABLED
+        samples = comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image,
+                                      denoise=denoise, callback=callback, disable_pbar=disable_pbar, seed=seeds[0])
+        out = []
+        for latent, sample in zip(latents, torch.split(samples, batch_sizes)):
+            latent = latent.copy()
+            latent["samples"] = sample
+            out.append(latent)
+        return (out,)
+
+
+NODE_CLASS_MAPPINGS = {
+    "BatchedKSampler": BatchedKSampler,
+}
@@ -5,6 +5,7 @@ import av
 import torch
 import folder_paths
 import json
+import node_helpers
 from typing import Optional, Literal
 from fractions import Fraction
 from comfy.comfy_types import IO, FileLocator, ComfyNodeABC
@@ -213,10 +214,9 @@ class LoadVideo(ComfyNodeABC):
     @classmethod
     def IS_CHANGED(cls, file):
         video_path = folder_paths.get_annotated_filepath(file)
-        mod_time = os.path.getmtime(video_path)
-        # Instead of hashing the file, we can just use the modification time to avoid
-        # rehashing large files.
-        return mod_time
+        # Instead of hashing the file, we can just use its inode, size and modification time
+        # to avoid rehashing large files.
+        return node_helpers.file_stat_fingerprint(video_path)
 
     @classmethod
     def VALIDATE_INPUTS(cls, file):
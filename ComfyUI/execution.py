@@ -7,16 +7,21 @@ import time
 import traceback
 from enum import Enum
 import inspect
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, nullcontext
 from typing import List, Literal, NamedTuple, Optional
 
 import torch
 import nodes
+import folder_paths
 
 import comfy.model_management
-from comfy_execution.graph import get_input_info, ExecutionList, DynamicPrompt, ExecutionBlocker
+from comfy_execution.graph import get_input_info, ExecutionList, ConcurrentExecutionList, DynamicPrompt, ExecutionBlocker
 from comfy_execution.graph_utils import is_link, GraphBuilder
-from comfy_execution.caching import HierarchicalCache, LRUCache, DependencyAwareCache, CacheKeySetInputSignature, CacheKeySetID
+from comfy_execution.caching import HierarchicalCache, LRUCache, MemoryBudgetCache, DependencyAwareCache, CacheKeySetInputSignature, CacheKeySetID
+from comfy_execution.disk_cache import DiskTieredCache
 from comfy_execution.validation import validate_node_input
+from app.history_store import HistoryStore
 
 class ExecutionResult(Enum):
     SUCCESS = 0
@@ -64,10 +69,11 @@ class CacheType(Enum):
     CLASSIC = 0
     LRU = 1
     DEPENDENCY_AWARE = 2
+    MEMORY_BUDGET = 3
 
 
 class CacheSet:
-    def __init__(self, cache_type=None, cache_size=None):
+    def __init__(self, cache_type=None, cache_size=None, disk_cache=None):
         if cache_type == CacheType.DEPENDENCY_AWARE:
             self.init_dependency_aware_cache()
             logging.info("Disabling intermediate node cache.")
@@ -76,9 +82,17 @@ class CacheSet:
                 cache_size = 0
             self.init_lru_cache(cache_size)
             logging.info("Using LRU cache")
+        elif cache_type == CacheType.MEMORY_BUDGET:
+            if cache_size is None:
+                cache_size = 0
+            self.init_memory_budget_cache(cache_size)
+            logging.info("Using memory budgeted cache ({:.2f} GB)".format(cache_size / (1024 ** 3)))
         else:
             self.init_classic_cache()
 
+        if disk_cache is not None:
+            self.outputs = DiskTieredCache(self.outputs, disk_cache)
+
         self.all = [self.outputs, self.ui, self.objects]
 
     # Performs like the old cache -- dump data ASAP
@@ -92,6 +106,12 @@ class CacheSet:
         self.ui = LRUCache(CacheKeySetInputSignature, max_size=cache_size)
         self.objects = HierarchicalCache(CacheKeySetID)
 
+    # cache_size is the byte budget for RAM/VRAM held by cached outputs
+    def init_memory_budget_cache(self, cache_size):
+        self.outputs = MemoryBudgetCache(CacheKeySetInputSignature, max_bytes=cache_size)
+        self.ui = MemoryBudgetCache(CacheKeySetInputSignature, max_bytes=cache_size)
+        self.objects = HierarchicalCache(CacheKeySetID)
+
     # only hold cached items while the decendents have not executed
     def init_dependency_aware_cache(self):
         self.outputs = DependencyAwareCache(CacheKeySetInputSignature)
@@ -267,7 +287,32 @@ def format_value(x):
     else:
         return str(x)
 
-def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results):
+_executing = threading.local()
+
+def get_executing_node_id():
+    """Display id of the node running on the calling thread, so progress can be attributed when nodes run concurrently."""
+    return getattr(_executing, "node_id", None)
+
+def get_node_resource_type(class_def):
+    if hasattr(class_def, "RESOURCE_TYPE"):
+        return class_def.RESOURCE_TYPE
+    if getattr(class_def, "API_NODE", False):
+        return "io"
+    return "gpu"
+
+@contextmanager
+def released(lock):
+    # Lets other workers use the graph while this one runs node code
+    if lock is None:
+        yield
+        return
+    lock.release()
+    try:
+        yield
+    finally:
+        lock.acquire()
+
+def execute(server, dynprompt, caches, current_item, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, graph_lock=None):
     unique_id = current_item
     real_node_id = dynprompt.get_real_node_id(unique_id)
     display_node_id = dynprompt.get_display_node_id(unique_id)
@@ -328,11 +373,13 @@ def execute(server, dynprompt, caches, current_item, extra_data, executed, promp
 
             def execution_block_cb(block):
                 if block.message is not None:
+                    with graph_lock or nullcontext():
+                        executed_nodes = list(executed)
                     mes = {
                         "prompt_id": prompt_id,
                         "node_id": unique_id,
                         "node_type": class_type,
-                        "executed": list(executed),
+                        "executed": executed_nodes,
 
                         "exception_message": f"Execution Blocked: {block.message}",
                         "exception_type": "ExecutionBlocked",
@@ -346,7 +393,12 @@ def execute(server, dynprompt, caches, current_item, extra_data, executed, promp
                     return block
             def pre_execute_cb(call_index):
                 GraphBuilder.set_default_prefix(unique_id, call_index, 0)
-            output_data, output_ui, has_subgraph = get_output_data(obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb)
+            _executing.node_id = display_node_id
+            try:
+                with released(graph_lock):
+                    output_data, output_ui, has_subgraph = get_output_data(obj, input_data_all, execution_block_cb=execution_block_cb, pre_execute_cb=pre_execute_cb)
+            finally:
+                _executing.node_id = None
         if len(output_ui) > 0:
             caches.ui.set(unique_id, {
                 "meta": {
@@ -436,14 +488,16 @@ def execute(server, dynprompt, caches, current_item, extra_data, executed, promp
     return (ExecutionResult.SUCCESS, None, None)
 
 class PromptExecutor:
-    def __init__(self, server, cache_type=False, cache_size=None):
+    def __init__(self, server, cache_type=False, cache_size=None, disk_cache=None, parallel_workers=0):
         self.cache_size = cache_size
         self.cache_type = cache_type
+        self.disk_cache = disk_cache
+        self.parallel_workers = parallel_workers
         self.server = server
         self.reset()
 
     def reset(self):
-        self.caches = CacheSet(cache_type=self.cache_type, cache_size=self.cache_size)
+        self.caches = CacheSet(cache_type=self.cache_type, cache_size=self.cache_size, disk_cache=self.disk_cache)
         self.status_messages = []
         self.success = True
 
@@ -484,7 +538,7 @@ class PromptExecutor:
             }
             self.add_message("execution_error", mes, broadcast=False)
 
-    def execute(self, prompt, prompt_id, extra_data={}, execute_outputs=[]):
+    def execute(self, prompt, prompt_id, extra_data={}, execute_outputs=[], prefetched=None, precomputed=None):
         nodes.interrupt_processing(False)
 
         if "client_id" in extra_data:
@@ -502,6 +556,13 @@ class PromptExecutor:
                 cache.set_prompt(dynamic_prompt, prompt.keys(), is_changed_cache)
                 cache.clean_unused()
 
+            if prefetched is not None:
+                self.seed_prefetched(dynamic_prompt, is_changed_cache, prefetched)
+            if precomputed is not None:
+                # Node outputs that were computed for exactly this prompt, e.g. by a batched sampler
+                for node_id, output_data in precomputed.items():
+                    self.caches.outputs.set(node_id, output_data)
+
             cached_nodes = []
             for node_id in prompt:
                 if self.caches.outputs.get(node_id) is not None:
@@ -513,28 +574,12 @@ class PromptExecutor:
                           broadcast=False)
             pending_subgraph_results = {}
             executed = set()
-            execution_list = ExecutionList(dynamic_prompt, self.caches.outputs)
             current_outputs = self.caches.outputs.all_node_ids()
-            for node_id in list(execute_outputs):
-                execution_list.add_node(node_id)
-
-            while not execution_list.is_empty():
-                node_id, error, ex = execution_list.stage_node_execution()
-                if error is not None:
-                    self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
-                    break
-
-                result, error, ex = execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results)
-                self.success = result != ExecutionResult.FAILURE
-                if result == ExecutionResult.FAILURE:
-                    self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
-                    break
-                elif result == ExecutionResult.PENDING:
-                    execution_list.unstage_node_execution()
-                else: # result == ExecutionResult.SUCCESS:
-                    execution_list.complete_node_execution()
+            if self.parallel_workers > 0:
+                success = self.execute_concurrently(dynamic_prompt, prompt_id, extra_data, execute_outputs, executed, current_outputs, pending_subgraph_results)
             else:
-                # Only execute when the while-loop ends without break
+                success = self.execute_serially(dynamic_prompt, prompt_id, extra_data, execute_outputs, executed, current_outputs, pending_subgraph_results)
+            if success:
                 self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
 
             ui_outputs = {}
@@ -553,6 +598,273 @@ class PromptExecutor:
             if comfy.model_management.DISABLE_SMART_MEMORY:
                 comfy.model_management.unload_all_models()
 
+    def seed_prefetched(self, dynamic_prompt, is_changed_cache, prefetched):
+        # Outputs computed ahead of time by PromptPrefetcher are used unless IS_CHANGED changed since,
+        # for the node or anything upstream of it. They are in topological order.
+        seeded = set()
+        for node_id, (is_changed, output_data) in prefetched.items():
+            inputs = dynamic_prompt.get_node(node_id)["inputs"]
+            if any(is_link(value) and value[0] not in seeded for value in inputs.values()):
+                continue
+            if is_changed_cache.get(node_id) != is_changed:
+                continue
+            if self.caches.outputs.get(node_id) is None:
+                self.caches.outputs.set(node_id, output_data)
+            seeded.add(node_id)
+
+    def execute_serially(self, dynamic_prompt, prompt_id, extra_data, execute_outputs, executed, current_outputs, pending_subgraph_results):
+        execution_list = ExecutionList(dynamic_prompt, self.caches.outputs)
+        for node_id in list(execute_outputs):
+            execution_list.add_node(node_id)
+
+        while not execution_list.is_empty():
+            node_id, error, ex = execution_list.stage_node_execution()
+            if error is not None:
+                self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
+                return False
+
+            result, error, ex = execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results)
+            self.success = result != ExecutionResult.FAILURE
+            if result == ExecutionResult.FAILURE:
+                self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
+                return False
+            elif result == ExecutionResult.PENDING:
+                execution_list.unstage_node_execution()
+            else: # result == ExecutionResult.SUCCESS:
+                execution_list.complete_node_execution()
+        return True
+
+    def execute_concurrently(self, dynamic_prompt, prompt_id, extra_data, execute_outputs, executed, current_outputs, pending_subgraph_results):
+        """
+        Runs ready nodes on a pool of parallel_workers threads. Only one node with the "gpu" resource type
+        runs at a time; "cpu" and "io" nodes overlap with it. Graph state (execution list, caches, dynprompt)
+        is only touched while holding graph_lock, which execute() releases while the node function runs.
+        Returns True if every node ran successfully.
+        """
+        execution_list = ConcurrentExecutionList(dynamic_prompt, self.caches.outputs)
+        for node_id in list(execute_outputs):
+            execution_list.add_node(node_id)
+
+        graph_lock = threading.Lock()
+        running = {}
+        gpu_nodes = set()
+        failure = None
+
+        def is_gpu_node(node_id):
+            if self.caches.outputs.get(node_id) is not None:
+                return False
+            class_def = nodes.NODE_CLASS_MAPPINGS[dynamic_prompt.get_node(node_id)["class_type"]]
+            return get_node_resource_type(class_def) == "gpu"
+
+        def can_run(node_id):
+            return len(gpu_nodes) == 0 or not is_gpu_node(node_id)
+
+        def run(node_id):
+            with torch.inference_mode(), graph_lock:
+                return execute(self.server, dynamic_prompt, self.caches, node_id, extra_data, executed, prompt_id, execution_list, pending_subgraph_results, graph_lock=graph_lock)
+
+        with ThreadPoolExecutor(max_workers=self.parallel_workers, thread_name_prefix="prompt-execution") as pool:
+            while True:
+                with graph_lock:
+                    while failure is None and len(running) < self.parallel_workers:
+                        node_id, error, ex = execution_list.stage_node_execution(can_run)
+                        if error is not None:
+                            failure = (error, ex)
+                        if node_id is None:
+                            break
+                        if is_gpu_node(node_id):
+                            gpu_nodes.add(node_id)
+                        running[pool.submit(run, node_id)] = node_id
+                if len(running) == 0:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                with graph_lock:
+                    for future in done:
+                        node_id = running.pop(future)
+                        gpu_nodes.discard(node_id)
+                        result, error, ex = future.result()
+                        if result == ExecutionResult.FAILURE:
+                            # Nodes already running are allowed to finish, nothing new is started
+                            if failure is None:
+                                failure = (error, ex)
+                        elif result == ExecutionResult.PENDING:
+                            execution_list.unstage_node_execution(node_id)
+                        else: # result == ExecutionResult.SUCCESS:
+                            execution_list.complete_node_execution(node_id)
+
+        self.success = failure is None
+        if failure is not None:
+            self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, *failure)
+        return self.success
+
+
+class PromptPrefetcher:
+    """
+    Runs the "cpu" and "io" nodes of the next queued prompt that only depend on constants (image loading
+    and what follows it, like mask ops) on a background thread while the current prompt executes. Their
+    outputs are handed to PromptExecutor.execute when that prompt starts.
+    """
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-prefetch")
+        self.prompt_id = None
+        self.future = None
+
+    @staticmethod
+    def is_prefetchable(class_def):
+        if get_node_resource_type(class_def) not in ("cpu", "io"):
+            return False
+        if getattr(class_def, "OUTPUT_NODE", False) or getattr(class_def, "NOT_IDEMPOTENT", False):
+            return False
+        if hasattr(class_def, "check_lazy_status"):
+            return False
+        return "hidden" not in class_def.INPUT_TYPES()
+
+    def start(self, item):
+        if item is None or item[1] == self.prompt_id:
+            return
+        self.prompt_id = item[1]
+        self.future = self.executor.submit(self.prefetch, item[2], item[3])
+
+    def take(self, prompt_id):
+        future = self.future if prompt_id == self.prompt_id else None
+        self.prompt_id = None
+        self.future = None
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            logging.warning("Prefetching prompt {} failed: {}".format(prompt_id, e))
+            return None
+
+    def prefetch(self, prompt, extra_data):
+        # IS_CHANGED stores its result on the node, so work on a copy of the queued prompt
+        dynprompt = DynamicPrompt(copy.deepcopy(prompt))
+        is_changed_cache = IsChangedCache(dynprompt, None)
+        remaining = [node_id for node_id in prompt if self.is_prefetchable(nodes.NODE_CLASS_MAPPINGS[prompt[node_id]["class_type"]])]
+        outputs = {}
+        prefetched = {}
+        progress = True
+        with torch.inference_mode():
+            while progress:
+                progress = False
+                for node_id in list(remaining):
+                    inputs = dynprompt.get_node(node_id)["inputs"]
+                    if any(is_link(value) and value[0] not in outputs for value in inputs.values()):
+                        continue
+                    remaining.remove(node_id)
+                    progress = True
+                    class_def = nodes.NODE_CLASS_MAPPINGS[prompt[node_id]["class_type"]]
+                    try:
+                        is_changed = is_changed_cache.get(node_id)
+                        input_data_all, _ = get_input_data(inputs, class_def, node_id, outputs, dynprompt, extra_data)
+                        output_data, output_ui, has_subgraph = get_output_data(class_def(), input_data_all)
+                    except Exception as e:
+                        # Execution will run the node again and report the error properly
+                        logging.debug("Not prefetching node {}: {}".format(node_id, e))
+                        continue
+                    if has_subgraph or len(output_ui) > 0 or any(isinstance(x, ExecutionBlocker) for o in output_data for x in o):
+                        continue
+                    outputs[node_id] = output_data
+                    prefetched[node_id] = (is_changed, output_data)
+        return prefetched
+
+
+class ValidationCache:
+    """
+    Results of validating a node's own inputs, keyed by its class and input
+    signature (constant values plus the class and slot each link comes from).
+    Only nodes that passed are cached, together with the input conversions
+    validation applied, so a failing node is always checked again. Upstream
+    nodes are still validated separately. Nodes with VALIDATE_INPUTS are never
+    cached since it may check files on disk. The cache is cleared when the node
+    registry, a model filename list or the contents of the input directory
+    change.
+    """
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def check_version(self):
+        version = (nodes.NODE_CLASS_MAPPINGS.version(), folder_paths.get_filename_list_version(), folder_paths.get_input_directory_version())
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    @staticmethod
+    def _freeze(val):
+        # Prompt inputs come from JSON, so this is cheaper than caching.to_hashable
+        if isinstance(val, (list, tuple)):
+            return ("LIST",) + tuple(ValidationCache._freeze(v) for v in val)
+        if isinstance(val, dict):
+            return ("DICT",) + tuple(sorted((str(k), ValidationCache._freeze(v)) for k, v in val.items()))
+        return (type(val).__name__, val)
+
+    def get_key(self, prompt, class_type, obj_class, inputs):
+        signature = []
+        for x in sorted(inputs.keys()):
+            val = inputs[x]
+            if isinstance(val, list) and len(val) == 2:
+                linked_node = prompt.get(val[0])
+                signature.append((x, "LINK", linked_node.get('class_type') if isinstance(linked_node, dict) else None, self._freeze(val[1])))
+            else:
+                signature.append((x, self._freeze(val)))
+        return (class_type, id(obj_class), tuple(signature))
+
+    def get(self, key):
+        with self.lock:
+            try:
+                entry = self.entries.get(key)
+            except TypeError:
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def set(self, key, converted, linked):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.pop(next(iter(self.entries)))
+            self.entries[key] = (converted, linked)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+
+validation_cache = ValidationCache()
+
+def validate_linked_node(prompt, val, input_name, info, validated):
+    try:
+        r = validate_inputs(prompt, val[0], validated)
+        # `r` will be set in `validated[val[0]]` already
+        return r[0] is not False
+    except Exception as ex:
+        typ, _, tb = sys.exc_info()
+        exception_type = full_type_name(typ)
+        reasons = [{
+            "type": "exception_during_inner_validation",
+            "message": "Exception when validating inner node",
+            "details": str(ex),
+            "extra_info": {
+                "input_name": input_name,
+                "input_config": info,
+                "exception_message": str(ex),
+                "exception_type": exception_type,
+                "traceback": traceback.format_tb(tb),
+                "linked_node": val
+            }
+        }]
+        validated[val[0]] = (False, reasons, val[0])
+        return False
 
 def validate_inputs(prompt, item, validated):
     unique_id = item
@@ -563,6 +875,26 @@ def validate_inputs(prompt, item, validated):
     class_type = prompt[unique_id]['class_type']
     obj_class = nodes.NODE_CLASS_MAPPINGS[class_type]
 
+    cache_key = None
+    cached = None
+    if not hasattr(obj_class, "VALIDATE_INPUTS"):
+        cache_key = validation_cache.get_key(prompt, class_type, obj_class, inputs)
+        cached = validation_cache.get(cache_key)
+    if cached is not None:
+        converted, linked = cached
+        for x, val in converted.items():
+            inputs[x] = copy.deepcopy(val) if isinstance(val, (list, dict)) else val
+        valid = True
+        for x, info in linked.items():
+            if not validate_linked_node(prompt, inputs[x], x, info, validated):
+                valid = False
+        ret = (valid, [], unique_id)
+        validated[unique_id] = ret
+        return ret
+
+    converted = {}
+    linked = {}
+
     class_inputs = obj_class.INPUT_TYPES()
     valid_inputs = set(class_inputs.get('required',{})).union(set(class_inputs.get('optional',{})))
 
@@ -630,30 +962,9 @@ def validate_inputs(prompt, item, validated):
                 }
                 errors.append(error)
                 continue
-            try:
-                r = validate_inputs(prompt, o_id, validated)
-                if r[0] is False:
-                    # `r` will be set in `validated[o_id]` already
-                    valid = False
-                    continue
-            except Exception as ex:
-                typ, _, tb = sys.exc_info()
+            linked[x] = info
+            if not validate_linked_node(prompt, val, x, info, validated):
                 valid = False
-                exception_type = full_type_name(typ)
-                reasons = [{
-                    "type": "exception_during_inner_validation",
-                    "message": "Exception when validating inner node",
-                    "details": str(ex),
-                    "extra_info": {
-                        "input_name": x,
-                        "input_config": info,
-                        "exception_message": str(ex),
-                        "exception_type": exception_type,
-                        "traceback": traceback.format_tb(tb),
-                        "linked_node": val
-                    }
-                }]
-                validated[o_id] = (False, reasons, o_id)
                 continue
         else:
             try:
@@ -691,6 +1002,7 @@ def validate_inputs(prompt, item, validated):
                 errors.append(error)
                 continue
 
+            converted[x] = val
             if x not in validate_function_inputs and not validate_has_kwargs:
                 if "min" in extra_info and val < extra_info["min"]:
                     error = {
@@ -775,6 +1087,9 @@ def validate_inputs(prompt, item, validated):
                     errors.append(error)
                     continue
 
+    if len(errors) == 0 and cache_key is not None:
+        validation_cache.set(cache_key, converted, linked)
+
     if len(errors) > 0 or valid is not True:
         ret = (False, errors, unique_id)
     else:
@@ -815,6 +1130,8 @@ def validate_prompt(prompt):
         if hasattr(class_, 'OUTPUT_NODE') and class_.OUTPUT_NODE is True:
             outputs.add(x)
 
+    validation_cache.check_version()
+
     if len(outputs) == 0:
         error = {
             "type": "prompt_no_outputs",
@@ -899,16 +1216,23 @@ def validate_prompt(prompt):
 
 MAXIMUM_HISTORY_SIZE = 10000
 
+# extra_data entries that are not kept in the history
+PRIVATE_EXTRA_DATA = ("auth_token_comfy_org", "api_key_comfy_org")
+
 class PromptQueue:
-    def __init__(self, server):
+    def __init__(self, server, history=None):
         self.server = server
         self.mutex = threading.RLock()
         self.not_empty = threading.Condition(self.mutex)
         self.task_counter = 0
         self.queue = []
         self.currently_running = {}
-        self.history = {}
+        if history is None:
+            history = HistoryStore(max_items=MAXIMUM_HISTORY_SIZE)
+        # The history has its own lock, reading it doesn't block the queue
+        self.history = history
         self.flags = {}
+        self.task_done_listeners = []
 
     def put(self, item):
         with self.mutex:
@@ -929,6 +1253,39 @@ class PromptQueue:
             self.server.queue_updated()
             return (item, i)
 
+    def get_matching(self, predicate, max_items, timeout=None):
+        """
+        Takes up to max_items queued items for which predicate(item) is true, in queue order, waiting up to
+        timeout seconds for more to be queued. Returns a list of (item, item_id) like get().
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        taken = []
+        with self.not_empty:
+            while True:
+                for item in sorted(self.queue):
+                    if len(taken) >= max_items:
+                        break
+                    if predicate(item):
+                        self.queue.remove(item)
+                        i = self.task_counter
+                        self.currently_running[i] = copy.deepcopy(item)
+                        self.task_counter += 1
+                        taken.append((item, i))
+                heapq.heapify(self.queue)
+                remaining = deadline - time.monotonic()
+                if len(taken) >= max_items or remaining <= 0:
+                    break
+                self.not_empty.wait(timeout=remaining)
+            if len(taken) > 0:
+                self.server.queue_updated()
+        return taken
+
+    def peek(self):
+        with self.mutex:
+            if len(self.queue) == 0:
+                return None
+            return self.queue[0]
+
     class ExecutionStatus(NamedTuple):
         status_str: Literal['success', 'error']
         completed: bool
@@ -937,21 +1294,42 @@ class PromptQueue:
     def task_done(self, item_id, history_result,
                   status: Optional['PromptQueue.ExecutionStatus']):
         with self.mutex:
-            prompt = self.currently_running.pop(item_id)
-            if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
-
-            status_dict: Optional[dict] = None
-            if status is not None:
-                status_dict = copy.deepcopy(status._asdict())
-
-            self.history[prompt[1]] = {
-                "prompt": prompt,
-                "outputs": {},
-                'status': status_dict,
-            }
-            self.history[prompt[1]].update(history_result)
-            self.server.queue_updated()
+            prompt = self.currently_running[item_id]
+
+        status_dict: Optional[dict] = None
+        if status is not None:
+            status_dict = copy.deepcopy(status._asdict())
+
+        extra_data = {k: v for k, v in prompt[3].items() if k not in PRIVATE_EXTRA_DATA}
+        entry = {
+            "prompt": prompt[:3] + (extra_data,) + prompt[4:],
+            "outputs": {},
+            'status': status_dict,
+        }
+        entry.update(history_result)
+        # The prompt is added to the history before leaving currently_running so that it can always be found
+        self.history.put(prompt[1], entry)
+        with self.mutex:
+            self.currently_running.pop(item_id)
+        self.server.queue_updated()
+
+        for listener in self.task_done_listeners:
+            try:
+                listener(prompt[1], entry)
+            except Exception:
+                logging.exception("Error in prompt completion listener")
+
+    def add_task_done_listener(self, listener):
+        """
+        Calls listener(prompt_id, history_entry) from the thread that finished each prompt, after the prompt
+        was added to the history.
+        """
+        self.task_done_listeners.append(listener)
+
+    def has_prompt(self, prompt_id):
+        """True if the prompt is queued or running."""
+        with self.mutex:
+            return any(x[1] == prompt_id for x in self.currently_running.values()) or any(x[1] == prompt_id for x in self.queue)
 
     # Note: slow
     def get_current_queue(self):
@@ -990,32 +1368,32 @@ class PromptQueue:
                     return True
         return False
 
-    def get_history(self, prompt_id=None, max_items=None, offset=-1):
-        with self.mutex:
-            if prompt_id is None:
-                out = {}
-                i = 0
-                if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        out[k] = self.history[k]
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
-                return out
-            elif prompt_id in self.history:
-                return {prompt_id: copy.deepcopy(self.history[prompt_id])}
-            else:
-                return {}
+    def get_history(self, prompt_id=None, max_items=None, offset=-1, status=None, before=None, filename=None):
+        """
+        History entries by prompt id. Entries are shared with the history store and must not be modified.
+        """
+        if prompt_id is not None:
+            entry = self.history.get(prompt_id)
+            return {} if entry is None else {prompt_id: entry}
+        page = self.history.get_page(max_items=max_items, offset=offset, status=status, before=before, filename=filename)
+        return {k: entry for _, k, entry in page}
+
+    def get_history_page(self, max_items=None, status=None, before=None, filename=None):
+        """
+        Like get_history, also returning the cursor to pass as before to get the previous page. The cursor is None
+        once a page holds fewer than max_items entries.
+        """
+        page = self.history.get_page(max_items=max_items, status=status, before=before, filename=filename)
+        cursor = None
+        if max_items is not None and len(page) == max_items:
+            cursor = page[0][0]
+        return {k: entry for _, k, entry in page}, cursor
 
     def wipe_history(self):
-        with self.mutex:
-            self.history = {}
+        self.history.clear()
 
     def delete_history_item(self, id_to_delete):
-        with self.mutex:
-            self.history.pop(id_to_delete, None)
+        self.history.delete(id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
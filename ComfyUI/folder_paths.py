@@ -3,11 +3,13 @@ from __future__ import annotations
 import os
 import time
 import mimetypes
+import threading
 import logging
 from typing import Literal, List
 from collections.abc import Collection
 
 from comfy.cli_args import args
+from app.folder_index import FolderIndex, crawl
 
 supported_pt_extensions: set[str] = {'.ckpt', '.pt', '.pt2', '.bin', '.pth', '.safetensors', '.pkl', '.sft'}
 
@@ -52,10 +54,19 @@ input_directory = os.path.join(base_path, "input")
 user_directory = os.path.join(base_path, "user")
 
 filename_list_cache: dict[str, tuple[list[str], dict[str, float], float]] = {}
+filename_list_version = 0
+# Guards filename_list_cache and filename_list_version, prompts are validated on several threads
+filename_list_lock = threading.RLock()
 
-class CacheHelper:
+# --watch-model-folders - file lists are kept up to date in memory instead of being checked on every call
+folder_index = FolderIndex(poll_interval=args.folder_poll_interval, workers=args.folder_scan_workers, snapshot_dir=args.folder_snapshot_dir) if args.watch_model_folders else None
+filename_list_index_versions: dict[str, tuple] = {}
+# What get_filename_list_version last checked the cached lists against when there is a folder index
+filename_list_checked = None
+
+class CacheHelper(threading.local):
     """
-    Helper class for managing file list cache data.
+    Helper class for managing file list cache data. The cache is only active on the thread that entered it.
     """
     def __init__(self):
         self.cache: dict[str, tuple[list[str], dict[str, float], float]] = {}
@@ -236,39 +247,11 @@ def recursive_search(directory: str, excluded_dir_names: list[str] | None=None)
     if excluded_dir_names is None:
         excluded_dir_names = []
 
-    result = []
-    dirs = {}
-
-    # Attempt to add the initial directory to dirs with error handling
-    try:
-        dirs[directory] = os.path.getmtime(directory)
-    except FileNotFoundError:
-        logging.warning(f"Warning: Unable to access {directory}. Skipping this path.")
-
     logging.debug("recursive file list on directory {}".format(directory))
-    dirpath: str
-    subdirs: list[str]
-    filenames: list[str]
-
-    for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-        subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-        for file_name in filenames:
-            try:
-                relative_path = os.path.relpath(os.path.join(dirpath, file_name), directory)
-                result.append(relative_path)
-            except:
-                logging.warning(f"Warning: Unable to access {file_name}. Skipping this file.")
-                continue
-
-        for d in subdirs:
-            path: str = os.path.join(dirpath, d)
-            try:
-                dirs[path] = os.path.getmtime(path)
-            except FileNotFoundError:
-                logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                continue
+    index = crawl(directory, excluded_dir_names, workers=args.folder_scan_workers, snapshot_dir=args.folder_snapshot_dir)
+    result = list(index.files)
     logging.debug("found {} files".format(len(result)))
-    return result, dirs
+    return result, index.dir_mtimes()
 
 def filter_files_extensions(files: Collection[str], extensions: Collection[str]) -> list[str]:
     return sorted(list(filter(lambda a: os.path.splitext(a)[-1].lower() in extensions or len(extensions) == 0, files)))
@@ -282,6 +265,10 @@ def get_full_path(folder_name: str, filename: str) -> str | None:
         return None
     folders = folder_names_and_paths[folder_name]
     filename = os.path.relpath(os.path.join("/", filename), "/")
+    if folder_index is not None:
+        full_path = folder_index.find(folders[0], filename)
+        if full_path is not None:
+            return full_path
     for x in folders[0]:
         full_path = os.path.join(x, filename)
         if os.path.isfile(full_path):
@@ -306,7 +293,10 @@ def get_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float], f
     folders = folder_names_and_paths[folder_name]
     output_folders = {}
     for x in folders[0]:
-        files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
+        if folder_index is not None and os.path.isdir(x):
+            files, folders_all = folder_index.list_files(x, excluded_dir_names=[".git"])
+        else:
+            files, folders_all = recursive_search(x, excluded_dir_names=[".git"])
         output_list.update(filter_files_extensions(files, folders[1]))
         output_folders = {**output_folders, **folders_all}
 
@@ -324,6 +314,12 @@ def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float]
         return None
     out = filename_list_cache[folder_name]
 
+    if folder_index is not None:
+        version = folder_index.version(folder_names_and_paths[folder_name][0])
+        if version is None or version != filename_list_index_versions.get(folder_name):
+            return None
+        return out
+
     for x in out[1]:
         time_modified = out[1][x]
         folder = x
@@ -340,24 +336,127 @@ def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float]
 
 def get_filename_list(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
-    out = cached_filename_list_(folder_name)
-    if out is None:
-        out = get_filename_list_(folder_name)
-        global filename_list_cache
-        filename_list_cache[folder_name] = out
+    with filename_list_lock:
+        out = cached_filename_list_(folder_name)
+        if out is None:
+            out = get_filename_list_(folder_name)
+            if folder_index is not None:
+                filename_list_index_versions[folder_name] = folder_index.version(folder_names_and_paths[folder_name][0])
+            global filename_list_cache, filename_list_version
+            previous = filename_list_cache.get(folder_name)
+            if previous is None or previous[0] != out[0]:
+                filename_list_version += 1
+            filename_list_cache[folder_name] = out
     cache_helper.set(folder_name, out)
     return list(out[0])
 
-def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
-    def map_filename(filename: str) -> tuple[int, str]:
-        prefix_len = len(os.path.basename(filename_prefix))
-        prefix = filename[:prefix_len + 1]
+def get_filename_list_version() -> int:
+    """
+    Returns a counter that changes whenever a filename list that has been
+    requested before changes on disk. With a folder index the lists are only
+    rechecked once the index saw a change, otherwise the folders are rechecked
+    on every call.
+    """
+    global filename_list_checked
+    with filename_list_lock:
+        checked = None
+        if folder_index is not None:
+            checked = (folder_index.changes(), tuple((name, tuple(folder_names_and_paths[name][0])) for name in filename_list_cache if name in folder_names_and_paths))
+            if checked == filename_list_checked:
+                return filename_list_version
+        for folder_name in list(filename_list_cache.keys()):
+            if folder_name in folder_names_and_paths:
+                get_filename_list(folder_name)
+        if checked is not None:
+            # Rechecking may have indexed new folders
+            filename_list_checked = (folder_index.changes(), checked[1])
+        return filename_list_version
+
+# What the built-in save nodes put after the counter. Files with these endings are looked for before a counter is
+# handed out, together with the endings found for the prefix when its folder was scanned.
+SAVE_FILE_SUFFIXES = ("_.png", "_.webp", "_.latent", "_.webm", "_.mp4", "_.glb", "_.safetensors", "_.flac", "_.mp3", "_.opus", "_.svg")
+
+class SaveCounterIndex:
+    """
+    The next counter of each (folder, filename prefix) for get_save_image_path. A prefix is seeded by scanning its
+    folder once, after that handing out a counter only checks whether files with the next counter already exist,
+    which skips over the rest of a batch saved with the previous counter and files saved by someone else.
+    Counters are reserved under a lock so concurrent saves get different ones.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # normcase(folder) -> (st_dev, st_ino) of the folder when it was first scanned
+        self.folders: dict[str, tuple[int, int]] = {}
+        # (normcase(folder), normcase(prefix)) -> [next counter, endings after the counter]
+        self.counters: dict[tuple[str, str], list] = {}
+
+    @staticmethod
+    def scan(folder: str, prefix: str) -> tuple[int, set[str]]:
+        """The highest counter of prefix in folder and the endings of those files."""
+        prefix_len = len(prefix)
+        highest = 0
+        suffixes = set()
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                name = entry.name
+                if name[prefix_len:prefix_len + 1] != "_" or os.path.normcase(name[:prefix_len]) != os.path.normcase(prefix):
+                    continue
+                digits = name[prefix_len + 1:].split('_')[0]
+                try:
+                    counter = int(digits)
+                except ValueError:
+                    continue
+                highest = max(highest, counter)
+                if len(suffixes) < 16:
+                    suffixes.add(name[prefix_len + 1 + len(digits):])
+        return highest, suffixes
+
+    def next_counter(self, folder: str, prefix: str) -> int:
+        """Reserves and returns the next counter of prefix in folder, which must exist."""
+        folder_key = os.path.normcase(os.path.abspath(folder))
+        key = (folder_key, os.path.normcase(prefix))
+        stat = os.stat(folder)
+        with self.lock:
+            # A folder that was deleted and created again starts over
+            if self.folders.get(folder_key) != (stat.st_dev, stat.st_ino):
+                self.counters = {k: v for k, v in self.counters.items() if k[0] != folder_key}
+                self.folders[folder_key] = (stat.st_dev, stat.st_ino)
+            entry = self.counters.get(key)
+            if entry is None:
+                highest, suffixes = self.scan(folder, prefix)
+                entry = [highest + 1, suffixes.union(SAVE_FILE_SUFFIXES)]
+                self.counters[key] = entry
+            counter = entry[0]
+            while any(os.path.lexists(os.path.join(folder, f"{prefix}_{counter:05}{suffix}")) for suffix in entry[1]):
+                counter += 1
+            entry[0] = counter + 1
+            return counter
+
+    def claim(self, folder: str, prefix: str, counter: int, suffix: str) -> None:
+        """Records that a file with counter and suffix was created outside of next_counter."""
+        key = (os.path.normcase(os.path.abspath(folder)), os.path.normcase(prefix))
+        with self.lock:
+            entry = self.counters.get(key)
+            if entry is not None:
+                entry[0] = max(entry[0], counter + 1)
+                entry[1].add(suffix)
+
+save_counter_index = SaveCounterIndex()
+
+def get_input_directory_version() -> tuple:
+    """
+    The mtimes of the input directory and its 3d subfolder, which some nodes list themselves instead of through
+    get_filename_list. Changes when files are added to or removed from them.
+    """
+    version = []
+    for directory in (input_directory, os.path.join(input_directory, "3d")):
         try:
-            digits = int(filename[prefix_len + 1:].split('_')[0])
-        except:
-            digits = 0
-        return digits, prefix
+            version.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    return tuple(version)
 
+def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
     def compute_vars(input: str, image_width: int, image_height: int) -> str:
         input = input.replace("%width%", str(image_width))
         input = input.replace("%height%", str(image_height))
@@ -386,11 +485,24 @@ def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, im
         logging.error(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: os.path.normcase(a[1][:-1]) == os.path.normcase(filename) and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    os.makedirs(full_output_folder, exist_ok=True)
+    counter = save_counter_index.next_counter(full_output_folder, filename)
     return full_output_folder, filename, counter, subfolder, filename_prefix
+
+def reserve_save_file(full_output_folder: str, filename: str, counter: int, suffix: str) -> tuple[int, str]:
+    """
+    Creates the empty file {filename}_{counter:05}{suffix} in full_output_folder, going on to the next counter while
+    that file already exists, for example because another process saves with the same prefix.
+
+    Returns:
+        tuple[int, str]: The counter and the name of the file that was created.
+    """
+    while True:
+        file = f"{filename}_{counter:05}{suffix}"
+        try:
+            os.close(os.open(os.path.join(full_output_folder, file), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            counter += 1
+            continue
+        save_counter_index.claim(full_output_folder, filename, counter, suffix)
+        return counter, file
@@ -1,3 +1,7 @@
+import math
+import os
+import threading
+
 import torch
 from PIL import Image
 from comfy.cli_args import args, LatentPreviewMethod
@@ -9,16 +13,72 @@ import logging
 
 MAX_PREVIEW_RESOLUTION = args.preview_size
 
-def preview_to_image(latent_image):
+# Called before decoding each step's preview, returns False to skip it
+PREVIEW_FILTER = None
+
+def set_preview_filter(function):
+    global PREVIEW_FILTER
+    PREVIEW_FILTER = function
+
+# Largest number of batch items shown in a --preview-grid preview
+MAX_PREVIEW_GRID = 16
+
+def preview_to_image(latent_image, max_size=None, buffer=None):
+        """
+        Converts a HxWx3 image in -1..1 to PIL. It is shrunk to fit max_size on its device first so that less
+        data is converted and moved to the CPU; buffer can be a PreviewBuffer to reuse between steps.
+        """
+        latent_image = shrink_preview(latent_image, max_size)
         latents_ubyte = (((latent_image + 1.0) / 2.0).clamp(0, 1)  # change scale from -1..1 to 0..1
                             .mul(0xFF)  # to 0..255
                             )
         if comfy.model_management.directml_enabled:
                 latents_ubyte = latents_ubyte.to(dtype=torch.uint8)
+        if buffer is not None:
+            return Image.fromarray(buffer.copy_from(latents_ubyte).numpy())
         latents_ubyte = latents_ubyte.to(device="cpu", dtype=torch.uint8, non_blocking=comfy.model_management.device_supports_non_blocking(latent_image.device))
 
         return Image.fromarray(latents_ubyte.numpy())
 
+def shrink_preview(image, max_size):
+    """Shrinks HxWxC image to fit in max_size x max_size, keeping the aspect ratio. A shrunk image is float32."""
+    height, width = image.shape[0], image.shape[1]
+    if max_size is None or max(height, width) <= max_size:
+        return image
+    scale = max_size / max(height, width)
+    size = (max(1, round(height * scale)), max(1, round(width * scale)))
+    # Antialiased interpolation isn't implemented for half precision on the CPU
+    image = image.movedim(-1, 0).unsqueeze(0).float()
+    image = torch.nn.functional.interpolate(image, size=size, mode="bilinear", antialias=True, align_corners=False)
+    return image[0].movedim(0, -1)
+
+def tile_previews(images):
+    """Arranges a BxHxWxC batch of images in -1..1 into a grid with black padding."""
+    count, height, width, channels = images.shape
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    if rows * columns != count:
+        padding = torch.full((rows * columns - count, height, width, channels), -1.0, dtype=images.dtype, device=images.device)
+        images = torch.cat((images, padding))
+    return images.reshape(rows, columns, height, width, channels).movedim(2, 1).reshape(rows * height, columns * width, channels)
+
+class PreviewBuffer:
+    """
+    CPU memory that previews are copied into, reused across steps. Pinned when the preview comes from a CUDA
+    device. Image.fromarray copies RGB data, so the buffer can be overwritten once the image is created.
+    """
+    def __init__(self):
+        self.cpu = None
+
+    def copy_from(self, tensor):
+        tensor = tensor.to(dtype=torch.uint8)
+        if tensor.device.type == "cpu":
+            return tensor
+        if self.cpu is None or self.cpu.shape != tensor.shape:
+            self.cpu = torch.empty(tensor.shape, dtype=torch.uint8, pin_memory=comfy.model_management.is_device_cuda(tensor.device))
+        self.cpu.copy_(tensor)
+        return self.cpu
+
 class LatentPreviewer:
     def decode_latent_to_preview(self, x0):
         pass
@@ -30,10 +90,14 @@ class LatentPreviewer:
 class TAESDPreviewerImpl(LatentPreviewer):
     def __init__(self, taesd):
         self.taesd = taesd
+        self.buffer = PreviewBuffer()
 
     def decode_latent_to_preview(self, x0):
-        x_sample = self.taesd.decode(x0[:1])[0].movedim(0, 2)
-        return preview_to_image(x_sample)
+        if args.preview_grid and x0.ndim == 4 and x0.shape[0] > 1:
+            x_sample = tile_previews(self.taesd.decode(x0[:MAX_PREVIEW_GRID]).movedim(1, -1))
+        else:
+            x_sample = self.taesd.decode(x0[:1])[0].movedim(0, 2)
+        return preview_to_image(x_sample, MAX_PREVIEW_RESOLUTION, self.buffer)
 
 
 class Latent2RGBPreviewer(LatentPreviewer):
@@ -42,50 +106,95 @@ class Latent2RGBPreviewer(LatentPreviewer):
         self.latent_rgb_factors_bias = None
         if latent_rgb_factors_bias is not None:
             self.latent_rgb_factors_bias = torch.tensor(latent_rgb_factors_bias, device="cpu")
+        # (dtype, device) -> factors and bias, kept so they aren't copied to the device on every step
+        self.resident_factors = {}
+        self.buffer = PreviewBuffer()
+
+    def get_factors(self, dtype, device):
+        key = (dtype, device)
+        factors = self.resident_factors.get(key)
+        if factors is None:
+            bias = None
+            if self.latent_rgb_factors_bias is not None:
+                bias = self.latent_rgb_factors_bias.to(dtype=dtype, device=device)
+            factors = (self.latent_rgb_factors.to(dtype=dtype, device=device), bias)
+            self.resident_factors[key] = factors
+        return factors
 
     def decode_latent_to_preview(self, x0):
-        self.latent_rgb_factors = self.latent_rgb_factors.to(dtype=x0.dtype, device=x0.device)
-        if self.latent_rgb_factors_bias is not None:
-            self.latent_rgb_factors_bias = self.latent_rgb_factors_bias.to(dtype=x0.dtype, device=x0.device)
+        latent_rgb_factors, latent_rgb_factors_bias = self.get_factors(x0.dtype, x0.device)
 
         if x0.ndim == 5:
             x0 = x0[0, :, 0]
+        elif args.preview_grid and x0.shape[0] > 1:
+            # All batch items in one op
+            latent_images = torch.nn.functional.linear(x0[:MAX_PREVIEW_GRID].movedim(1, -1), latent_rgb_factors, bias=latent_rgb_factors_bias)
+            return preview_to_image(tile_previews(latent_images), MAX_PREVIEW_RESOLUTION, self.buffer)
         else:
             x0 = x0[0]
 
-        latent_image = torch.nn.functional.linear(x0.movedim(0, -1), self.latent_rgb_factors, bias=self.latent_rgb_factors_bias)
+        latent_image = torch.nn.functional.linear(x0.movedim(0, -1), latent_rgb_factors, bias=latent_rgb_factors_bias)
         # latent_image = x0[0].permute(1, 2, 0) @ self.latent_rgb_factors
 
-        return preview_to_image(latent_image)
+        return preview_to_image(latent_image, MAX_PREVIEW_RESOLUTION, self.buffer)
 
 
-def get_previewer(device, latent_format):
+# (latent format class, device, method) -> (TAESD decoder path and mtime, previewer)
+previewer_cache = {}
+previewer_cache_lock = threading.Lock()
+
+def find_taesd_decoder(latent_format):
+    if latent_format.taesd_decoder_name is None:
+        return None
+    # The filename list is cached and only rescanned when vae_approx changes
+    taesd_decoder_path = next(
+        (fn for fn in folder_paths.get_filename_list("vae_approx")
+            if fn.startswith(latent_format.taesd_decoder_name)),
+        ""
+    )
+    return folder_paths.get_full_path("vae_approx", taesd_decoder_path)
+
+def create_previewer(device, latent_format, method, taesd_decoder_path):
     previewer = None
+    if method == LatentPreviewMethod.TAESD:
+        if taesd_decoder_path:
+            taesd = TAESD(None, taesd_decoder_path, latent_channels=latent_format.latent_channels).to(device)
+            previewer = TAESDPreviewerImpl(taesd)
+        else:
+            logging.warning("Warning: TAESD previews enabled, but could not find models/vae_approx/{}".format(latent_format.taesd_decoder_name))
+
+    if previewer is None:
+        if latent_format.latent_rgb_factors is not None:
+            previewer = Latent2RGBPreviewer(latent_format.latent_rgb_factors, latent_format.latent_rgb_factors_bias)
+    return previewer
+
+def get_previewer(device, latent_format):
+    """
+    Previewers are reused by every sampler with the same latent format and device, until the preview method
+    or the TAESD decoder file changes.
+    """
     method = args.preview_method
-    if method != LatentPreviewMethod.NoPreviews:
-        # TODO previewer methods
-        taesd_decoder_path = None
-        if latent_format.taesd_decoder_name is not None:
-            taesd_decoder_path = next(
-                (fn for fn in folder_paths.get_filename_list("vae_approx")
-                    if fn.startswith(latent_format.taesd_decoder_name)),
-                ""
-            )
-            taesd_decoder_path = folder_paths.get_full_path("vae_approx", taesd_decoder_path)
-
-        if method == LatentPreviewMethod.Auto:
-            method = LatentPreviewMethod.Latent2RGB
-
-        if method == LatentPreviewMethod.TAESD:
-            if taesd_decoder_path:
-                taesd = TAESD(None, taesd_decoder_path, latent_channels=latent_format.latent_channels).to(device)
-                previewer = TAESDPreviewerImpl(taesd)
-            else:
-                logging.warning("Warning: TAESD previews enabled, but could not find models/vae_approx/{}".format(latent_format.taesd_decoder_name))
-
-        if previewer is None:
-            if latent_format.latent_rgb_factors is not None:
-                previewer = Latent2RGBPreviewer(latent_format.latent_rgb_factors, latent_format.latent_rgb_factors_bias)
+    if method == LatentPreviewMethod.NoPreviews:
+        return None
+    if method == LatentPreviewMethod.Auto:
+        method = LatentPreviewMethod.Latent2RGB
+
+    taesd_decoder_path = None
+    decoder = None
+    if method == LatentPreviewMethod.TAESD:
+        taesd_decoder_path = find_taesd_decoder(latent_format)
+        if taesd_decoder_path:
+            decoder = (taesd_decoder_path, os.path.getmtime(taesd_decoder_path))
+
+    key = (type(latent_format), str(device), method)
+    with previewer_cache_lock:
+        cached = previewer_cache.get(key)
+        if cached is not None and cached[0] == decoder:
+            return cached[1]
+
+    previewer = create_previewer(device, latent_format, method, taesd_decoder_path)
+    with previewer_cache_lock:
+        previewer_cache[key] = (decoder, previewer)
     return previewer
 
 def prepare_callback(model, steps, x0_output_dict=None):
@@ -101,8 +210,7 @@ def prepare_callback(model, steps, x0_output_dict=None):
             x0_output_dict["x0"] = x0
 
         preview_bytes = None
-        if previewer:
+        if previewer and (PREVIEW_FILTER is None or PREVIEW_FILTER()):
             preview_bytes = previewer.decode_latent_to_preview_image(preview_format, x0)
         pbar.update_absolute(step + 1, total_steps, preview_bytes)
     return callback
-
@@ -104,6 +104,7 @@ import asyncio
 import shutil
 import threading
 import gc
+import functools
 
 
 if os.name == "nt":
@@ -128,9 +129,13 @@ if __name__ == "__main__":
 import comfy.utils
 
 import execution
+from comfy_execution.disk_cache import DiskCache
+from comfy_execution.batching import PromptBatcher
 import server
 from server import BinaryEventTypes
 import nodes
+import node_helpers
+import latent_preview
 import comfy.model_management
 import comfyui_version
 import app.logger
@@ -148,15 +153,32 @@ def cuda_malloc_warning():
             logging.warning("\nWARNING: this card most likely does not support cuda-malloc, if you get \"CUDA error\" please run ComfyUI with: --disable-cuda-malloc\n")
 
 
+def finish_prompt(q, server_instance, item_id, prompt_id, history_result, status, client_id):
+    q.task_done(item_id, history_result, status=status)
+    if client_id is not None:
+        server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, client_id)
+
+
 def prompt_worker(q, server_instance):
     current_time: float = 0.0
     cache_type = execution.CacheType.CLASSIC
+    cache_size = args.cache_lru
     if args.cache_lru > 0:
         cache_type = execution.CacheType.LRU
+    elif args.cache_memory > 0:
+        cache_type = execution.CacheType.MEMORY_BUDGET
+        cache_size = int(args.cache_memory * 1024 * 1024 * 1024)
     elif args.cache_none:
         cache_type = execution.CacheType.DEPENDENCY_AWARE
 
-    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_size=args.cache_lru)
+    disk_cache = None
+    if args.disk_cache_dir:
+        disk_cache = DiskCache(args.disk_cache_dir, int(args.disk_cache_size * 1024 * 1024 * 1024),
+                               include_classes=args.disk_cache_include, exclude_classes=args.disk_cache_exclude)
+
+    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_size=cache_size, disk_cache=disk_cache, parallel_workers=args.parallel_execution)
+    prefetcher = execution.PromptPrefetcher() if args.pipeline_prompts else None
+    batcher = PromptBatcher(args.batch_prompts, window=args.batch_window / 1000) if args.batch_prompts > 1 else None
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -168,25 +190,45 @@ def prompt_worker(q, server_instance):
 
         queue_item = q.get(timeout=timeout)
         if queue_item is not None:
-            item, item_id = queue_item
-            execution_start_time = time.perf_counter()
-            prompt_id = item[1]
-            server_instance.last_prompt_id = prompt_id
-
-            e.execute(item[2], prompt_id, item[3], item[4])
-            need_gc = True
-            q.task_done(item_id,
-                        e.history_result,
-                        status=execution.PromptQueue.ExecutionStatus(
-                            status_str='success' if e.success else 'error',
-                            completed=e.success,
-                            messages=e.status_messages))
-            if server_instance.client_id is not None:
-                server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
-
-            current_time = time.perf_counter()
-            execution_time = current_time - execution_start_time
-            logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
+            batch = [queue_item]
+            precomputed = {}
+            if batcher is not None:
+                batch = batcher.collect(q, queue_item)
+                if len(batch) > 1:
+                    server_instance.last_prompt_id = batch[0][0][1]
+                    precomputed = batcher.sample(e, [item for item, _ in batch])
+                    need_gc = True
+
+            for item, item_id in batch:
+                execution_start_time = time.perf_counter()
+                prompt_id = item[1]
+                server_instance.last_prompt_id = prompt_id
+
+                if precomputed is None:
+                    # Interrupting the batched sampler interrupts every prompt in the batch
+                    status = execution.PromptQueue.ExecutionStatus(status_str='error', completed=False, messages=e.status_messages)
+                    node_helpers.output_writer.flush(functools.partial(finish_prompt, q, server_instance, item_id, prompt_id, {"outputs": {}, "meta": {}}, status, item[3].get("client_id", None)))
+                    continue
+
+                prefetched = None
+                if prefetcher is not None:
+                    prefetched = prefetcher.take(prompt_id)
+                    prefetcher.start(q.peek())
+
+                e.execute(item[2], prompt_id, item[3], item[4], prefetched=prefetched, precomputed=precomputed.get(prompt_id, None))
+                need_gc = True
+
+                status = execution.PromptQueue.ExecutionStatus(
+                    status_str='success' if e.success else 'error',
+                    completed=e.success,
+                    messages=e.status_messages)
+                # With --pipeline-prompts the prompt is only reported done once its images are written,
+                # while this loop already moves on to the next prompt
+                node_helpers.output_writer.flush(functools.partial(finish_prompt, q, server_instance, item_id, prompt_id, e.history_result, status, server_instance.client_id))
+
+                current_time = time.perf_counter()
+                execution_time = current_time - execution_start_time
+                logging.info("Prompt executed in {:.2f} seconds".format(execution_time))
 
         flags = q.get_flags()
         free_memory = flags.get("free_memory", False)
@@ -223,13 +265,16 @@ async def run(server_instance, address='', port=8188, verbose=True, call_on_star
 def hijack_progress(server_instance):
     def hook(value, total, preview_image):
         comfy.model_management.throw_exception_if_processing_interrupted()
-        progress = {"value": value, "max": total, "prompt_id": server_instance.last_prompt_id, "node": server_instance.last_node_id}
+        if not server_instance.progress_enabled:
+            return
+        progress = {"value": value, "max": total, "prompt_id": server_instance.last_prompt_id, "node": execution.get_executing_node_id() or server_instance.last_node_id}
 
         server_instance.send_sync("progress", progress, server_instance.client_id)
         if preview_image is not None:
-            server_instance.send_sync(BinaryEventTypes.UNENCODED_PREVIEW_IMAGE, preview_image, server_instance.client_id)
+            server_instance.send_sync(BinaryEventTypes.UNENCODED_PREVIEW_IMAGE, tuple(preview_image) + (progress["prompt_id"], progress["node"]), server_instance.client_id)
 
     comfy.utils.set_progress_bar_global_hook(hook)
+    latent_preview.set_preview_filter(lambda: server_instance.progress_enabled and server_instance.preview_throttle.wants_preview(server_instance.client_id))
 
 
 def cleanup_temp():
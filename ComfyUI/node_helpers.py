@@ -1,4 +1,9 @@
+import os
 import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 import torch
 
 from comfy.cli_args import args
@@ -58,3 +63,146 @@ def image_alpha_fix(destination, source):
         destination = torch.nn.functional.pad(destination, (0, 1))
         destination[..., -1] = 1.0
     return destination, source
+
+
+class FileHashCache:
+    """
+    Content hashes of files keyed by (path, inode, size, mtime_ns) so that an
+    unchanged file is only read once no matter how many prompts reference it.
+    prefetch() hashes files on a background thread pool (--file-hash-workers)
+    so the hash is usually ready by the time IS_CHANGED asks for it.
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, max_entries=4096, workers=0):
+        self.max_entries = max_entries
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.hashes = OrderedDict()
+        self.pending = {}
+        self.executor = None
+
+    def _key(self, path, algorithm):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_ino, stat.st_size, stat.st_mtime_ns, algorithm)
+
+    def _hash_file(self, path, algorithm):
+        m = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                m.update(chunk)
+        return m.hexdigest()
+
+    def _compute(self, key, path, algorithm):
+        try:
+            digest = self._hash_file(path, algorithm)
+            with self.lock:
+                self.hashes[key] = digest
+                while len(self.hashes) > self.max_entries:
+                    self.hashes.popitem(last=False)
+            return digest
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    def get(self, path, algorithm="sha256"):
+        key = self._key(path, algorithm)
+        with self.lock:
+            digest = self.hashes.get(key)
+            if digest is not None:
+                self.hashes.move_to_end(key)
+                return digest
+            future = self.pending.get(key)
+        if future is not None:
+            return future.result()
+        return self._compute(key, path, algorithm)
+
+    def prefetch(self, path, algorithm="sha256"):
+        if self.workers <= 0:
+            return
+        try:
+            key = self._key(path, algorithm)
+        except OSError:
+            return
+        with self.lock:
+            if key in self.hashes or key in self.pending:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="file-hash")
+            self.pending[key] = self.executor.submit(self._compute, key, path, algorithm)
+
+file_hash_cache = FileHashCache(workers=args.file_hash_workers)
+
+def file_hash(path, algorithm="sha256"):
+    return file_hash_cache.get(path, algorithm)
+
+def file_stat_fingerprint(path):
+    # For files too large to hash, like videos
+    stat = os.stat(path)
+    return "{}-{}-{}".format(stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class OutputWriter:
+    """
+    Encodes and writes output files on background threads, so that with --pipeline-prompts the next prompt
+    can start sampling while the images of the previous one are still being written. With workers=0 files
+    are written immediately, as before.
+    """
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.executor = None
+        self.flusher = None
+        if workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="output-writer")
+            self.flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="output-flush")
+
+    def submit(self, path, write):
+        """Calls write(path) now or in the background."""
+        if self.executor is None:
+            write(path)
+            return
+        path = os.path.abspath(path)
+        # Reserve the name so that save path counters account for it before the data is written
+        open(path, "wb").close()
+        with self.lock:
+            future = self.executor.submit(write, path)
+            self.pending[path] = future
+        future.add_done_callback(lambda f: self._done(path, f))
+
+    def _done(self, path, future):
+        with self.lock:
+            if self.pending.get(path) is future:
+                del self.pending[path]
+        if future.exception() is not None:
+            logging.error("Failed to write {}: {}".format(path, future.exception()))
+
+    def is_pending(self, path):
+        with self.lock:
+            return os.path.abspath(path) in self.pending
+
+    def wait(self, path):
+        """Blocks until path is fully written if a write to it is pending."""
+        with self.lock:
+            future = self.pending.get(os.path.abspath(path))
+        if future is not None:
+            wait([future])
+
+    def flush(self, callback):
+        """Calls callback once every file submitted so far is written. Callbacks run in the order of the flush calls."""
+        if self.flusher is None:
+            callback()
+            return
+        with self.lock:
+            futures = list(self.pending.values())
+        self.flusher.submit(self._flush, futures, callback)
+
+    def _flush(self, futures, callback):
+        wait(futures)
+        try:
+            callback()
+        except Exception as e:
+            logging.exception("Error after writing outputs: {}".format(e))
+
+output_writer = OutputWriter(workers=2 if args.pipeline_prompts else 0)
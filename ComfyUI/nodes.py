@@ -4,12 +4,12 @@ import torch
 import os
 import sys
 import json
-import hashlib
 import traceback
 import math
 import time
 import random
 import logging
+import functools
 
 from PIL import Image, ImageOps, ImageSequence
 from PIL.PngImagePlugin import PngInfo
@@ -37,6 +37,8 @@ import importlib
 import folder_paths
 import latent_preview
 import node_helpers
+from comfyui_version import __version__
+from comfy_execution.node_registry import LazyModule, NodeClassMappings, NodeManifest, directory_fingerprint, file_fingerprint, record_node_info, source_fingerprint
 
 def before_node_execution():
     comfy.model_management.throw_exception_if_processing_interrupted()
@@ -460,6 +462,7 @@ class SaveLatent:
                 }
     RETURN_TYPES = ()
     FUNCTION = "save"
+    RESOURCE_TYPE = "io"
 
     OUTPUT_NODE = True
 
@@ -480,7 +483,7 @@ class SaveLatent:
                 for x in extra_pnginfo:
                     metadata[x] = json.dumps(extra_pnginfo[x])
 
-        file = f"{filename}_{counter:05}_.latent"
+        counter, file = folder_paths.reserve_save_file(full_output_folder, filename, counter, "_.latent")
 
         results: list[FileLocator] = []
         results.append({
@@ -510,6 +513,7 @@ class LoadLatent:
 
     RETURN_TYPES = ("LATENT", )
     FUNCTION = "load"
+    RESOURCE_TYPE = "io"
 
     def load(self, latent):
         latent_path = folder_paths.get_annotated_filepath(latent)
@@ -523,10 +527,7 @@ class LoadLatent:
     @classmethod
     def IS_CHANGED(s, latent):
         image_path = folder_paths.get_annotated_filepath(latent)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return node_helpers.file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, latent):
@@ -1570,6 +1571,7 @@ class SaveImage:
 
     RETURN_TYPES = ()
     FUNCTION = "save_images"
+    RESOURCE_TYPE = "io"
 
     OUTPUT_NODE = True
 
@@ -1593,8 +1595,8 @@ class SaveImage:
                         metadata.add_text(x, json.dumps(extra_pnginfo[x]))
 
             filename_with_batch_num = filename.replace("%batch_num%", str(batch_number))
-            file = f"{filename_with_batch_num}_{counter:05}_.png"
-            img.save(os.path.join(full_output_folder, file), pnginfo=metadata, compress_level=self.compress_level)
+            counter, file = folder_paths.reserve_save_file(full_output_folder, filename_with_batch_num, counter, "_.png")
+            node_helpers.output_writer.submit(os.path.join(full_output_folder, file), functools.partial(img.save, pnginfo=metadata, compress_level=self.compress_level))
             results.append({
                 "filename": file,
                 "subfolder": subfolder,
@@ -1632,6 +1634,7 @@ class LoadImage:
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "load_image"
+    RESOURCE_TYPE = "io"
     def load_image(self, image):
         image_path = folder_paths.get_annotated_filepath(image)
 
@@ -1682,10 +1685,7 @@ class LoadImage:
     @classmethod
     def IS_CHANGED(s, image):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return node_helpers.file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1709,6 +1709,7 @@ class LoadImageMask:
 
     RETURN_TYPES = ("MASK",)
     FUNCTION = "load_image"
+    RESOURCE_TYPE = "io"
     def load_image(self, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
         i = node_helpers.pillow(Image.open, image_path)
@@ -1731,10 +1732,7 @@ class LoadImageMask:
     @classmethod
     def IS_CHANGED(s, image, channel):
         image_path = folder_paths.get_annotated_filepath(image)
-        m = hashlib.sha256()
-        with open(image_path, 'rb') as f:
-            m.update(f.read())
-        return m.digest().hex()
+        return node_helpers.file_hash(image_path)
 
     @classmethod
     def VALIDATE_INPUTS(s, image):
@@ -1778,6 +1776,7 @@ class ImageScale:
                               "crop": (s.crop_methods,)}}
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "upscale"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image/upscaling"
 
@@ -1805,6 +1804,7 @@ class ImageScaleBy:
                               "scale_by": ("FLOAT", {"default": 1.0, "min": 0.01, "max": 8.0, "step": 0.01}),}}
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "upscale"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image/upscaling"
 
@@ -1824,6 +1824,7 @@ class ImageInvert:
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "invert"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image"
 
@@ -1839,6 +1840,7 @@ class ImageBatch:
 
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "batch"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image"
 
@@ -1861,6 +1863,7 @@ class EmptyImage:
                               }}
     RETURN_TYPES = ("IMAGE",)
     FUNCTION = "generate"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image"
 
@@ -1887,6 +1890,7 @@ class ImagePadForOutpaint:
 
     RETURN_TYPES = ("IMAGE", "MASK")
     FUNCTION = "expand_image"
+    RESOURCE_TYPE = "cpu"
 
     CATEGORY = "image"
 
@@ -1934,7 +1938,7 @@ class ImagePadForOutpaint:
         return (new_image, mask.unsqueeze(0))
 
 
-NODE_CLASS_MAPPINGS = {
+NODE_CLASS_MAPPINGS = NodeClassMappings({
     "KSampler": KSampler,
     "CheckpointLoaderSimple": CheckpointLoaderSimple,
     "CLIPTextEncode": CLIPTextEncode,
@@ -2002,7 +2006,7 @@ NODE_CLASS_MAPPINGS = {
     "ConditioningZeroOut": ConditioningZeroOut,
     "ConditioningSetTimestepRange": ConditioningSetTimestepRange,
     "LoraLoaderModelOnly": LoraLoaderModelOnly,
-}
+})
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     # Sampling
@@ -2073,6 +2077,41 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "VAEEncodeTiled": "VAE Encode (Tiled)",
 }
 
+def node_info(node_class):
+    """The description of a node class sent by /object_info."""
+    obj_class = NODE_CLASS_MAPPINGS[node_class]
+    info = {}
+    info['input'] = obj_class.INPUT_TYPES()
+    info['input_order'] = {key: list(value.keys()) for (key, value) in obj_class.INPUT_TYPES().items()}
+    info['output'] = obj_class.RETURN_TYPES
+    info['output_is_list'] = obj_class.OUTPUT_IS_LIST if hasattr(obj_class, 'OUTPUT_IS_LIST') else [False] * len(obj_class.RETURN_TYPES)
+    info['output_name'] = obj_class.RETURN_NAMES if hasattr(obj_class, 'RETURN_NAMES') else info['output']
+    info['name'] = node_class
+    info['display_name'] = NODE_DISPLAY_NAME_MAPPINGS[node_class] if node_class in NODE_DISPLAY_NAME_MAPPINGS.keys() else node_class
+    info['description'] = obj_class.DESCRIPTION if hasattr(obj_class,'DESCRIPTION') else ''
+    info['python_module'] = getattr(obj_class, "RELATIVE_PYTHON_MODULE", "nodes")
+    info['category'] = 'sd'
+    if hasattr(obj_class, 'OUTPUT_NODE') and obj_class.OUTPUT_NODE == True:
+        info['output_node'] = True
+    else:
+        info['output_node'] = False
+
+    if hasattr(obj_class, 'CATEGORY'):
+        info['category'] = obj_class.CATEGORY
+
+    if hasattr(obj_class, 'OUTPUT_TOOLTIPS'):
+        info['output_tooltips'] = obj_class.OUTPUT_TOOLTIPS
+
+    if getattr(obj_class, "DEPRECATED", False):
+        info['deprecated'] = True
+    if getattr(obj_class, "EXPERIMENTAL", False):
+        info['experimental'] = True
+
+    if hasattr(obj_class, 'API_NODE'):
+        info['api_node'] = obj_class.API_NODE
+    return info
+
+
 EXTENSION_WEB_DIRS = {}
 
 # Dictionary of successfully loaded module names and associated directories.
@@ -2258,9 +2297,15 @@ def init_builtin_extra_nodes():
         "nodes_preview_any.py",
         "nodes_ace.py",
         "nodes_string.py",
+        "nodes_prompt_batching.py",
         "nodes_camera_trajectory.py",
     ]
 
+    if args.lazy_node_imports:
+        # Many extra nodes list model files or the sampler names, which custom nodes extend, so their info isn't
+        # recorded: the first /object_info request imports every extras module
+        return init_lazy_nodes(extras_dir, extras_files, module_parent="comfy_extras")
+
     import_failed = []
     for node_file in extras_files:
         if not load_custom_node(os.path.join(extras_dir, node_file), module_parent="comfy_extras"):
@@ -2289,7 +2334,16 @@ def init_builtin_api_nodes():
         "nodes_gemini.py",
     ]
 
-    if not load_custom_node(os.path.join(api_nodes_dir, "canary.py"), module_parent="comfy_api_nodes"):
+    @functools.cache
+    def canary():
+        return load_custom_node(os.path.join(api_nodes_dir, "canary.py"), module_parent="comfy_api_nodes")
+
+    if args.lazy_node_imports:
+        # The inputs of API nodes are fixed lists of the service's options, except for the nodes that list the input directory
+        return init_lazy_nodes(api_nodes_dir, api_nodes_files, module_parent="comfy_api_nodes", requires=canary,
+                               record_info=True, dynamic_nodes={"GeminiInputFiles", "OpenAIInputFiles"})
+
+    if not canary():
         return api_nodes_files
 
     import_failed = []
@@ -2300,6 +2354,92 @@ def init_builtin_api_nodes():
     return import_failed
 
 
+node_manifest = None
+# Manifest entries of the modules imported by init_lazy_nodes, recorded by save_node_manifest
+pending_manifest_entries = []
+
+def get_node_manifest():
+    global node_manifest
+    if node_manifest is None:
+        base_dir = os.path.dirname(os.path.realpath(__file__))
+        # The manifest is redone when shared code or the installed custom nodes change, a change to a node module
+        # only redoes that module
+        node_modules = [os.path.join(base_dir, package, f) for package in ("comfy_extras", "comfy_api_nodes")
+                        for f in os.listdir(os.path.join(base_dir, package)) if f.startswith("nodes_")]
+        source = source_fingerprint([os.path.join(base_dir, package) for package in ("comfy", "comfy_api", "comfy_execution", "comfy_extras", "comfy_api_nodes")],
+                                    exclude=node_modules,
+                                    extra=[__version__, file_fingerprint(__file__), file_fingerprint(folder_paths.__file__),
+                                           directory_fingerprint(folder_paths.get_folder_paths("custom_nodes"))])
+        node_manifest = NodeManifest(os.path.join(folder_paths.get_user_directory(), "node_manifest.json"), source)
+    return node_manifest
+
+
+def load_lazy_module(module_path, module_parent, requires=None):
+    if requires is not None and not requires():
+        return False
+    return load_custom_node(module_path, module_parent=module_parent)
+
+
+def init_lazy_nodes(nodes_dir, node_files, module_parent, requires=None, record_info=False, dynamic_nodes=()):
+    """
+    Registers the nodes of node_files from the node manifest without importing their modules. A module is imported
+    when one of its nodes is first needed, modules that changed since the manifest was written are imported now and
+    recorded by save_node_manifest. requires is called before importing a module and returns False if none of them
+    can be imported.
+
+    With record_info the node info is kept in the manifest too, so /object_info doesn't import the module. Only
+    for modules whose INPUT_TYPES don't list files or read lists that other modules extend, such as the sampler
+    names, except for the nodes in dynamic_nodes.
+
+    Returns:
+        list: The files that failed to import.
+    """
+    manifest = get_node_manifest()
+    import_failed = []
+    lazy_nodes = 0
+    for node_file in node_files:
+        module_path = os.path.join(nodes_dir, node_file)
+        key = "{}/{}".format(module_parent, node_file)
+        try:
+            fingerprint = file_fingerprint(module_path)
+        except OSError:
+            import_failed.append(node_file)
+            continue
+
+        entry = manifest.get(key, fingerprint)
+        if entry is not None:
+            NODE_DISPLAY_NAME_MAPPINGS.update(entry["display_names"])
+            NODE_CLASS_MAPPINGS.add_lazy(LazyModule(module_path, entry["nodes"], functools.partial(load_lazy_module, module_path, module_parent, requires)))
+            LOADED_MODULE_DIRS[os.path.splitext(module_path)[0]] = os.path.abspath(nodes_dir)
+            lazy_nodes += len(entry["nodes"])
+            continue
+
+        # Failed imports aren't recorded so they are retried on the next start
+        if not load_lazy_module(module_path, module_parent, requires):
+            import_failed.append(node_file)
+            continue
+        module = sys.modules[os.path.splitext(module_path)[0]]
+        names = list(module.NODE_CLASS_MAPPINGS)
+        display_names = getattr(module, "NODE_DISPLAY_NAME_MAPPINGS", None) or {}
+        recorded = [name for name in names if name not in dynamic_nodes] if record_info else []
+        pending_manifest_entries.append((key, fingerprint, names, recorded, {name: display_names[name] for name in names if name in display_names}))
+
+    logging.debug("Registered {} {} nodes without importing their modules".format(lazy_nodes, module_parent))
+    return import_failed
+
+
+def save_node_manifest():
+    """
+    Records the modules imported by init_lazy_nodes in the node manifest. Called once custom nodes are loaded, so
+    the recorded node info is what /object_info would have sent.
+    """
+    manifest = get_node_manifest()
+    for key, fingerprint, names, recorded, display_names in pending_manifest_entries:
+        manifest.set(key, fingerprint, {name: record_node_info(node_info, name) if name in recorded else None for name in names}, display_names)
+    pending_manifest_entries.clear()
+    manifest.save()
+
+
 def init_extra_nodes(init_custom_nodes=True, init_api_nodes=True):
     import_failed = init_builtin_extra_nodes()
 
@@ -2312,6 +2452,9 @@ def init_extra_nodes(init_custom_nodes=True, init_api_nodes=True):
     else:
         logging.info("Skipping loading of custom nodes")
 
+    if args.lazy_node_imports:
+        save_node_manifest()
+
     if len(import_failed_api) > 0:
         logging.warning("WARNING: some comfy_api_nodes/ nodes did not import correctly. This may be because they are missing some dependencies.\n")
         for node in import_failed_api:
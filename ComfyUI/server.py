@@ -2,6 +2,7 @@ import os
 import sys
 import asyncio
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import nodes
 import folder_paths
@@ -14,7 +15,7 @@ import struct
 import ssl
 import socket
 import ipaddress
-from PIL import Image, ImageOps
+from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 from io import BytesIO
 
@@ -33,6 +34,11 @@ from app.frontend_management import FrontendManager
 from app.user_manager import UserManager
 from app.model_manager import ModelFileManager
 from app.custom_node_manager import CustomNodeManager
+from app.event_loop_monitor import EventLoopLagMonitor
+from app.history_store import HistoryStore
+from app.websocket_sender import WebSocketSender
+from app.preview_throttle import PreviewThrottle, encode_preview
+from app.object_info_cache import ObjectInfoCache, etag_matches
 from typing import Optional, Union
 from api_server.routes.internal.internal_routes import InternalRoutes
 
@@ -41,11 +47,43 @@ class BinaryEventTypes:
     UNENCODED_PREVIEW_IMAGE = 2
     TEXT = 3
 
-async def send_socket_catch_exception(function, message):
+# Longest a /prompt/{prompt_id}/wait request is held open, in seconds
+MAX_PROMPT_WAIT = 300
+
+def prompt_result(prompt_id, history_entry):
+    result = {"prompt_id": prompt_id}
+    result.update((k, v) for k, v in history_entry.items() if k != "prompt")
+    return result
+
+def coalesce_key(event, data):
+    """Messages with the same key supersede each other in a client's send queue."""
+    if event == "progress":
+        return ("progress", data.get("prompt_id"), data.get("node"))
+    if event == "status":
+        # The initial status tells a new client its sid, a later broadcast must not replace it
+        if "sid" in data:
+            return None
+        return ("status",)
+    if event == BinaryEventTypes.PREVIEW_IMAGE:
+        # data has the prompt and node the preview is of
+        data = data or {}
+        return ("preview", data.get("prompt_id"), data.get("node"))
+    return None
+
+def get_mtime(path):
     try:
-        await function(message)
-    except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError) as err:
-        logging.warning("send error: {}".format(err))
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def object_info_version():
+    """
+    Changes whenever the /object_info payload could: when nodes are registered or replaced, when a file list
+    changes and when files are added to the folders that some nodes list themselves.
+    """
+    registry = nodes.NODE_CLASS_MAPPINGS.version()
+    diffusers = tuple(get_mtime(d) for d in folder_paths.get_folder_paths("diffusers"))
+    return (registry, folder_paths.get_filename_list_version(), folder_paths.get_input_directory_version(), diffusers)
 
 @web.middleware
 async def cache_control(request: web.Request, handler):
@@ -63,6 +101,8 @@ async def compress_body(request: web.Request, handler):
         return response
     if response.content_type not in ["application/json", "text/plain"]:
         return response
+    if "Content-Encoding" in response.headers:
+        return response
     if response.body and "gzip" in accept_encoding:
         response.enable_compression()
     return response
@@ -160,11 +200,23 @@ class PromptServer():
         self.custom_node_manager = CustomNodeManager()
         self.internal_routes = InternalRoutes(self)
         self.supports = ["custom_nodes_from_web"]
-        self.prompt_queue = execution.PromptQueue(self)
+        history_db = args.history_db
+        if history_db is None:
+            history_db = os.path.join(folder_paths.get_user_directory(), "history.sqlite3")
+        history_max_age = None if args.history_max_age is None else args.history_max_age * 24 * 60 * 60
+        self.prompt_queue = execution.PromptQueue(self, HistoryStore(history_db, max_items=args.history_max_items, max_age=history_max_age))
         self.loop = loop
         self.messages = asyncio.Queue()
         self.client_session:Optional[aiohttp.ClientSession] = None
         self.number = 0
+        # Prompt validation can hash files and list folders, so it runs off the event loop
+        self.validation_executor = ThreadPoolExecutor(max_workers=args.validation_workers, thread_name_prefix="prompt-validation")
+        self.validation_slots = {}
+        self.validations_in_flight = 0
+        self.lag_monitor = EventLoopLagMonitor()
+        # prompt_id -> futures of the /prompt/{prompt_id}/wait requests waiting for it
+        self.prompt_waiters = {}
+        self.prompt_queue.add_task_done_listener(self.prompt_done)
 
         middlewares = [cache_control]
         if args.enable_compress_response_body:
@@ -178,6 +230,10 @@ class PromptServer():
         max_upload_size = round(args.max_upload_size * 1024 * 1024)
         self.app = web.Application(client_max_size=max_upload_size, middlewares=middlewares)
         self.sockets = dict()
+        self.socket_senders = dict()
+        self.preview_throttle = PreviewThrottle(max_fps=args.preview_max_fps)
+        # Encoding previews on the event loop would stall every request
+        self.preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview-encode")
         self.web_root = (
             FrontendManager.init_frontend(args.front_end_version)
             if args.front_end_root is None
@@ -188,6 +244,8 @@ class PromptServer():
         self.routes = routes
         self.last_node_id = None
         self.client_id = None
+        # Off while a batch of prompts is sampled together, whose progress belongs to no single client
+        self.progress_enabled = True
 
         self.on_prompt_handlers = []
 
@@ -199,10 +257,15 @@ class PromptServer():
             if sid:
                 # Reusing existing session, remove old
                 self.sockets.pop(sid, None)
+                old_sender = self.socket_senders.pop(sid, None)
+                if old_sender is not None:
+                    old_sender.stop()
             else:
                 sid = uuid.uuid4().hex
 
+            sender = WebSocketSender(ws, max_queue=args.websocket_queue_size, send_timeout=args.websocket_send_timeout).start()
             self.sockets[sid] = ws
+            self.socket_senders[sid] = sender
 
             try:
                 # Send initial state to the new client
@@ -214,8 +277,14 @@ class PromptServer():
                 async for msg in ws:
                     if msg.type == aiohttp.WSMsgType.ERROR:
                         logging.warning('ws connection closed with exception %s' % ws.exception())
+                    elif msg.type == aiohttp.WSMsgType.TEXT:
+                        self.handle_client_message(sid, msg.data)
             finally:
-                self.sockets.pop(sid, None)
+                sender.stop()
+                if self.sockets.get(sid) is ws:
+                    self.sockets.pop(sid, None)
+                    self.socket_senders.pop(sid, None)
+                    self.preview_throttle.remove(sid)
             return ws
 
         @routes.get("/")
@@ -273,17 +342,17 @@ class PromptServer():
             return type_dir, dir_type
 
         def compare_image_hash(filepath, image):
-            hasher = node_helpers.hasher()
-
             # function to compare hashes of two images to see if it already exists, fix to #3465
             if os.path.exists(filepath):
-                a = hasher()
-                b = hasher()
-                with open(filepath, "rb") as f:
-                    a.update(f.read())
-                    b.update(image.file.read())
-                    image.file.seek(0)
-                return a.hexdigest() == b.hexdigest()
+                image.file.seek(0, os.SEEK_END)
+                size = image.file.tell()
+                image.file.seek(0)
+                if size != os.path.getsize(filepath):
+                    return False
+                b = node_helpers.hasher()()
+                b.update(image.file.read())
+                image.file.seek(0)
+                return node_helpers.file_hash(filepath, args.default_hashing_function) == b.hexdigest()
             return False
 
         def image_upload(post, image_save_function=None):
@@ -329,6 +398,8 @@ class PromptServer():
                     else:
                         with open(filepath, "wb") as f:
                             f.write(image.file.read())
+                    # LoadImage's IS_CHANGED will hash this file when it is used in a prompt
+                    node_helpers.file_hash_cache.prefetch(filepath)
 
                 return web.json_response({"name" : filename, "subfolder": subfolder, "type": image_upload_type})
             else:
@@ -415,6 +486,9 @@ class PromptServer():
                 filename = os.path.basename(filename)
                 file = os.path.join(output_dir, filename)
 
+                if node_helpers.output_writer.is_pending(file):
+                    await asyncio.get_running_loop().run_in_executor(None, node_helpers.output_writer.wait, file)
+
                 if os.path.isfile(file):
                     if 'preview' in request.rel_url.query:
                         with Image.open(file) as img:
@@ -546,71 +620,108 @@ class PromptServer():
                     }
                 ]
             }
+            system_stats["event_loop"] = self.lag_monitor.get_stats()
+            system_stats["validation"] = {
+                "workers": args.validation_workers,
+                "in_flight": self.validations_in_flight,
+                "clients": len(self.validation_slots),
+            }
+            system_stats["websockets"] = [dict(client=sid[:8], **sender.get_stats()) for sid, sender in list(self.socket_senders.items())]
             return web.json_response(system_stats)
 
         @routes.get("/prompt")
         async def get_prompt(request):
             return web.json_response(self.get_queue_info())
 
-        def node_info(node_class):
-            obj_class = nodes.NODE_CLASS_MAPPINGS[node_class]
-            info = {}
-            info['input'] = obj_class.INPUT_TYPES()
-            info['input_order'] = {key: list(value.keys()) for (key, value) in obj_class.INPUT_TYPES().items()}
-            info['output'] = obj_class.RETURN_TYPES
-            info['output_is_list'] = obj_class.OUTPUT_IS_LIST if hasattr(obj_class, 'OUTPUT_IS_LIST') else [False] * len(obj_class.RETURN_TYPES)
-            info['output_name'] = obj_class.RETURN_NAMES if hasattr(obj_class, 'RETURN_NAMES') else info['output']
-            info['name'] = node_class
-            info['display_name'] = nodes.NODE_DISPLAY_NAME_MAPPINGS[node_class] if node_class in nodes.NODE_DISPLAY_NAME_MAPPINGS.keys() else node_class
-            info['description'] = obj_class.DESCRIPTION if hasattr(obj_class,'DESCRIPTION') else ''
-            info['python_module'] = getattr(obj_class, "RELATIVE_PYTHON_MODULE", "nodes")
-            info['category'] = 'sd'
-            if hasattr(obj_class, 'OUTPUT_NODE') and obj_class.OUTPUT_NODE == True:
-                info['output_node'] = True
-            else:
-                info['output_node'] = False
-
-            if hasattr(obj_class, 'CATEGORY'):
-                info['category'] = obj_class.CATEGORY
-
-            if hasattr(obj_class, 'OUTPUT_TOOLTIPS'):
-                info['output_tooltips'] = obj_class.OUTPUT_TOOLTIPS
-
-            if getattr(obj_class, "DEPRECATED", False):
-                info['deprecated'] = True
-            if getattr(obj_class, "EXPERIMENTAL", False):
-                info['experimental'] = True
-
-            if hasattr(obj_class, 'API_NODE'):
-                info['api_node'] = obj_class.API_NODE
-            return info
+        @routes.get("/prompt/{prompt_id}/wait")
+        async def wait_prompt(request):
+            prompt_id = request.match_info["prompt_id"]
+            try:
+                timeout = min(max(float(request.rel_url.query.get("timeout", 30)), 0), MAX_PROMPT_WAIT)
+            except ValueError:
+                return web.json_response({"error": "invalid timeout"}, status=400)
+
+            # A prompt is added to the history before it stops running, so it is always found in one of them
+            pending = self.prompt_queue.has_prompt(prompt_id)
+            entry = self.prompt_queue.get_history(prompt_id=prompt_id).get(prompt_id)
+            if entry is not None:
+                return web.json_response(prompt_result(prompt_id, entry))
+            if not pending:
+                return web.json_response({"error": "prompt not found"}, status=404)
+
+            future = self.loop.create_future()
+            waiters = self.prompt_waiters.setdefault(prompt_id, [])
+            waiters.append(future)
+            try:
+                entry = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return web.json_response({"prompt_id": prompt_id, "pending": True}, status=202)
+            finally:
+                if future in waiters:
+                    waiters.remove(future)
+                if len(waiters) == 0 and self.prompt_waiters.get(prompt_id) is waiters:
+                    del self.prompt_waiters[prompt_id]
+            return web.json_response(prompt_result(prompt_id, entry))
 
-        @routes.get("/object_info")
-        async def get_object_info(request):
+        def build_object_info():
             with folder_paths.cache_helper:
                 out = {}
-                for x in nodes.NODE_CLASS_MAPPINGS:
+                for x in list(nodes.NODE_CLASS_MAPPINGS):
                     try:
-                        out[x] = node_info(x)
+                        # Nodes that haven't been imported yet are described by the node manifest
+                        info = nodes.NODE_CLASS_MAPPINGS.static_info(x)
+                        out[x] = info if info is not None else nodes.node_info(x)
                     except Exception:
                         logging.error(f"[ERROR] An error occurred while retrieving information for the '{x}' node.")
                         logging.error(traceback.format_exc())
-                return web.json_response(out)
+                return out
+
+        # Building the payload calls every INPUT_TYPES, it is only redone when something it depends on changed
+        self.object_info = ObjectInfoCache(build_object_info, object_info_version)
+
+        @routes.get("/object_info")
+        async def get_object_info(request):
+            since = request.rel_url.query.get("since")
+            if since is not None:
+                # Unknown revisions, such as ones from before a restart, get the full payload
+                info, body = await asyncio.get_running_loop().run_in_executor(None, self.object_info.diff_body, since)
+                return web.Response(body=body, content_type="application/json",
+                                    headers={"X-Object-Info-Revision": info.revision})
+
+            info = await asyncio.get_running_loop().run_in_executor(None, self.object_info.get)
+            headers = {"ETag": info.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+                       "X-Object-Info-Revision": info.revision}
+            if etag_matches(request.headers.get("If-None-Match"), info.etag):
+                return web.Response(status=304, headers=headers)
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                headers["Content-Encoding"] = "gzip"
+                return web.Response(body=info.gzip_body, content_type="application/json", headers=headers)
+            return web.Response(body=info.body, content_type="application/json", headers=headers)
 
         @routes.get("/object_info/{node_class}")
         async def get_object_info_node(request):
             node_class = request.match_info.get("node_class", None)
             out = {}
             if (node_class is not None) and (node_class in nodes.NODE_CLASS_MAPPINGS):
-                out[node_class] = node_info(node_class)
+                out[node_class] = nodes.node_info(node_class)
             return web.json_response(out)
 
         @routes.get("/history")
         async def get_history(request):
-            max_items = request.rel_url.query.get("max_items", None)
+            query = request.rel_url.query
+            max_items = query.get("max_items", None)
             if max_items is not None:
                 max_items = int(max_items)
-            return web.json_response(self.prompt_queue.get_history(max_items=max_items))
+            before = query.get("before", None)
+            if before is not None:
+                before = int(before)
+            history, cursor = self.prompt_queue.get_history_page(max_items=max_items, status=query.get("status", None),
+                                                                 before=before, filename=query.get("filename", None))
+            headers = {}
+            if cursor is not None:
+                # Pass as before to get the previous page
+                headers["X-History-Cursor"] = str(cursor)
+            return web.json_response(history, headers=headers)
 
         @routes.get("/history/{prompt_id}")
         async def get_history_prompt_id(request):
@@ -643,13 +754,19 @@ class PromptServer():
 
             if "prompt" in json_data:
                 prompt = json_data["prompt"]
-                valid = execution.validate_prompt(prompt)
+                valid = await self.validate_prompt(prompt, json_data.get("client_id") or request.remote)
                 extra_data = {}
                 if "extra_data" in json_data:
                     extra_data = json_data["extra_data"]
 
                 if "client_id" in json_data:
                     extra_data["client_id"] = json_data["client_id"]
+                if "webhook" in extra_data:
+                    webhook = extra_data["webhook"]
+                    if not args.enable_prompt_webhooks:
+                        return web.json_response({"error": "webhooks are disabled, start the server with --enable-prompt-webhooks", "node_errors": {}}, status=400)
+                    if not isinstance(webhook, str) or urllib.parse.urlparse(webhook).scheme not in ("http", "https"):
+                        return web.json_response({"error": "webhook must be an http(s) URL", "node_errors": {}}, status=400)
                 if valid[0]:
                     prompt_id = str(uuid.uuid4())
                     outputs_to_execute = valid[2]
@@ -756,6 +873,32 @@ class PromptServer():
             web.static('/', self.web_root),
         ])
 
+    def prompt_done(self, prompt_id, entry):
+        # Called from the prompt worker thread
+        self.loop.call_soon_threadsafe(self.resolve_prompt, prompt_id, entry)
+
+    def resolve_prompt(self, prompt_id, entry):
+        for future in self.prompt_waiters.pop(prompt_id, []):
+            if not future.done():
+                future.set_result(entry)
+
+        webhook = entry["prompt"][3].get("webhook")
+        if webhook is not None and args.enable_prompt_webhooks:
+            self.loop.create_task(self.post_webhook(webhook, prompt_result(prompt_id, entry)))
+
+    async def post_webhook(self, url, data, attempts=3):
+        for attempt in range(attempts):
+            try:
+                async with self.client_session.post(url, json=data, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    if response.status < 500:
+                        if response.status >= 400:
+                            logging.warning("Webhook {} for prompt {} returned {}".format(url, data["prompt_id"], response.status))
+                        return
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.debug("Webhook {} for prompt {} failed: {}".format(url, data["prompt_id"], e))
+            await asyncio.sleep(2 ** attempt)
+        logging.warning("Giving up on webhook {} for prompt {}".format(url, data["prompt_id"]))
+
     def get_queue_info(self):
         prompt_info = {}
         exec_info = {}
@@ -781,48 +924,50 @@ class PromptServer():
         return message
 
     async def send_image(self, image_data, sid=None):
-        image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-        type_num = 1
-        if image_type == "JPEG":
-            type_num = 1
-        elif image_type == "PNG":
-            type_num = 2
-
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
-        await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
+        settings = self.preview_throttle.begin(sid, default_format=image_data[0])
+        if settings is None:
+            # The client doesn't want another preview yet
+            return
+        self.loop.create_task(self.encode_and_send_image(image_data, settings, sid))
+
+    async def encode_and_send_image(self, image_data, settings, sid):
+        try:
+            image_format, quality = settings
+            preview_bytes = await self.loop.run_in_executor(self.preview_executor, encode_preview, image_data[1], image_data[2], image_format, quality)
+        except Exception:
+            logging.exception("Failed to encode preview image")
+            return
+        finally:
+            self.preview_throttle.end(sid)
+        # The progress hook appends the prompt and node to the preview
+        source = dict(zip(("prompt_id", "node"), image_data[3:5]))
+        message = self.encode_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes)
+        self.queue_message(message, coalesce_key(BinaryEventTypes.PREVIEW_IMAGE, source), sid)
+
+    def handle_client_message(self, sid, data):
+        try:
+            message = json.loads(data)
+            if not isinstance(message, dict):
+                return
+            if message.get("type") == "preview_settings":
+                self.preview_throttle.configure(sid, message.get("data") or {})
+        except (ValueError, TypeError) as e:
+            logging.warning("Invalid message from websocket client: {}".format(e))
 
     async def send_bytes(self, event, data, sid=None):
         message = self.encode_bytes(event, data)
-
-        if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_bytes, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_bytes, message)
+        self.queue_message(message, coalesce_key(event, None), sid)
 
     async def send_json(self, event, data, sid=None):
         message = {"type": event, "data": data}
+        self.queue_message(message, coalesce_key(event, data), sid)
 
+    def queue_message(self, message, key, sid=None):
         if sid is None:
-            sockets = list(self.sockets.values())
-            for ws in sockets:
-                await send_socket_catch_exception(ws.send_json, message)
-        elif sid in self.sockets:
-            await send_socket_catch_exception(self.sockets[sid].send_json, message)
+            for sender in list(self.socket_senders.values()):
+                sender.put(message, key)
+        elif sid in self.socket_senders:
+            self.socket_senders[sid].put(message, key)
 
     def send_sync(self, event, data, sid=None):
         self.loop.call_soon_threadsafe(
@@ -831,6 +976,30 @@ class PromptServer():
     def queue_updated(self):
         self.send_sync("status", { "status": self.get_queue_info() })
 
+    async def validate_prompt(self, prompt, client_key):
+        """
+        Runs execution.validate_prompt on the validation pool. Each client
+        (client_id, or remote address without one) can have at most
+        --max-client-validations prompts validating at once; further
+        requests wait their turn without holding a pool thread.
+        """
+        slot = self.validation_slots.get(client_key)
+        if slot is None:
+            slot = [asyncio.Semaphore(args.max_client_validations), 0]
+            self.validation_slots[client_key] = slot
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                self.validations_in_flight += 1
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self.validation_executor, execution.validate_prompt, prompt)
+                finally:
+                    self.validations_in_flight -= 1
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self.validation_slots[client_key]
+
     async def publish_loop(self):
         while True:
             msg = await self.messages.get()
@@ -842,6 +1011,7 @@ class PromptServer():
     async def start_multi_address(self, addresses, call_on_start=None, verbose=True):
         runner = web.AppRunner(self.app, access_log=None)
         await runner.setup()
+        self.lag_monitor_task = asyncio.create_task(self.lag_monitor.run())
         ssl_ctx = None
         scheme = "http"
         if args.tls_keyfile and args.tls_certfile:
@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+
+from app.event_loop_monitor import EventLoopLagMonitor
+
+
+@pytest.mark.asyncio
+async def test_measures_blocked_loop():
+    monitor = EventLoopLagMonitor(interval=0.01, warn_threshold=0.1)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.05)
+    time.sleep(0.2)  # Block the loop the way synchronous work in a handler would
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    stats = monitor.get_stats()
+    assert stats["max_lag_ms"] >= 150
+    assert stats["recent_max_lag_ms"] >= 150
+    assert stats["stalls"] == 1
+    assert monitor.samples > 2
+
+
+@pytest.mark.asyncio
+async def test_idle_loop_has_little_lag():
+    monitor = EventLoopLagMonitor(interval=0.01)
+    task = asyncio.create_task(monitor.run())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    assert monitor.stalls == 0
+    assert monitor.get_stats()["avg_lag_ms"] < 50
+
+
+def test_empty_stats():
+    assert EventLoopLagMonitor().get_stats()["lag_ms"] == 0.0
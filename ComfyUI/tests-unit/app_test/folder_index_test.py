@@ -0,0 +1,175 @@
+import os
+import time
+
+import pytest
+
+import folder_paths
+import app.folder_index
+from app.folder_index import DirectoryIndex, FolderIndex, Inotify, crawl
+from concurrent.futures import ThreadPoolExecutor
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 5))
+
+
+def test_directory_index(tmp_path):
+    root = str(tmp_path)
+    touch(os.path.join(root, "a.safetensors"))
+    touch(os.path.join(root, "sub", "b.safetensors"))
+    touch(os.path.join(root, ".git", "config"))
+
+    index = DirectoryIndex(root, [".git"])
+    index.scan_tree()
+    assert index.files == {"a.safetensors", os.path.join("sub", "b.safetensors")}
+    assert set(index.dir_mtimes()) == {root, os.path.join(root, "sub")}
+
+    touch(os.path.join(root, "sub", "deeper", "c.safetensors"))
+    os.remove(os.path.join(root, "a.safetensors"))
+    bump_mtime(os.path.join(root, "sub"))
+    bump_mtime(root)
+    version = index.version
+    added, removed = index.refresh()
+    assert added == [os.path.join("sub", "deeper")]
+    assert index.files == {os.path.join("sub", "b.safetensors"), os.path.join("sub", "deeper", "c.safetensors")}
+    assert index.version > version
+
+    os.remove(os.path.join(root, "sub", "b.safetensors"))
+    os.remove(os.path.join(root, "sub", "deeper", "c.safetensors"))
+    os.rmdir(os.path.join(root, "sub", "deeper"))
+    os.rmdir(os.path.join(root, "sub"))
+    added, removed = index.refresh()
+    assert sorted(removed) == ["sub", os.path.join("sub", "deeper")]
+    assert index.files == set()
+
+
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_folder_index_follows_changes(tmp_path, use_inotify):
+    if use_inotify:
+        try:
+            Inotify()
+        except OSError:
+            pytest.skip("inotify is not available")
+    folder = FolderIndex(poll_interval=0.05, use_inotify=use_inotify)
+    root = str(tmp_path)
+    touch(os.path.join(root, "a.safetensors"))
+    files, _ = folder.list_files(root)
+    assert files == ["a.safetensors"]
+    version = folder.version([root])
+
+    touch(os.path.join(root, "new", "b.safetensors"))
+    if not use_inotify:
+        bump_mtime(root)
+    assert wait_for(lambda: folder.find([root], os.path.join("new", "b.safetensors")) is not None)
+    assert folder.version([root]) != version
+    assert folder.find([str(tmp_path / "missing"), root], "a.safetensors") == os.path.join(root, "a.safetensors")
+    assert folder.find([root], "missing.safetensors") is None
+
+
+def test_folder_paths_with_index(tmp_path, monkeypatch):
+    first = str(tmp_path / "first")
+    second = str(tmp_path / "second")
+    touch(os.path.join(first, "model.safetensors"))
+    touch(os.path.join(second, "model.safetensors"))
+    touch(os.path.join(second, "other.safetensors"))
+    touch(os.path.join(second, "notes.txt"))
+
+    monkeypatch.setattr(folder_paths, "folder_index", FolderIndex(poll_interval=0.05, use_inotify=False))
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "index_test", ([first, second], {".safetensors"}))
+    assert folder_paths.get_filename_list("index_test") == ["model.safetensors", "other.safetensors"]
+    assert folder_paths.get_full_path("index_test", "model.safetensors") == os.path.join(first, "model.safetensors")
+    assert folder_paths.get_full_path("index_test", "other.safetensors") == os.path.join(second, "other.safetensors")
+
+    touch(os.path.join(first, "added.safetensors"))
+    bump_mtime(first)
+    assert wait_for(lambda: "added.safetensors" in folder_paths.get_filename_list("index_test"))
+    folder_paths.filename_list_cache.pop("index_test", None)
+
+
+def test_filename_list_version_with_index(tmp_path, monkeypatch):
+    models = str(tmp_path / "models")
+    touch(os.path.join(models, "model.safetensors"))
+    monkeypatch.setattr(folder_paths, "folder_index", FolderIndex(poll_interval=0.05, use_inotify=False))
+    monkeypatch.setattr(folder_paths, "filename_list_cache", {})
+    monkeypatch.setattr(folder_paths, "filename_list_checked", None)
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "index_test", ([models], {".safetensors"}))
+    folder_paths.get_filename_list("index_test")
+    version = folder_paths.get_filename_list_version()
+
+    # Unchanged folders aren't looked at again
+    with monkeypatch.context() as m:
+        m.setattr(folder_paths, "get_filename_list", lambda name: pytest.fail("rechecked " + name))
+        m.setattr(os.path, "getmtime", lambda path: pytest.fail("stat " + path))
+        assert folder_paths.get_filename_list_version() == version
+
+    touch(os.path.join(models, "added.safetensors"))
+    bump_mtime(models)
+    assert wait_for(lambda: folder_paths.get_filename_list_version() != version)
+
+
+def make_tree(root, dirs=20, files=5):
+    for d in range(dirs):
+        for f in range(files):
+            touch(os.path.join(root, "d{}".format(d % 4), "e{}".format(d), "f{}.safetensors".format(f)))
+    touch(os.path.join(root, ".hidden", "x.safetensors"))
+
+
+def test_parallel_scan_matches_walk(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    expected = set()
+    for dirpath, _, filenames in os.walk(root):
+        expected.update(os.path.relpath(os.path.join(dirpath, f), root) for f in filenames)
+
+    with ThreadPoolExecutor(4) as executor:
+        index = DirectoryIndex(root)
+        index.scan_tree("", executor)
+    assert index.files == expected
+    assert len(index.dirs) == 1 + 4 + 20 + 1
+
+    hidden = crawl(root, exclude_hidden_dirs=True, workers=4)
+    assert hidden.files == {f for f in expected if not f.startswith(".hidden")}
+
+
+def test_snapshot_only_rereads_changed_dirs(tmp_path, monkeypatch):
+    root = str(tmp_path / "models")
+    snapshots = str(tmp_path / "snapshots")
+    make_tree(root)
+    first = crawl(root, workers=4, snapshot_dir=snapshots)
+    assert len(os.listdir(snapshots)) == 1
+
+    reads = []
+    original = app.folder_index.read_dir
+    monkeypatch.setattr(app.folder_index, "read_dir", lambda path, *a: reads.append(path) or original(path, *a))
+    second = crawl(root, workers=4, snapshot_dir=snapshots)
+    assert reads == []
+    assert second.files == first.files
+    assert second.dirs["d0"][1] == {}
+
+    touch(os.path.join(root, "d1", "e1", "new.safetensors"))
+    bump_mtime(os.path.join(root, "d1", "e1"))
+    third = crawl(root, workers=4, snapshot_dir=snapshots)
+    assert reads == [os.path.join(root, "d1", "e1")]
+    assert os.path.join("d1", "e1", "new.safetensors") in third.files
+    size, mtime = third.dirs[os.path.join("d1", "e1")][1]["new.safetensors"]
+    assert size == 0 and mtime > 0
+
+    # The updated snapshot is used next time
+    reads.clear()
+    assert crawl(root, workers=4, snapshot_dir=snapshots).files == third.files
+    assert reads == []
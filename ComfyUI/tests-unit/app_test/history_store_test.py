@@ -0,0 +1,98 @@
+import time
+
+from app.history_store import HistoryStore
+
+
+def make_entry(prompt_id, status="success", filenames=()):
+    images = [{"filename": f, "subfolder": "", "type": "output"} for f in filenames]
+    return {
+        "prompt": [0, prompt_id, {}, {}, []],
+        "outputs": {"9": {"images": images}},
+        "status": {"status_str": status, "completed": status == "success", "messages": []},
+    }
+
+
+def test_put_get_and_persistence(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    store = HistoryStore(path, hot_size=2)
+    for i in range(4):
+        store.put("p{}".format(i), make_entry("p{}".format(i)))
+    assert len(store) == 4
+    assert store.get("p3")["prompt"][1] == "p3"
+    assert store.get("missing") is None
+    store.db.close()
+
+    reopened = HistoryStore(path, hot_size=2)
+    assert len(reopened) == 4
+    assert list(reopened.hot) == ["p2", "p3"]
+    # Older entries are read from the database
+    assert reopened.get("p0") == make_entry("p0")
+
+
+def test_legacy_paging():
+    store = HistoryStore()
+    for i in range(5):
+        store.put("p{}".format(i), make_entry("p{}".format(i)))
+    ids = lambda page: [prompt_id for _, prompt_id, _ in page]
+    assert ids(store.get_page()) == ["p0", "p1", "p2", "p3", "p4"]
+    assert ids(store.get_page(max_items=2)) == ["p3", "p4"]
+    assert ids(store.get_page(max_items=2, offset=1)) == ["p1", "p2"]
+
+
+def test_cursor_filters_and_delete():
+    store = HistoryStore()
+    store.put("a", make_entry("a", filenames=["a_00001_.png"]))
+    store.put("b", make_entry("b", status="error"))
+    store.put("c", make_entry("c", filenames=["c_00001_.png", "c_00002_.png"]))
+    store.put("d", make_entry("d"))
+
+    page = store.get_page(max_items=2)
+    assert [k for _, k, _ in page] == ["c", "d"]
+    older = store.get_page(max_items=2, before=page[0][0])
+    assert [k for _, k, _ in older] == ["a", "b"]
+    newer = store.get_page(max_items=10, after=older[-1][0])
+    assert [k for _, k, _ in newer] == ["c", "d"]
+
+    assert [k for _, k, _ in store.get_page(status="error")] == ["b"]
+    assert [k for _, k, _ in store.get_page(filename="c_00002_.png")] == ["c"]
+
+    store.delete("c")
+    assert store.get("c") is None
+    assert store.get_page(filename="c_00002_.png") == []
+    store.clear()
+    assert len(store) == 0
+
+
+def test_rerun_replaces_entry():
+    store = HistoryStore()
+    store.put("a", make_entry("a"))
+    store.put("b", make_entry("b"))
+    store.put("a", make_entry("a", status="error"))
+    assert len(store) == 2
+    assert [k for _, k, _ in store.get_page()] == ["b", "a"]
+    assert store.get("a")["status"]["status_str"] == "error"
+
+
+def test_retention(monkeypatch):
+    store = HistoryStore(max_items=3, hot_size=10)
+    for i in range(5):
+        store.put("p{}".format(i), make_entry("p{}".format(i)))
+    assert [k for _, k, _ in store.get_page()] == ["p2", "p3", "p4"]
+    assert store.get("p0") is None
+
+    store = HistoryStore(max_age=60)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now - 120)
+    store.put("old", make_entry("old"))
+    monkeypatch.setattr(time, "time", lambda: now)
+    store.put("new", make_entry("new"))
+    assert store.get("old") is None
+    assert store.get("new") is not None
+
+
+def test_unreadable_database_falls_back_to_memory(tmp_path):
+    path = tmp_path / "history.sqlite3"
+    path.write_bytes(b"not a database" * 100)
+    store = HistoryStore(str(path))
+    store.put("a", make_entry("a"))
+    assert store.get("a") is not None
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+from app.object_info_cache import ObjectInfoCache, etag_matches
+
+
+class Registry:
+    def __init__(self):
+        self.nodes = {"A": {"input": {"required": {}}}, "B": {"category": "b"}}
+        self.version = 0
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return {name: dict(info) for name, info in self.nodes.items()}
+
+
+def test_payload_is_built_once():
+    registry = Registry()
+    cache = ObjectInfoCache(registry.build, lambda: registry.version)
+    info = cache.get()
+    assert cache.get() is info
+    assert registry.builds == 1
+    assert json.loads(info.body) == registry.nodes
+    assert gzip.decompress(info.gzip_body) == info.body
+
+    # A new version with the same payload keeps the revision and ETag
+    registry.version += 1
+    assert cache.get() == info
+    assert registry.builds == 2
+
+    registry.nodes["C"] = {}
+    registry.version += 1
+    changed = cache.get()
+    assert changed.revision == "{}-2".format(cache.epoch)
+    assert changed.etag != info.etag
+
+    cache.invalidate()
+    cache.get()
+    assert registry.builds == 4
+
+
+def test_diff():
+    registry = Registry()
+    cache = ObjectInfoCache(registry.build, lambda: registry.version, max_history=2)
+    first = cache.get().revision
+    second = "{}-2".format(cache.epoch)
+
+    registry.nodes["A"] = {"input": {"required": {"ckpt": [["a.safetensors"]]}}}
+    registry.nodes["C"] = {}
+    del registry.nodes["B"]
+    registry.version += 1
+    _, body = cache.diff_body(first)
+    diff = json.loads(body)
+    assert diff["revision"] == second and diff["since"] == first and not diff["full"]
+    assert diff["changed"] == {"A": registry.nodes["A"], "C": {}}
+    assert diff["removed"] == ["B"]
+
+    assert json.loads(cache.diff_body(second)[1])["changed"] == {}
+
+    # Revisions that are no longer kept get the full payload
+    registry.nodes["D"] = {}
+    registry.version += 1
+    diff = json.loads(cache.diff_body(first)[1])
+    assert diff["full"] and diff["changed"] == registry.nodes and diff["removed"] == []
+
+
+def test_revisions_from_another_process():
+    registry = Registry()
+    old = ObjectInfoCache(registry.build, lambda: registry.version)
+    cache = ObjectInfoCache(registry.build, lambda: registry.version)
+    assert old.get().revision != cache.get().revision
+    assert old.get().etag != cache.get().etag
+    # A revision from before a restart gets the full payload
+    diff = json.loads(cache.diff_body(old.get().revision)[1])
+    assert diff["full"] and diff["changed"] == registry.nodes
+    assert json.loads(cache.diff_body("garbage")[1])["full"]
+
+
+def test_etag_matches():
+    assert etag_matches('"1-abc"', '"1-abc"')
+    assert etag_matches('"0-x", W/"1-abc"', '"1-abc"')
+    assert etag_matches("*", '"1-abc"')
+    assert not etag_matches('"0-x"', '"1-abc"')
+    assert not etag_matches(None, '"1-abc"')
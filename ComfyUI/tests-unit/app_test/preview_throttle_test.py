@@ -0,0 +1,79 @@
+import struct
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.preview_throttle import PreviewThrottle, encode_preview
+
+
+def test_encode_preview():
+    image = Image.new("RGB", (1024, 512), (255, 0, 0))
+    data = encode_preview(image, 256, "PNG")
+    assert struct.unpack(">I", data[:4])[0] == 2
+    with Image.open(BytesIO(data[4:])) as decoded:
+        assert decoded.format == "PNG"
+        assert decoded.size == (256, 128)
+
+    # Smaller previews aren't scaled up
+    with Image.open(BytesIO(encode_preview(Image.new("RGB", (64, 32)), 256)[4:])) as decoded:
+        assert decoded.size == (64, 32)
+
+    small = encode_preview(image, None, "JPEG", quality=10)
+    assert struct.unpack(">I", small[:4])[0] == 1
+    assert len(small) < len(encode_preview(image, None, "JPEG", quality=95))
+
+
+def test_one_preview_encoding_per_client():
+    throttle = PreviewThrottle()
+    assert throttle.wants_preview("a")
+    assert throttle.begin("a") == ("JPEG", 95)
+    assert not throttle.wants_preview("a")
+    assert throttle.begin("a") is None
+    # Other clients aren't held back
+    assert throttle.begin("b") == ("JPEG", 95)
+    throttle.end("a")
+    assert throttle.wants_preview("a")
+
+
+def test_max_fps(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    throttle = PreviewThrottle(max_fps=2)
+    assert throttle.begin("a") is not None
+    throttle.end("a")
+    now[0] += 0.25
+    assert not throttle.wants_preview("a")
+    assert throttle.begin("a") is None
+    now[0] += 0.25
+    assert throttle.begin("a") is not None
+
+
+def test_client_settings():
+    throttle = PreviewThrottle(max_fps=2)
+    throttle.configure("a", {"format": "png", "quality": 50, "max_fps": 0})
+    assert throttle.begin("a") == ("PNG", 50)
+    throttle.end("a")
+    assert throttle.begin("a") == ("PNG", 50)
+    assert throttle.begin("b", default_format="JPEG") == ("JPEG", 95)
+
+    for settings in ({"format": "GIF"}, {"quality": 0}, {"max_fps": -1}, {"max_fps": "fast"}):
+        with pytest.raises(ValueError):
+            throttle.configure("a", settings)
+
+    throttle.remove("a")
+    assert "a" not in throttle.clients
+
+
+def test_unconfigured_clients_are_not_kept(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    throttle = PreviewThrottle(max_fps=2)
+    for sid in ("a", "b", "c"):
+        assert throttle.begin(sid) == ("JPEG", 95)
+        throttle.end(sid)
+    assert throttle.clients == {}
+    now[0] += 1
+    assert throttle.begin("d") is not None
+    assert list(throttle.previews) == ["d"]
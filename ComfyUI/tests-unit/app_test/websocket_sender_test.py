@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app.websocket_sender import WebSocketSender
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.received = []
+        self.blocked = asyncio.Event()
+        self.blocked.set()
+        self.closed = False
+
+    async def send_json(self, message):
+        await self.blocked.wait()
+        self.received.append(message)
+
+    async def send_bytes(self, message):
+        await self.blocked.wait()
+        self.received.append(bytes(message))
+
+    async def close(self):
+        self.closed = True
+
+
+def progress(node, value):
+    return {"type": "progress", "data": {"node": node, "value": value}}
+
+
+@pytest.mark.asyncio
+async def test_messages_are_sent_in_order():
+    ws = FakeWebSocket()
+    sender = WebSocketSender(ws).start()
+    sender.put({"type": "executing"})
+    sender.put(b"preview", key=("preview",))
+    await asyncio.sleep(0.01)
+    assert ws.received == [{"type": "executing"}, b"preview"]
+    assert sender.get_stats()["sent"] == 2
+    sender.stop()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_gets_latest_progress():
+    ws = FakeWebSocket()
+    ws.blocked.clear()
+    sender = WebSocketSender(ws).start()
+    sender.put({"type": "first"})
+    await asyncio.sleep(0.01)
+    for i in range(10):
+        sender.put(progress("3", i), key=("progress", "3"))
+        sender.put(progress("4", i), key=("progress", "4"))
+    sender.put({"type": "executed"})
+    assert sender.depth == 3
+
+    ws.blocked.set()
+    await asyncio.sleep(0.01)
+    assert ws.received == [{"type": "first"}, progress("3", 9), progress("4", 9), {"type": "executed"}]
+    assert sender.get_stats()["coalesced"] == 18
+    assert sender.get_stats()["depth"] == 0
+    sender.stop()
+
+
+@pytest.mark.asyncio
+async def test_coalesced_messages_keep_their_place():
+    ws = FakeWebSocket()
+    ws.blocked.clear()
+    sender = WebSocketSender(ws).start()
+    sender.put({"type": "first"})
+    await asyncio.sleep(0.01)
+    sender.put(progress("3", 0), key=("progress", "3"))
+    sender.put(b"preview 3 0", key=("preview", "p", "3"))
+    sender.put(progress("3", 1), key=("progress", "3"))
+    sender.put(b"preview 3 1", key=("preview", "p", "3"))
+    sender.put({"type": "executed", "data": {"node": "3"}})
+    sender.put({"type": "executing", "data": {"node": "4"}})
+    sender.put(progress("4", 0), key=("progress", "4"))
+    sender.put(b"preview 4 0", key=("preview", "p", "4"))
+    sender.put(progress("4", 1), key=("progress", "4"))
+
+    ws.blocked.set()
+    await asyncio.sleep(0.01)
+    assert ws.received == [{"type": "first"}, progress("3", 1), b"preview 3 1", {"type": "executed", "data": {"node": "3"}},
+                           {"type": "executing", "data": {"node": "4"}}, progress("4", 1), b"preview 4 0"]
+    assert sender.get_stats()["coalesced"] == 3
+    sender.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_coalescable_then_disconnects():
+    ws = FakeWebSocket()
+    ws.blocked.clear()
+    sender = WebSocketSender(ws, max_queue=2).start()
+    sender.put({"type": "first"})
+    await asyncio.sleep(0.01)
+
+    assert sender.put(b"preview", key=("preview",))
+    assert sender.put({"type": "executed", "data": 1})
+    # The preview makes room
+    assert sender.put({"type": "executed", "data": 2})
+    assert sender.get_stats()["dropped"] == 1
+    assert not sender.put({"type": "executed", "data": 3})
+    await asyncio.sleep(0.01)
+    assert sender.closed and ws.closed
+    sender.stop()
+
+
+@pytest.mark.asyncio
+async def test_stuck_client_is_disconnected():
+    ws = FakeWebSocket()
+    ws.blocked.clear()
+    sender = WebSocketSender(ws, send_timeout=0.05).start()
+    sender.put({"type": "first"})
+    await asyncio.sleep(0.1)
+    assert ws.closed
+    assert not sender.put({"type": "second"})
+    sender.stop()
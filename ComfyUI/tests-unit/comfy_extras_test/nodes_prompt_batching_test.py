@@ -0,0 +1,77 @@
+import torch
+
+from comfy.cli_args import args
+
+# nodes initializes the torch device on import
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.sample
+import latent_preview
+from comfy_extras.nodes_prompt_batching import BatchedKSampler, batch_conditioning
+
+
+class FakeLatentFormat:
+    latent_channels = 4
+    latent_dimensions = 2
+
+
+class FakeModel:
+    def get_model_object(self, name):
+        return FakeLatentFormat()
+
+
+def cond(tokens, pooled=None, **options):
+    if pooled is not None:
+        options["pooled_output"] = pooled
+    return [[torch.randn(1, tokens, 8), options]]
+
+
+def test_batch_conditioning_pads_and_concatenates():
+    a = cond(77, pooled=torch.randn(1, 4), guidance=3.5)
+    b = cond(154, pooled=torch.randn(1, 4), guidance=3.5)
+    batched = batch_conditioning([a, b], [2, 1])
+    tensor, options = batched[0]
+    assert tensor.shape == (3, 154, 8)
+    assert torch.equal(tensor[0], a[0][0][0].repeat(2, 1))
+    assert torch.equal(tensor[1], tensor[0])
+    assert torch.equal(tensor[2], b[0][0][0])
+    assert options["pooled_output"].shape == (3, 4)
+    assert options["guidance"] == 3.5
+
+
+def test_batch_conditioning_rejects_mismatched_options():
+    assert batch_conditioning([cond(77, guidance=3.5), cond(77, guidance=4.0)], [1, 1]) is None
+    assert batch_conditioning([cond(77), cond(77, strength=1.0)], [1, 1]) is None
+    assert batch_conditioning([cond(77), cond(77) + cond(77)], [1, 1]) is None
+
+
+def test_noise_matches_unbatched_sampling(monkeypatch):
+    calls = []
+
+    def fake_sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, **kwargs):
+        calls.append((noise, positive, latent_image))
+        return latent_image + noise
+
+    monkeypatch.setattr(comfy.sample, "sample", fake_sample)
+    monkeypatch.setattr(latent_preview, "prepare_callback", lambda model, steps: None)
+
+    latents = [{"samples": torch.zeros(1, 4, 8, 8)}, {"samples": torch.zeros(2, 4, 8, 8), "batch_index": [3, 4]}]
+    kwargs = {}
+    for i, latent in enumerate(latents):
+        kwargs["positive_{}".format(i)] = cond(77)
+        kwargs["negative_{}".format(i)] = cond(77)
+        kwargs["latent_image_{}".format(i)] = latent
+    (out,) = BatchedKSampler().sample(FakeModel(), [11, 22], 20, 7.0, "euler", "normal", **kwargs)
+
+    assert len(calls) == 1
+    assert torch.equal(out[0]["samples"], comfy.sample.prepare_noise(latents[0]["samples"], 11))
+    assert torch.equal(out[1]["samples"], comfy.sample.prepare_noise(latents[1]["samples"], 22, [3, 4]))
+    assert out[1]["batch_index"] == [3, 4]
+
+    # Latents that can't share a batch are sampled one by one
+    calls.clear()
+    kwargs["latent_image_1"] = {"samples": torch.zeros(1, 4, 8, 8), "noise_mask": torch.ones(1, 1, 8, 8)}
+    (out,) = BatchedKSampler().sample(FakeModel(), [11, 22], 20, 7.0, "euler", "normal", **kwargs)
+    assert len(calls) == 2
+    assert torch.equal(out[1]["samples"], comfy.sample.prepare_noise(torch.zeros(1, 4, 8, 8), 22))
@@ -0,0 +1,75 @@
+import hashlib
+import os
+
+from node_helpers import FileHashCache, file_stat_fingerprint
+
+
+def count_reads(cache):
+    reads = []
+    hash_file = cache._hash_file
+    cache._hash_file = lambda path, algorithm: reads.append(path) or hash_file(path, algorithm)
+    return reads
+
+
+def test_hash_matches_hashlib(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"x" * (FileHashCache.CHUNK_SIZE + 10))
+    cache = FileHashCache()
+    assert cache.get(str(path)) == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert cache.get(str(path), "md5") == hashlib.md5(path.read_bytes()).hexdigest()
+
+
+def test_unchanged_file_is_read_once(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"one")
+    cache = FileHashCache()
+    reads = count_reads(cache)
+    first = cache.get(str(path))
+    assert cache.get(str(path)) == first
+    assert len(reads) == 1
+
+
+def test_modified_file_is_rehashed(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"one")
+    cache = FileHashCache()
+    first = cache.get(str(path))
+    path.write_bytes(b"two!")
+    assert cache.get(str(path)) == hashlib.sha256(b"two!").hexdigest() != first
+
+    # Same size, new mtime
+    stat = os.stat(path)
+    path.write_bytes(b"four")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.get(str(path)) == hashlib.sha256(b"four").hexdigest()
+
+
+def test_prefetch_in_background(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"data")
+    cache = FileHashCache(workers=1)
+    reads = count_reads(cache)
+    cache.prefetch(str(path))
+    assert cache.get(str(path)) == hashlib.sha256(b"data").hexdigest()
+    assert len(reads) == 1
+
+    # Disabled without workers, and missing files are ignored
+    FileHashCache(workers=0).prefetch(str(path))
+    cache.prefetch(str(tmp_path / "missing.png"))
+
+
+def test_bounded_entries(tmp_path):
+    cache = FileHashCache(max_entries=2)
+    for i in range(3):
+        path = tmp_path / f"{i}.png"
+        path.write_bytes(bytes([i]))
+        cache.get(str(path))
+    assert len(cache.hashes) == 2
+
+
+def test_stat_fingerprint_changes_with_file(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"one")
+    before = file_stat_fingerprint(str(path))
+    path.write_bytes(b"longer")
+    assert file_stat_fingerprint(str(path)) != before
@@ -116,6 +116,71 @@ def test_get_save_image_path(temp_dir):
         assert filename_prefix == "test"
 
 
+def test_cache_helper_is_per_thread():
+    from concurrent.futures import ThreadPoolExecutor
+    with folder_paths.cache_helper:
+        folder_paths.cache_helper.set("test_folder", (["a"], {}, 0))
+        with ThreadPoolExecutor(1) as executor:
+            assert executor.submit(folder_paths.cache_helper.get, "test_folder").result() is None
+        assert folder_paths.cache_helper.get("test_folder") == (["a"], {}, 0)
+
+
+def touch(path):
+    open(path, "wb").close()
+
+
+def test_save_image_path_counters(temp_dir, monkeypatch):
+    for name in ["test_00007_.png", "test_00003_.webp", "test_x_.png", "other_00020_.png", "test_00009.png"]:
+        touch(os.path.join(temp_dir, name))
+    monkeypatch.setattr(folder_paths, "save_counter_index", folder_paths.SaveCounterIndex())
+
+    def next_counter(prefix="test"):
+        return folder_paths.get_save_image_path(prefix, temp_dir)[2]
+
+    assert next_counter() == 8
+    assert next_counter("sub/test") == 1
+    assert next_counter("new") == 1
+
+    # Only the first call for a prefix lists the folder
+    with patch("os.scandir", side_effect=AssertionError):
+        # The previous call saved a batch of three
+        for counter in (9, 10, 11):
+            touch(os.path.join(temp_dir, f"test_{counter:05}_.png"))
+        assert next_counter() == 12
+        # Someone else saved with an ending the index already knows
+        touch(os.path.join(temp_dir, "test_00013_.webp"))
+        assert next_counter() == 14
+        assert next_counter() == 15
+
+    # A file created with a counter handed out to someone else
+    counter = next_counter()
+    touch(os.path.join(temp_dir, f"test_{counter:05}_.unknown"))
+    assert folder_paths.reserve_save_file(temp_dir, "test", counter, "_.unknown") == (counter + 1, f"test_{counter + 1:05}_.unknown")
+    assert os.path.exists(os.path.join(temp_dir, f"test_{counter + 1:05}_.unknown"))
+    assert next_counter() == counter + 2
+
+
+def test_save_image_path_concurrent(temp_dir, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(folder_paths, "save_counter_index", folder_paths.SaveCounterIndex())
+    with ThreadPoolExecutor(8) as executor:
+        counters = list(executor.map(lambda _: folder_paths.get_save_image_path("test", temp_dir)[2], range(200)))
+    assert sorted(counters) == list(range(1, 201))
+
+
+def test_save_image_path_recreated_folder(temp_dir, monkeypatch):
+    folder = os.path.join(temp_dir, "sub")
+    monkeypatch.setattr(folder_paths, "save_counter_index", folder_paths.SaveCounterIndex())
+    assert folder_paths.get_save_image_path("sub/test", temp_dir)[2] == 1
+    assert folder_paths.get_save_image_path("sub/test", temp_dir)[2] == 2
+    os.rmdir(folder)
+    os.makedirs(folder)
+    touch(os.path.join(folder, "test_00004_.png"))
+    # Depending on whether the new folder got the same inode the counters start over or go on, skipping files
+    counters = [folder_paths.get_save_image_path("sub/test", temp_dir)[2] for _ in range(3)]
+    assert counters in ([5, 6, 7], [3, 5, 6])
+
+
 def test_base_path_changes(set_base_dir):
     test_dir = os.path.abspath("/test/dir")
     set_base_dir(test_dir)
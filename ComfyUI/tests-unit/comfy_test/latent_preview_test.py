@@ -0,0 +1,108 @@
+import os
+
+import pytest
+import torch
+
+from comfy.cli_args import args, LatentPreviewMethod
+
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.latent_formats
+import latent_preview
+
+
+class FakeTAESD:
+    loaded = 0
+
+    def __init__(self, encoder_path, decoder_path, latent_channels=4):
+        FakeTAESD.loaded += 1
+
+    def to(self, device):
+        return self
+
+
+@pytest.fixture(autouse=True)
+def preview_method():
+    previous = args.preview_method
+    latent_preview.previewer_cache.clear()
+    yield
+    args.preview_method = previous
+    latent_preview.previewer_cache.clear()
+
+
+def test_previewers_are_reused():
+    args.preview_method = LatentPreviewMethod.NoPreviews
+    assert latent_preview.get_previewer("cpu", comfy.latent_formats.SD15()) is None
+
+    args.preview_method = LatentPreviewMethod.Auto
+    previewer = latent_preview.get_previewer("cpu", comfy.latent_formats.SD15())
+    assert isinstance(previewer, latent_preview.Latent2RGBPreviewer)
+    assert latent_preview.get_previewer("cpu", comfy.latent_formats.SD15()) is previewer
+    assert latent_preview.get_previewer("cpu", comfy.latent_formats.SDXL()) is not previewer
+
+    x0 = torch.randn((1, 4, 8, 8))
+    previewer.decode_latent_to_preview(x0)
+    factors = previewer.resident_factors[(x0.dtype, x0.device)]
+    previewer.decode_latent_to_preview(x0)
+    assert previewer.resident_factors[(x0.dtype, x0.device)] is factors
+
+
+def test_taesd_previewer_reloads_when_decoder_changes(tmp_path, monkeypatch):
+    decoder = tmp_path / "taesd_decoder.safetensors"
+    decoder.write_bytes(b"weights")
+    monkeypatch.setattr(latent_preview, "TAESD", FakeTAESD)
+    monkeypatch.setattr(latent_preview, "find_taesd_decoder", lambda latent_format: str(decoder))
+    FakeTAESD.loaded = 0
+
+    args.preview_method = LatentPreviewMethod.TAESD
+    previewer = latent_preview.get_previewer("cpu", comfy.latent_formats.SD15())
+    assert isinstance(previewer, latent_preview.TAESDPreviewerImpl)
+    assert latent_preview.get_previewer("cpu", comfy.latent_formats.SD15()) is previewer
+    assert FakeTAESD.loaded == 1
+
+    stat = decoder.stat()
+    os.utime(decoder, (stat.st_atime, stat.st_mtime + 10))
+    assert latent_preview.get_previewer("cpu", comfy.latent_formats.SD15()) is not previewer
+    assert FakeTAESD.loaded == 2
+
+    # Falls back to Latent2RGB once the decoder is gone
+    monkeypatch.setattr(latent_preview, "find_taesd_decoder", lambda latent_format: None)
+    assert isinstance(latent_preview.get_previewer("cpu", comfy.latent_formats.SD15()), latent_preview.Latent2RGBPreviewer)
+
+
+def test_previews_are_shrunk_on_device(monkeypatch):
+    monkeypatch.setattr(latent_preview, "MAX_PREVIEW_RESOLUTION", 32)
+    previewer = latent_preview.Latent2RGBPreviewer(comfy.latent_formats.SD15().latent_rgb_factors)
+    assert previewer.decode_latent_to_preview(torch.randn((1, 4, 64, 128))).size == (32, 16)
+    assert previewer.decode_latent_to_preview(torch.randn((1, 4, 8, 16))).size == (16, 8)
+
+
+def test_preview_grid(monkeypatch):
+    images = torch.stack([torch.full((2, 3, 3), float(i) / 10) for i in range(3)])
+    grid = latent_preview.tile_previews(images)
+    assert grid.shape == (4, 6, 3)
+    assert torch.all(grid[:2, :3] == 0.0) and torch.all(grid[:2, 3:] == 0.1)
+    assert torch.all(grid[2:, :3] == 0.2) and torch.all(grid[2:, 3:] == -1.0)
+
+    monkeypatch.setattr(args, "preview_grid", True)
+    previewer = latent_preview.Latent2RGBPreviewer(comfy.latent_formats.SD15().latent_rgb_factors)
+    assert previewer.decode_latent_to_preview(torch.randn((4, 4, 8, 16))).size == (32, 16)
+
+
+def test_preview_to_image_with_buffer():
+    buffer = latent_preview.PreviewBuffer()
+    image = torch.zeros((4, 4, 3))
+    first = latent_preview.preview_to_image(image, buffer=buffer)
+    second = latent_preview.preview_to_image(image + 1.0, buffer=buffer)
+    # Later steps don't change earlier previews
+    assert first.getpixel((0, 0)) == (127, 127, 127)
+    assert second.getpixel((0, 0)) == (255, 255, 255)
+
+
+@pytest.mark.parametrize("dtype", [torch.float16, torch.bfloat16])
+def test_shrink_half_precision_preview(dtype):
+    image = torch.rand((64, 32, 3), dtype=dtype) * 2 - 1
+    shrunk = latent_preview.shrink_preview(image, 16)
+    assert shrunk.shape == (16, 8, 3)
+    assert latent_preview.preview_to_image(image, 16).size == (8, 16)
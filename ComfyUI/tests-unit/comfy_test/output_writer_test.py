@@ -0,0 +1,41 @@
+import threading
+
+from node_helpers import OutputWriter
+
+
+def test_synchronous_without_workers(tmp_path):
+    writer = OutputWriter()
+    path = tmp_path / "image.png"
+    writer.submit(str(path), lambda p: open(p, "wb").write(b"data"))
+    assert path.read_bytes() == b"data"
+    done = []
+    writer.flush(lambda: done.append(True))
+    assert done == [True]
+
+
+def test_background_writes_are_flushed_in_order(tmp_path):
+    writer = OutputWriter(workers=2)
+    release = threading.Event()
+
+    def slow_write(p):
+        release.wait()
+        with open(p, "wb") as f:
+            f.write(b"data")
+
+    path = tmp_path / "image.png"
+    writer.submit(str(path), slow_write)
+    # The name is reserved right away so the next save picks a new counter
+    assert path.exists()
+    assert writer.is_pending(str(path))
+
+    flushed = []
+    writer.flush(lambda: flushed.append(path.read_bytes()))
+    writer.flush(lambda: flushed.append(b"second"))
+    assert flushed == []
+
+    release.set()
+    writer.wait(str(path))
+    assert path.read_bytes() == b"data"
+    writer.flusher.submit(lambda: None).result()
+    assert flushed == [b"data", b"second"]
+    assert not writer.is_pending(str(path))
@@ -0,0 +1,75 @@
+import os
+
+import torch
+
+from comfy.cli_args import args
+
+# comfy_execution.disk_cache imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import nodes
+from comfy_execution.caching import Unhashable
+from comfy_execution.disk_cache import DiskCache, signature_digest
+
+
+def test_signature_digest_is_stable():
+    a = frozenset([(0, "CLIPTextEncode"), (1, frozenset([("text", "a cat"), ("clip", ("ANCESTOR", 0, 1))]))])
+    b = frozenset([(1, frozenset([("clip", ("ANCESTOR", 0, 1)), ("text", "a cat")])), (0, "CLIPTextEncode")])
+    assert signature_digest(a) == signature_digest(b)
+    assert signature_digest(a) != signature_digest(frozenset([(0, "CLIPTextEncode")]))
+    assert signature_digest(frozenset([(0, float("NaN"))])) is None
+    assert signature_digest(frozenset([(0, Unhashable())])) is None
+
+
+def test_round_trip_conditioning_and_latent(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 8)
+    cond = torch.randn(1, 77, 16)
+    pooled = torch.randn(1, 16)
+    output = [[[[cond, {"pooled_output": pooled, "strength": 1.0}]]], [{"samples": torch.randn(1, 4, 8, 8)[:, :2]}]]
+    cache.set("abc", "CLIPTextEncode", output)
+
+    reloaded = DiskCache(str(tmp_path), max_bytes=10 ** 8).get("abc")
+    assert torch.equal(reloaded[0][0][0][0], cond)
+    assert torch.equal(reloaded[0][0][0][1]["pooled_output"], pooled)
+    assert reloaded[0][0][0][1]["strength"] == 1.0
+    assert torch.equal(reloaded[1][0]["samples"], output[1][0]["samples"])
+
+
+def test_skips_non_serializable_outputs(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 8)
+    cache.set("abc", "CheckpointLoaderSimple", [[object()]])
+    assert cache.get("abc") is None
+    assert cache.get_stats()["skipped"] == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_evicts_least_recently_used(tmp_path):
+    entry_bytes = 4096
+    cache = DiskCache(str(tmp_path), max_bytes=int(entry_bytes * 2.5))
+    for digest in ("a", "b"):
+        cache.set(digest, "VAEEncode", [[torch.zeros(entry_bytes // 4)]])
+    assert cache.get("a") is not None
+    cache.set("c", "VAEEncode", [[torch.zeros(entry_bytes // 4)]])
+    assert list(cache.entries) == ["a", "c"]
+    assert sorted(os.listdir(tmp_path)) == ["a.safetensors", "c.safetensors"]
+
+
+def test_node_class_opt_in_and_out(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10 ** 8, exclude_classes=["VAEEncode"])
+    assert cache.is_cacheable("CLIPTextEncode")
+    assert not cache.is_cacheable("VAEEncode")
+    assert not cache.is_cacheable("SaveImage")
+    assert not cache.is_cacheable("UnknownNode")
+
+    only = DiskCache(str(tmp_path), max_bytes=10 ** 8, include_classes=["VAEEncode"])
+    assert only.is_cacheable("VAEEncode")
+    assert not only.is_cacheable("CLIPTextEncode")
+
+    class OptedOut:
+        DISK_CACHE = False
+    nodes.NODE_CLASS_MAPPINGS["DiskCacheOptedOut"] = OptedOut
+    try:
+        assert not cache.is_cacheable("DiskCacheOptedOut")
+    finally:
+        del nodes.NODE_CLASS_MAPPINGS["DiskCacheOptedOut"]
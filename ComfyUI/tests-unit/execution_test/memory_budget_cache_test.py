@@ -0,0 +1,80 @@
+import numpy as np
+import torch
+
+from comfy.cli_args import args
+
+# comfy_execution.caching imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+from comfy_execution.caching import CacheKeySet, MemoryBudgetCache, collect_output_storages
+
+
+class NodeIdKeySet(CacheKeySet):
+    """Keys nodes by their id so tests don't need a real prompt"""
+    def __init__(self, dynprompt, node_ids, is_changed_cache):
+        super().__init__(dynprompt, node_ids, is_changed_cache)
+        self.add_keys(node_ids)
+
+    def add_keys(self, node_ids):
+        for node_id in node_ids:
+            self.keys[node_id] = node_id
+            self.subcache_keys[node_id] = node_id
+
+
+def run_prompt(cache, outputs):
+    cache.set_prompt(None, list(outputs.keys()), None)
+    cache.clean_unused()
+    for node_id, value in outputs.items():
+        if cache.get(node_id) is None:
+            cache.set(node_id, value)
+
+
+def test_measures_nested_outputs():
+    tensor = torch.zeros(256, dtype=torch.float32)
+    latent = {"samples": torch.zeros(2, 4, 8, 8)}
+    conditioning = [[tensor, {"pooled_output": tensor[:16]}]]
+    storages = collect_output_storages([(latent,), (conditioning,), ("text", 3), np.zeros(10, dtype=np.uint8)])
+    # The pooled output is a view of tensor and must not be counted twice
+    assert sum(size for size, _ in storages.values()) == 2 * 4 * 8 * 8 * 4 + 256 * 4 + 10
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = MemoryBudgetCache(NodeIdKeySet, max_bytes=3000)
+    run_prompt(cache, {"a": [torch.zeros(250)]})
+    run_prompt(cache, {"b": [torch.zeros(250)]})
+    run_prompt(cache, {"c": [torch.zeros(250)]})
+    assert cache.total_bytes == 3000
+
+    run_prompt(cache, {"a": None, "d": [torch.zeros(250)]})
+    assert cache.get("a") is not None
+    assert "b" not in cache.cache
+    assert "c" in cache.cache
+    assert cache.total_bytes == 3000
+
+
+def test_prefers_evicting_larger_entries_of_same_age():
+    cache = MemoryBudgetCache(NodeIdKeySet, max_bytes=2000)
+    run_prompt(cache, {"small": [torch.zeros(10)], "large": [torch.zeros(400)]})
+    run_prompt(cache, {"new": [torch.zeros(100)]})
+    assert "large" not in cache.cache
+    assert "small" in cache.cache
+
+
+def test_shared_tensors_counted_once():
+    shared = torch.zeros(500)
+    cache = MemoryBudgetCache(NodeIdKeySet, max_bytes=10 ** 6)
+    run_prompt(cache, {"a": [shared], "b": [shared[:10]]})
+    assert cache.total_bytes == 2000
+    cache._remove("a")
+    assert cache.total_bytes == 2000
+    cache._remove("b")
+    assert cache.total_bytes == 0
+    assert cache.get_memory_usage() == {}
+
+
+def test_current_prompt_never_evicted():
+    cache = MemoryBudgetCache(NodeIdKeySet, max_bytes=100)
+    run_prompt(cache, {"a": [torch.zeros(100)], "b": [torch.zeros(100)]})
+    assert cache.get("a") is not None and cache.get("b") is not None
+    assert cache.get_memory_usage() == {"cpu": 800}
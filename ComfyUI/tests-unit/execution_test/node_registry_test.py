@@ -0,0 +1,143 @@
+import os
+import sys
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import nodes
+from comfy_execution.node_registry import LazyModule, NodeClassMappings, NodeManifest, record_node_info
+
+NODE_MODULE = """
+import folder_paths
+
+# Other modules may add to this while they load
+DEFAULTS = [VALUE]
+
+class StaticNode:
+    CATEGORY = "test"
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT", {"default": DEFAULTS[-1]})}}
+
+class FileNode(StaticNode):
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"file": (folder_paths.get_filename_list("checkpoints"),)}}
+
+NODE_CLASS_MAPPINGS = {"LazyStaticNode": StaticNode, "LazyFileNode": FileNode}
+NODE_DISPLAY_NAME_MAPPINGS = {"LazyStaticNode": "Lazy Static Node"}
+"""
+
+
+class Node:
+    pass
+
+
+def test_lazy_mappings():
+    loads = []
+
+    def load():
+        loads.append(1)
+        mappings["Lazy"] = Node
+        return True
+
+    mappings = NodeClassMappings({"Eager": object})
+    mappings.add_lazy(LazyModule("module.py", {"Lazy": {"name": "Lazy"}, "Missing": None}, load))
+    version = mappings.version()
+    assert "Lazy" in mappings and "Missing" in mappings
+    assert len(mappings) == 3 and set(mappings.keys()) == {"Eager", "Lazy", "Missing"}
+    assert mappings.static_info("Lazy") == {"name": "Lazy"}
+    assert loads == []
+
+    assert mappings["Lazy"] is Node
+    assert loads == [1]
+    assert mappings.static_info("Lazy") is None
+    assert mappings.version() != version
+    # The module didn't define Missing after all
+    assert "Missing" not in mappings and mappings.get("Missing") is None
+    with pytest.raises(KeyError):
+        mappings["Missing"]
+    assert dict(mappings.items()) == {"Eager": object, "Lazy": Node}
+    assert loads == [1]
+
+
+def test_record_node_info():
+    def get_info(name):
+        if name == "broken":
+            raise ValueError(name)
+        return {"output": ("INT",), "name": name, "default": object() if name == "object" else None}
+
+    assert record_node_info(get_info, "static") == {"output": ["INT"], "name": "static", "default": None}
+    assert record_node_info(get_info, "broken") is None
+    assert record_node_info(get_info, "object") is None
+
+
+@pytest.fixture
+def node_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(nodes, "node_manifest", NodeManifest(str(tmp_path / "manifest.json"), "source"))
+    module_dir = tmp_path / "lazy_nodes"
+    module_dir.mkdir()
+    yield module_dir
+    for name in ("LazyStaticNode", "LazyFileNode"):
+        if name in nodes.NODE_CLASS_MAPPINGS:
+            del nodes.NODE_CLASS_MAPPINGS[name]
+        nodes.NODE_DISPLAY_NAME_MAPPINGS.pop(name, None)
+    sys.modules.pop(str(module_dir / "nodes_lazy"), None)
+
+
+def test_init_lazy_nodes(node_dir, monkeypatch):
+    module_path = node_dir / "nodes_lazy.py"
+    module_path.write_text(NODE_MODULE.replace("VALUE", "1"))
+    module_name = os.path.splitext(str(module_path))[0]
+
+    def init_lazy_nodes():
+        return nodes.init_lazy_nodes(str(node_dir), ["nodes_lazy.py"], "lazy_test", record_info=True, dynamic_nodes={"LazyFileNode"})
+
+    # The first start imports the module to write the manifest
+    assert nodes.init_lazy_nodes(str(node_dir), ["nodes_lazy.py", "nodes_missing.py"], "lazy_test",
+                                 record_info=True, dynamic_nodes={"LazyFileNode"}) == ["nodes_missing.py"]
+    assert module_name in sys.modules
+    assert "lazy_test/nodes_lazy.py" not in nodes.node_manifest.modules
+    # Node info is recorded once everything that could change it has loaded
+    sys.modules[module_name].DEFAULTS.append(2)
+    nodes.save_node_manifest()
+    entry = nodes.node_manifest.modules["lazy_test/nodes_lazy.py"]
+    assert entry["nodes"]["LazyStaticNode"]["input"] == {"required": {"value": ["INT", {"default": 2}]}}
+    assert entry["nodes"]["LazyFileNode"] is None
+
+    # Later starts don't
+    del sys.modules[module_name]
+    monkeypatch.setattr(nodes, "node_manifest", NodeManifest(nodes.node_manifest.path, "source"))
+    assert init_lazy_nodes() == []
+    assert module_name not in sys.modules
+    assert nodes.NODE_DISPLAY_NAME_MAPPINGS["LazyStaticNode"] == "Lazy Static Node"
+    assert nodes.NODE_CLASS_MAPPINGS.static_info("LazyStaticNode") == entry["nodes"]["LazyStaticNode"]
+    assert nodes.NODE_CLASS_MAPPINGS["LazyFileNode"].FUNCTION == "run"
+    assert module_name in sys.modules
+    assert nodes.node_info("LazyStaticNode")["input"] == {"required": {"value": ("INT", {"default": 1})}}
+    nodes.save_node_manifest()
+
+    # A changed module is imported again to update its entry
+    del sys.modules[module_name]
+    module_path.write_text(NODE_MODULE.replace("VALUE", "20"))
+    assert init_lazy_nodes() == []
+    nodes.save_node_manifest()
+    assert nodes.node_manifest.modules["lazy_test/nodes_lazy.py"]["nodes"]["LazyStaticNode"]["input"]["required"]["value"][1] == {"default": 20}
+
+    # A different source invalidates the whole manifest
+    assert NodeManifest(nodes.node_manifest.path, "other").modules == {}
+
+
+def test_info_is_only_recorded_on_request(node_dir):
+    (node_dir / "nodes_lazy.py").write_text(NODE_MODULE.replace("VALUE", "1"))
+    assert nodes.init_lazy_nodes(str(node_dir), ["nodes_lazy.py"], "lazy_test") == []
+    nodes.save_node_manifest()
+    assert nodes.node_manifest.modules["lazy_test/nodes_lazy.py"]["nodes"] == {"LazyStaticNode": None, "LazyFileNode": None}
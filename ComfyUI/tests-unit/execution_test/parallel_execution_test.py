@@ -0,0 +1,255 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+
+# execution imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution
+import nodes
+from comfy_execution.graph import ExecutionBlocker
+from comfy_execution.graph_utils import GraphBuilder
+
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+    last_prompt_id = None
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+
+class ResourceTracker:
+    lock = threading.Lock()
+    running = {}
+    max_running = {}
+
+    @classmethod
+    def reset(cls):
+        cls.running = {"cpu": 0, "gpu": 0}
+        cls.max_running = {"cpu": 0, "gpu": 0}
+
+    @classmethod
+    def run(cls, resource, seconds):
+        with cls.lock:
+            cls.running[resource] += 1
+            cls.max_running[resource] = max(cls.max_running[resource], cls.running[resource])
+        time.sleep(seconds)
+        with cls.lock:
+            cls.running[resource] -= 1
+
+
+class SleepCPU:
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",), "seconds": ("FLOAT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, value, seconds):
+        ResourceTracker.run(self.RESOURCE_TYPE, seconds)
+        return (value,)
+
+
+class SleepGPU(SleepCPU):
+    RESOURCE_TYPE = "gpu"
+
+
+class Add:
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"a": ("INT",), "b": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, a, b):
+        return (a + b,)
+
+
+class LazySwitch:
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"switch": ("BOOLEAN",),
+                             "on_true": ("INT", {"lazy": True}),
+                             "on_false": ("INT", {"lazy": True})}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def check_lazy_status(self, switch, on_true=None, on_false=None):
+        return ["on_true"] if switch else ["on_false"]
+
+    def run(self, switch, on_true=None, on_false=None):
+        return (on_true if switch else on_false,)
+
+
+class Blocker:
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, value):
+        return (ExecutionBlocker(None),)
+
+
+class Doubler:
+    # Expands into a subgraph that adds the input to itself
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, value):
+        graph = GraphBuilder()
+        add = graph.node("ParallelTestAdd", a=value, b=value)
+        return {"result": (add.out(0),), "expand": graph.finalize()}
+
+
+class Fail:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, value):
+        raise ValueError("broken node")
+
+
+class Collect:
+    RESOURCE_TYPE = "io"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    def run(self, value):
+        return {"ui": {"value": [value]}}
+
+
+TEST_NODES = {
+    "ParallelTestSleepCPU": SleepCPU,
+    "ParallelTestSleepGPU": SleepGPU,
+    "ParallelTestAdd": Add,
+    "ParallelTestLazySwitch": LazySwitch,
+    "ParallelTestBlocker": Blocker,
+    "ParallelTestDoubler": Doubler,
+    "ParallelTestFail": Fail,
+    "ParallelTestCollect": Collect,
+}
+
+
+@pytest.fixture(autouse=True)
+def test_nodes():
+    nodes.NODE_CLASS_MAPPINGS.update(TEST_NODES)
+    ResourceTracker.reset()
+    yield
+    for name in TEST_NODES:
+        del nodes.NODE_CLASS_MAPPINGS[name]
+
+
+def node(class_type, **inputs):
+    return {"class_type": "ParallelTest" + class_type, "inputs": inputs}
+
+
+def run_prompt(prompt, parallel_workers):
+    executor = execution.PromptExecutor(FakeServer(), parallel_workers=parallel_workers)
+    outputs = [node_id for node_id in prompt if prompt[node_id]["class_type"] == "ParallelTestCollect"]
+    executor.execute(prompt, "prompt", {}, outputs)
+    return executor.success, {k: v["value"][0] for k, v in executor.history_result["outputs"].items()}
+
+
+@pytest.mark.parametrize("parallel_workers", [0, 4])
+def test_cpu_branches_overlap(parallel_workers):
+    prompt = {
+        "1": node("SleepCPU", value=1, seconds=0.3),
+        "2": node("SleepCPU", value=2, seconds=0.3),
+        "3": node("Add", a=["1", 0], b=["2", 0]),
+        "4": node("Collect", value=["3", 0]),
+    }
+    start = time.perf_counter()
+    assert run_prompt(prompt, parallel_workers) == (True, {"4": 3})
+    elapsed = time.perf_counter() - start
+    if parallel_workers:
+        assert ResourceTracker.max_running["cpu"] == 2
+        assert elapsed < 0.55
+    else:
+        assert ResourceTracker.max_running["cpu"] == 1
+
+
+def test_one_gpu_node_at_a_time():
+    prompt = {
+        "1": node("SleepGPU", value=1, seconds=0.1),
+        "2": node("SleepGPU", value=2, seconds=0.1),
+        "3": node("SleepCPU", value=3, seconds=0.1),
+        "4": node("Collect", value=["1", 0]),
+        "5": node("Collect", value=["2", 0]),
+        "6": node("Collect", value=["3", 0]),
+    }
+    assert run_prompt(prompt, 4) == (True, {"4": 1, "5": 2, "6": 3})
+    assert ResourceTracker.max_running["gpu"] == 1
+    assert ResourceTracker.max_running["cpu"] == 1
+
+
+@pytest.mark.parametrize("parallel_workers", [0, 4])
+def test_lazy_inputs_blockers_and_expansion(parallel_workers):
+    prompt = {
+        "1": node("SleepCPU", value=1, seconds=0.0),
+        "2": node("Fail", value=2),
+        "3": node("LazySwitch", switch=True, on_true=["1", 0], on_false=["2", 0]),
+        "4": node("Collect", value=["3", 0]),
+        "5": node("Blocker", value=5),
+        "6": node("Collect", value=["5", 0]),
+        "7": node("Doubler", value=["1", 0]),
+        "8": node("Collect", value=["7", 0]),
+    }
+    # The failing node is never evaluated and the blocked output is silently skipped
+    assert run_prompt(prompt, parallel_workers) == (True, {"4": 1, "8": 2})
+
+
+@pytest.mark.parametrize("parallel_workers", [0, 4])
+def test_failure_stops_execution(parallel_workers):
+    prompt = {
+        "1": node("Fail", value=1),
+        "2": node("Collect", value=["1", 0]),
+    }
+    success, outputs = run_prompt(prompt, parallel_workers)
+    assert success is False
+    assert outputs == {}
+
+
+def test_resource_type_defaults():
+    assert execution.get_node_resource_type(SleepCPU) == "cpu"
+    assert execution.get_node_resource_type(Fail) == "gpu"
+
+    class ApiNode:
+        API_NODE = True
+    assert execution.get_node_resource_type(ApiNode) == "io"
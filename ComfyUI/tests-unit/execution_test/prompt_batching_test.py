@@ -0,0 +1,194 @@
+import pytest
+import torch
+
+from comfy.cli_args import args
+
+# execution imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution
+import nodes
+from comfy_execution.batching import PromptBatcher, batch_key, fuse_prompts
+
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+    progress_enabled = True
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+    def queue_updated(self):
+        pass
+
+
+class Loader:
+    calls = 0
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"name": ("STRING",)}}
+
+    RETURN_TYPES = ("MODEL",)
+    FUNCTION = "run"
+
+    def run(self, name):
+        Loader.calls += 1
+        return (name,)
+
+
+class Encode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"text": ("STRING",)}}
+
+    RETURN_TYPES = ("CONDITIONING",)
+    FUNCTION = "run"
+
+    def run(self, text):
+        return (text,)
+
+
+class Sampler:
+    calls = 0
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"model": ("MODEL",), "seed": ("INT",), "steps": ("INT",), "cfg": ("FLOAT",),
+                             "sampler_name": ("STRING",), "scheduler": ("STRING",), "positive": ("CONDITIONING",),
+                             "negative": ("CONDITIONING",), "latent_image": ("LATENT",), "denoise": ("FLOAT",)}}
+
+    RETURN_TYPES = ("LATENT",)
+    FUNCTION = "run"
+
+    def run(self, model, seed, positive, negative, **kwargs):
+        Sampler.calls += 1
+        return ("{} {} {}".format(model, positive, seed),)
+
+
+class BatchedSampler:
+    batches = []
+    server = None
+    progress_enabled = []
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"model": ("MODEL",), "seeds": ("SEED_LIST",)}}
+
+    RETURN_TYPES = ("LATENT_LIST",)
+    FUNCTION = "run"
+
+    def run(self, model, seeds, **kwargs):
+        BatchedSampler.batches.append(seeds)
+        BatchedSampler.progress_enabled.append(BatchedSampler.server.progress_enabled)
+        return (["{} {} {} batched".format(model, kwargs["positive_{}".format(i)], seed) for i, seed in enumerate(seeds)],)
+
+
+class Output:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("LATENT",)}}
+
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    def run(self, value):
+        return {"ui": {"value": [value]}}
+
+
+@pytest.fixture(autouse=True)
+def test_nodes(monkeypatch):
+    for name, node in {"BatchLoader": Loader, "BatchEncode": Encode, "KSampler": Sampler,
+                       "BatchedKSampler": BatchedSampler, "BatchOutput": Output}.items():
+        monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, name, node)
+    Loader.calls = 0
+    Sampler.calls = 0
+    BatchedSampler.batches = []
+    BatchedSampler.progress_enabled = []
+
+
+def make_prompt(text="a cat", seed=1, steps=20, sampler_name="euler", checkpoint="model.safetensors"):
+    return {
+        "1": {"class_type": "BatchLoader", "inputs": {"name": checkpoint}},
+        "2": {"class_type": "BatchEncode", "inputs": {"text": text}},
+        "3": {"class_type": "BatchEncode", "inputs": {"text": "blurry"}},
+        "4": {"class_type": "BatchEncode", "inputs": {"text": "latent"}},
+        "5": {"class_type": "KSampler", "inputs": {"model": ["1", 0], "seed": seed, "steps": steps, "cfg": 7.0,
+                                                   "sampler_name": sampler_name, "scheduler": "normal",
+                                                   "positive": ["2", 0], "negative": ["3", 0],
+                                                   "latent_image": ["4", 0], "denoise": 1.0}},
+        "6": {"class_type": "BatchOutput", "inputs": {"value": ["5", 0]}},
+    }
+
+
+def test_batch_key():
+    assert batch_key(make_prompt()) is not None
+    assert batch_key(make_prompt()) == batch_key(make_prompt(text="a dog", seed=2))
+    assert batch_key(make_prompt()) != batch_key(make_prompt(steps=30))
+    assert batch_key(make_prompt()) != batch_key(make_prompt(checkpoint="other.safetensors"))
+    # Samplers that add noise while sampling can't reproduce the unbatched result
+    assert batch_key(make_prompt(sampler_name="euler_ancestral")) is None
+
+    prompt = make_prompt()
+    prompt["7"] = {"class_type": "BatchLoader", "inputs": {"name": "seed"}}
+    prompt["5"]["inputs"]["seed"] = ["7", 0]
+    assert batch_key(prompt) is None
+
+    prompt = make_prompt()
+    prompt["7"] = dict(prompt["5"])
+    assert batch_key(prompt) is None
+
+
+def test_fuse_prompts():
+    fused, sampler_id = fuse_prompts([make_prompt(), make_prompt(text="a dog", seed=2)])
+    assert set(fused) == {"0.1", "0.2", "0.3", "0.4", "1.1", "1.2", "1.3", "1.4", "batch"}
+    inputs = fused[sampler_id]["inputs"]
+    assert inputs["seeds"] == [1, 2]
+    assert inputs["model"] == ["0.1", 0]
+    assert inputs["positive_1"] == ["1.2", 0]
+    assert fused["1.2"]["inputs"]["text"] == "a dog"
+
+
+def test_get_matching_takes_compatible_items_in_order():
+    q = execution.PromptQueue(FakeServer())
+    for number, prompt in enumerate([make_prompt(), make_prompt(steps=30), make_prompt(seed=2), make_prompt(seed=3)]):
+        q.put((number, str(number), prompt, {}, ["6"]))
+    first = q.get()
+    key = batch_key(first[0][2])
+    taken = q.get_matching(lambda item: batch_key(item[2]) == key, 1)
+    assert [item[1] for item, _ in taken] == ["2"]
+    assert len(q.currently_running) == 2
+    assert q.get()[0][1] == "1"
+    assert q.get()[0][1] == "3"
+
+
+def test_batched_prompts_match_separate_runs():
+    q = execution.PromptQueue(FakeServer())
+    prompts = [make_prompt(), make_prompt(text="a dog", seed=2), make_prompt(steps=30)]
+    for number, prompt in enumerate(prompts):
+        q.put((number, str(number), prompt, {}, ["6"]))
+
+    batcher = PromptBatcher(max_size=4)
+    batch = batcher.collect(q, q.get())
+    items = [item for item, _ in batch]
+    assert [item[1] for item in items] == ["0", "1"]
+
+    executor = execution.PromptExecutor(FakeServer())
+    BatchedSampler.server = executor.server
+    precomputed = batcher.sample(executor, items)
+    assert BatchedSampler.batches == [[1, 2]]
+    # No progress is sent for the fused prompt
+    assert BatchedSampler.progress_enabled == [False]
+    assert executor.server.progress_enabled
+    assert Loader.calls == 1
+
+    outputs = []
+    for item in items:
+        executor.execute(item[2], item[1], item[3], item[4], precomputed=precomputed[item[1]])
+        assert executor.success
+        outputs.append(executor.history_result["outputs"]["6"]["value"][0])
+    assert outputs == ["model.safetensors a cat 1 batched", "model.safetensors a dog 2 batched"]
+    assert Sampler.calls == 0
@@ -0,0 +1,123 @@
+import pytest
+import torch
+
+from comfy.cli_args import args
+
+# execution imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution
+import nodes
+
+
+class FakeServer:
+    client_id = None
+    last_node_id = None
+
+    def send_sync(self, event, data, sid=None):
+        pass
+
+
+class LoadValue:
+    RESOURCE_TYPE = "io"
+    calls = 0
+    version = 0
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    @classmethod
+    def IS_CHANGED(cls, value):
+        return cls.version
+
+    def run(self, value):
+        LoadValue.calls += 1
+        return (value + LoadValue.version,)
+
+
+class Square:
+    RESOURCE_TYPE = "cpu"
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+    def run(self, value):
+        return (value * value,)
+
+
+class Collect:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}}
+
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+    def run(self, value):
+        return {"ui": {"value": [value]}}
+
+
+TEST_NODES = {"PrefetchLoadValue": LoadValue, "PrefetchSquare": Square, "PrefetchCollect": Collect}
+
+
+@pytest.fixture(autouse=True)
+def test_nodes():
+    nodes.NODE_CLASS_MAPPINGS.update(TEST_NODES)
+    LoadValue.calls = 0
+    LoadValue.version = 0
+    yield
+    for name in TEST_NODES:
+        del nodes.NODE_CLASS_MAPPINGS[name]
+
+
+def make_prompt():
+    return {
+        "1": {"class_type": "PrefetchLoadValue", "inputs": {"value": 3}},
+        "2": {"class_type": "PrefetchSquare", "inputs": {"value": ["1", 0]}},
+        "3": {"class_type": "PrefetchCollect", "inputs": {"value": ["2", 0]}},
+    }
+
+
+def run_prefetched(prefetcher, prompt):
+    prefetched = prefetcher.take("next")
+    executor = execution.PromptExecutor(FakeServer())
+    executor.execute(prompt, "next", {}, ["3"], prefetched=prefetched)
+    return executor.history_result["outputs"]["3"]["value"][0]
+
+
+def test_prefetched_outputs_are_reused():
+    prompt = make_prompt()
+    prefetcher = execution.PromptPrefetcher()
+    prefetcher.start((0, "next", prompt, {}, ["3"]))
+    prefetcher.future.result()
+    # The queued prompt is left untouched
+    assert "is_changed" not in prompt["1"]
+    assert run_prefetched(prefetcher, prompt) == 9
+    assert LoadValue.calls == 1
+
+
+def test_changed_inputs_are_loaded_again():
+    prompt = make_prompt()
+    prefetcher = execution.PromptPrefetcher()
+    prefetcher.start((0, "next", prompt, {}, ["3"]))
+    prefetcher.future.result()
+    LoadValue.version = 1
+    assert run_prefetched(prefetcher, prompt) == 16
+    assert LoadValue.calls == 2
+
+
+def test_take_ignores_other_prompts():
+    prefetcher = execution.PromptPrefetcher()
+    prefetcher.start((0, "next", make_prompt(), {}, ["3"]))
+    assert prefetcher.take("other") is None
+    assert prefetcher.take("next") is None
@@ -0,0 +1,41 @@
+import torch
+
+from comfy.cli_args import args
+
+# execution imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution
+
+
+class FakeServer:
+    def queue_updated(self):
+        pass
+
+
+def test_task_done_listeners():
+    q = execution.PromptQueue(FakeServer())
+    seen = []
+
+    def listener(prompt_id, entry):
+        # The prompt is already in the history when listeners run
+        seen.append((prompt_id, q.get_history(prompt_id=prompt_id)[prompt_id] is entry, q.has_prompt(prompt_id)))
+
+    def broken_listener(prompt_id, entry):
+        raise RuntimeError("listener failed")
+
+    q.add_task_done_listener(broken_listener)
+    q.add_task_done_listener(listener)
+    q.put((0, "a", {}, {"client_id": "c", "api_key_comfy_org": "secret"}, []))
+    assert q.has_prompt("a")
+    assert not q.has_prompt("b")
+
+    item, item_id = q.get()
+    assert q.has_prompt("a")
+    q.task_done(item_id, {"outputs": {"1": {"images": []}}}, execution.PromptQueue.ExecutionStatus("success", True, []))
+
+    assert seen == [("a", True, False)]
+    entry = q.get_history(prompt_id="a")["a"]
+    assert entry["outputs"] == {"1": {"images": []}}
+    assert entry["prompt"][3] == {"client_id": "c"}
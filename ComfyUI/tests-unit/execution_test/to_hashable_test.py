@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+
+from comfy.cli_args import args
+
+# comfy_execution.caching imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+from comfy_execution import caching
+from comfy_execution.caching import Unhashable, tensor_fingerprint, to_hashable
+
+
+class HashableThing:
+    def __init__(self, name, weights):
+        self.name = name
+        self.weights = weights
+
+    def __comfy_hash__(self):
+        return {"name": self.name, "weights": self.weights}
+
+
+def test_equal_tensors_hash_equal():
+    a = torch.arange(100, dtype=torch.float32)
+    assert to_hashable({"x": a}) == to_hashable({"x": a.clone()})
+    assert to_hashable({"x": a}) != to_hashable({"x": a + 1})
+    assert to_hashable(a) != to_hashable(a.to(torch.float16))
+    assert to_hashable(a) != to_hashable(a.reshape(10, 10))
+
+
+def test_non_contiguous_tensor_matches_contiguous_copy():
+    a = torch.arange(64, dtype=torch.float32).reshape(8, 8).t()
+    assert to_hashable(a) == to_hashable(a.contiguous())
+
+
+def test_in_place_modification_invalidates_memo():
+    a = torch.zeros(16)
+    before = to_hashable(a)
+    a += 1
+    assert to_hashable(a) != before
+    assert to_hashable(a) == to_hashable(torch.ones(16))
+
+
+def test_fingerprint_is_memoized(monkeypatch):
+    calls = []
+    content_digest = caching._content_digest
+    monkeypatch.setattr(caching, "_content_digest", lambda *a: calls.append(a) or content_digest(*a))
+    a = torch.zeros(16)
+    tensor_fingerprint(a)
+    tensor_fingerprint(a)
+    assert len(calls) == 1
+
+
+def test_large_tensors_are_sampled_unless_exact(monkeypatch):
+    monkeypatch.setattr(caching, "TENSOR_HASH_SAMPLE_BYTES", 1024)
+    monkeypatch.setattr(caching, "TENSOR_HASH_SAMPLES", 16)
+    a = torch.zeros(4096)
+    b = torch.zeros(4096)
+    b[1] = 1.0  # not one of the 16 sampled elements
+    assert tensor_fingerprint(a) == tensor_fingerprint(b)
+    assert tensor_fingerprint(a, exact=True) != tensor_fingerprint(b, exact=True)
+
+
+def test_exact_and_sampled_fingerprints_are_memoized_apart(monkeypatch):
+    monkeypatch.setattr(caching, "TENSOR_HASH_SAMPLE_BYTES", 1024)
+    monkeypatch.setattr(caching, "TENSOR_HASH_SAMPLES", 16)
+    a = torch.arange(4096, dtype=torch.float32)
+    sampled = tensor_fingerprint(a.clone())
+    exact = tensor_fingerprint(a.clone(), exact=True)
+    assert sampled != exact
+    # Whichever kind is asked for first, each call gets the kind it asked for
+    assert tensor_fingerprint(a, exact=True) == exact
+    assert tensor_fingerprint(a) == sampled
+    b = a.clone()
+    assert tensor_fingerprint(b) == sampled
+    assert tensor_fingerprint(b, exact=True) == exact
+
+
+def test_numpy_arrays():
+    a = np.arange(10, dtype=np.int32)
+    assert to_hashable(a) == to_hashable(a.copy())
+    assert to_hashable(a) != to_hashable(a.astype(np.int64))
+    assert isinstance(to_hashable(np.array([object()])), Unhashable)
+
+
+def test_comfy_hash_protocol():
+    weights = torch.ones(4)
+    assert to_hashable(HashableThing("a", weights)) == to_hashable(HashableThing("a", weights.clone()))
+    assert to_hashable(HashableThing("a", weights)) != to_hashable(HashableThing("b", weights))
+    assert isinstance(to_hashable(object()), Unhashable)
@@ -0,0 +1,134 @@
+import pytest
+import torch
+
+from comfy.cli_args import args
+
+# execution imports nodes, which initializes the torch device
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution
+import nodes
+
+
+class CountingSource:
+    input_types_calls = 0
+    validate_calls = 0
+
+    @classmethod
+    def INPUT_TYPES(cls):
+        cls.input_types_calls += 1
+        return {"required": {"value": ("INT", {"default": 0, "min": 0, "max": 10}),
+                             "mode": (["a", "b"],),
+                             "label": ("STRING",)}}
+
+    RETURN_TYPES = ("INT",)
+    FUNCTION = "run"
+
+
+class CheckedSource(CountingSource):
+    @classmethod
+    def VALIDATE_INPUTS(cls, label):
+        cls.validate_calls += 1
+        return True
+
+
+class CountingOutput:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",), "text": ("STRING", {"multiline": True})}}
+
+    RETURN_TYPES = ()
+    FUNCTION = "run"
+    OUTPUT_NODE = True
+
+
+@pytest.fixture(autouse=True)
+def test_nodes():
+    nodes.NODE_CLASS_MAPPINGS["CountingSource"] = CountingSource
+    nodes.NODE_CLASS_MAPPINGS["CountingOutput"] = CountingOutput
+    nodes.NODE_CLASS_MAPPINGS["CheckedSource"] = CheckedSource
+    CountingSource.input_types_calls = 0
+    CheckedSource.input_types_calls = 0
+    CheckedSource.validate_calls = 0
+    execution.validation_cache.clear()
+    yield
+    del nodes.NODE_CLASS_MAPPINGS["CountingSource"]
+    del nodes.NODE_CLASS_MAPPINGS["CountingOutput"]
+    del nodes.NODE_CLASS_MAPPINGS["CheckedSource"]
+    execution.validation_cache.clear()
+
+
+def make_prompt(value="5", text="a cat", mode="a", source="CountingSource"):
+    return {
+        "1": {"class_type": source, "inputs": {"value": value, "mode": mode, "label": "x"}},
+        "2": {"class_type": "CountingOutput", "inputs": {"value": ["1", 0], "text": text}},
+    }
+
+
+def test_unchanged_nodes_are_not_revalidated():
+    assert execution.validate_prompt(make_prompt())[0] is True
+    assert CountingSource.input_types_calls == 1
+
+    prompt = make_prompt(text="a dog")
+    assert execution.validate_prompt(prompt)[0] is True
+    assert CountingSource.input_types_calls == 1
+    # Conversions done during validation are still applied on a cache hit
+    assert prompt["1"]["inputs"]["value"] == 5
+
+
+def test_changed_inputs_are_revalidated():
+    execution.validate_prompt(make_prompt())
+    execution.validate_prompt(make_prompt(value="6"))
+    assert CountingSource.input_types_calls == 2
+
+
+def test_validate_inputs_always_runs():
+    for _ in range(2):
+        assert execution.validate_prompt(make_prompt(source="CheckedSource"))[0] is True
+    assert CheckedSource.validate_calls == 2
+
+
+def test_failures_are_not_cached():
+    for _ in range(2):
+        valid, _, _, node_errors = execution.validate_prompt(make_prompt(value="11"))
+        assert valid is False
+        assert node_errors["1"]["errors"][0]["type"] == "value_bigger_than_max"
+    assert CountingSource.input_types_calls == 2
+
+
+def test_upstream_failure_still_reported_on_hit():
+    execution.validate_prompt(make_prompt())
+    valid, _, _, node_errors = execution.validate_prompt(make_prompt(mode="c"))
+    assert valid is False
+    assert list(node_errors) == ["1"]
+
+
+def test_filename_list_change_invalidates(monkeypatch):
+    execution.validate_prompt(make_prompt())
+    monkeypatch.setattr(execution.folder_paths, "filename_list_version", execution.folder_paths.filename_list_version + 1)
+    execution.validate_prompt(make_prompt())
+    assert CountingSource.input_types_calls == 2
+
+
+def test_input_directory_change_invalidates(tmp_path, monkeypatch):
+    monkeypatch.setattr(execution.folder_paths, "input_directory", str(tmp_path))
+    execution.validate_prompt(make_prompt())
+    (tmp_path / "added.png").write_bytes(b"")
+    execution.validate_prompt(make_prompt())
+    assert CountingSource.input_types_calls == 2
+
+
+def test_deleted_input_file_fails_validation(tmp_path, monkeypatch):
+    from PIL import Image
+    monkeypatch.setattr(execution.folder_paths, "input_directory", str(tmp_path))
+    Image.new("RGB", (8, 8)).save(tmp_path / "cat.png")
+    prompt = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "cat.png"}},
+        "2": {"class_type": "PreviewImage", "inputs": {"images": ["1", 0]}},
+    }
+    assert execution.validate_prompt(prompt)[0] is True
+    (tmp_path / "cat.png").unlink()
+    valid, _, _, node_errors = execution.validate_prompt(prompt)
+    assert valid is False
+    assert "1" in node_errors
@@ -0,0 +1,64 @@
+"""
+Measures listing a model folder tree: the old serial os.walk listing, the
+scandir crawler with one and with several threads, and a restart that starts
+from a folder snapshot. Point --directory at a network mount to see the
+effect of latency; without it a synthetic tree is created in a temp dir.
+
+    python -m tests.benchmarks.folder_scan_benchmark --dirs 2000 --files 10 --workers 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.folder_index import crawl
+
+
+def walk(directory):
+    result = []
+    dirs = {directory: os.path.getmtime(directory)}
+    for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
+        result.extend(os.path.relpath(os.path.join(dirpath, f), directory) for f in filenames)
+        for d in subdirs:
+            dirs[os.path.join(dirpath, d)] = os.path.getmtime(os.path.join(dirpath, d))
+    return result, dirs
+
+
+def make_tree(root, dirs, files):
+    for d in range(dirs):
+        path = os.path.join(root, "group{}".format(d % 50), "model{}".format(d))
+        os.makedirs(path)
+        for f in range(files):
+            open(os.path.join(path, "weights{}.safetensors".format(f)), "wb").close()
+
+
+def timed(label, function):
+    start = time.perf_counter()
+    count = function()
+    print(f"{label:24} {(time.perf_counter() - start) * 1000:9.1f} ms  {count} files")  # noqa: T201
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing model folders")
+    parser.add_argument("--directory", type=str, default=None)
+    parser.add_argument("--dirs", type=int, default=2000)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=16)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = options.directory
+        if directory is None:
+            directory = os.path.join(temp_dir, "models")
+            make_tree(directory, options.dirs, options.files)
+        snapshots = os.path.join(temp_dir, "snapshots")
+
+        timed("os.walk", lambda: len(walk(directory)[0]))
+        timed("scandir, 1 thread", lambda: len(crawl(directory, workers=1).files))
+        timed(f"scandir, {options.workers} threads", lambda: len(crawl(directory, workers=options.workers).files))
+        timed("first run with snapshot", lambda: len(crawl(directory, workers=options.workers, snapshot_dir=snapshots).files))
+        timed("restart from snapshot", lambda: len(crawl(directory, workers=options.workers, snapshot_dir=snapshots).files))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures how long loading the nodes takes at startup (importing nodes.py and
+init_extra_nodes) with all modules imported, with --lazy-node-imports while
+the manifest is written, and with --lazy-node-imports from the manifest. Each
+run is a fresh interpreter, with and without --disable-api-nodes.
+
+Only startup is measured. With --lazy-node-imports only the info of the API
+nodes comes from the manifest, the first /object_info request still imports
+every comfy_extras module.
+
+    python -m tests.benchmarks.node_startup_benchmark --runs 3
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def child(argv):
+    import comfy.options
+    comfy.options.enable_args_parsing()
+    sys.argv = [sys.argv[0]] + argv
+    from comfy.cli_args import args
+    args.cpu = True
+    import folder_paths
+    if args.user_directory:
+        folder_paths.set_user_directory(args.user_directory)
+
+    start = time.perf_counter()
+    # Imported before nodes.py puts comfy/ first on sys.path, like main.py does
+    import utils.extra_config  # noqa: F401
+    import nodes
+    nodes.init_extra_nodes(init_custom_nodes=False, init_api_nodes=not args.disable_api_nodes)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "nodes": len(nodes.NODE_CLASS_MAPPINGS), "modules": len(sys.modules)}))  # noqa: T201
+
+
+def run(argv):
+    output = subprocess.run([sys.executable, "-m", "tests.benchmarks.node_startup_benchmark", "--child"] + argv,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading nodes at startup")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true")
+    options, rest = parser.parse_known_args()
+    if options.child:
+        return child(rest)
+
+    for api_nodes in ([], ["--disable-api-nodes"]):
+        with tempfile.TemporaryDirectory() as user_dir:
+            lazy = ["--lazy-node-imports", "--user-directory", user_dir]
+            results = [("eager", run(api_nodes)), ("lazy, writing manifest", run(api_nodes + lazy))]
+            results += [("lazy, from manifest", run(api_nodes + lazy)) for _ in range(options.runs)]
+            results += [("eager", run(api_nodes)) for _ in range(options.runs - 1)]
+
+        print(" ".join(api_nodes) or "api nodes enabled")  # noqa: T201
+        for label in ("eager", "lazy, writing manifest", "lazy, from manifest"):
+            runs = [r for l, r in results if l == label]
+            print(f"  {label:24} {statistics.median(r['seconds'] for r in runs) * 1000:8.0f} ms  {runs[0]['nodes']} nodes, {runs[0]['modules']} modules imported")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
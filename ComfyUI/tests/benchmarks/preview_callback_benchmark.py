@@ -0,0 +1,82 @@
+"""
+Measures the sampler step callback from latent_preview.prepare_callback with
+previews off and with Latent2RGB previews, and the cost of prepare_callback
+itself, which runs once per sampler node.
+
+    python -m tests.benchmarks.preview_callback_benchmark --steps 200 --size 1024
+"""
+import argparse
+import statistics
+import time
+from types import SimpleNamespace
+
+import torch
+
+from comfy.cli_args import args, LatentPreviewMethod
+
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.latent_formats
+import comfy.model_management
+import comfy.utils
+import latent_preview
+
+
+def fake_model(latent_format):
+    return SimpleNamespace(load_device=comfy.model_management.get_torch_device(), model=SimpleNamespace(latent_format=latent_format))
+
+
+def time_steps(model, steps, x0):
+    callback = latent_preview.prepare_callback(model, steps)
+    timings = []
+    for step in range(steps):
+        start = time.perf_counter()
+        callback(step, x0, x0, steps)
+        if x0.is_cuda:
+            torch.cuda.synchronize()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def time_prepare(model, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        latent_preview.prepare_callback(model, 20)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:36} mean {statistics.mean(timings):8.3f} ms  median {statistics.median(timings):8.3f} ms  max {max(timings):8.3f} ms")  # noqa: T201
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-step sampler preview callback")
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--size", type=int, default=1024, help="Image size in pixels, the latent is 1/8 of it")
+    options = parser.parse_args()
+
+    model = fake_model(comfy.latent_formats.SD15())
+    device = model.load_device
+    x0 = torch.randn((1, 4, options.size // 8, options.size // 8), device=device)
+    comfy.utils.set_progress_bar_global_hook(lambda value, total, preview: None)
+    print(f"{options.steps} steps of a {options.size}x{options.size} image on {device}")  # noqa: T201
+
+    for label, method in (("previews off", LatentPreviewMethod.NoPreviews), ("latent2rgb previews", LatentPreviewMethod.Latent2RGB)):
+        args.preview_method = method
+        time_steps(model, 3, x0)
+        report(f"step callback, {label}", time_steps(model, options.steps, x0))
+
+    args.preview_method = LatentPreviewMethod.Latent2RGB
+    report("prepare_callback, cached", time_prepare(model, options.steps))
+    timings = []
+    for _ in range(options.steps):
+        latent_preview.previewer_cache.clear()
+        timings.extend(time_prepare(model, 1))
+    report("prepare_callback, uncached", timings)
+
+
+if __name__ == "__main__":
+    main()
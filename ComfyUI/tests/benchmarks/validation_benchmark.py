@@ -0,0 +1,95 @@
+"""
+Measures execution.validate_prompt on a ~500 node graph.
+
+The graph is 67 copies of a txt2img or img2img pipeline (checkpoint loader,
+two text encoders, empty latent or LoadImage + VAEEncode, KSampler, VAE
+decode, SaveImage), 502 nodes in total. Between runs only the seeds and
+prompt texts change, which is what DreamLayer sends.
+
+    python -m tests.benchmarks.validation_benchmark --runs 20
+"""
+import argparse
+import gc
+import os
+import statistics
+import tempfile
+import time
+
+from comfy.cli_args import args
+
+args.cpu = True
+
+import execution
+import folder_paths
+
+PIPELINES = 67
+
+
+def build_prompt(checkpoints, images, run):
+    prompt = {}
+    for i in range(PIPELINES):
+        n = i * 8
+        ids = [str(n + k) for k in range(8)]
+        prompt[ids[0]] = {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": checkpoints[i % len(checkpoints)]}}
+        prompt[ids[1]] = {"class_type": "CLIPTextEncode", "inputs": {"text": f"a photo of a cat, run {run}", "clip": [ids[0], 1]}}
+        prompt[ids[2]] = {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": [ids[0], 1]}}
+        if i % 2 == 0:
+            prompt[ids[3]] = {"class_type": "EmptyLatentImage", "inputs": {"width": 512, "height": 512, "batch_size": 1}}
+        else:
+            prompt[ids[7]] = {"class_type": "LoadImage", "inputs": {"image": images[i % len(images)]}}
+            prompt[ids[3]] = {"class_type": "VAEEncode", "inputs": {"pixels": [ids[7], 0], "vae": [ids[0], 2]}}
+        prompt[ids[4]] = {"class_type": "KSampler", "inputs": {
+            "seed": run * 1000 + i, "steps": 20, "cfg": 7.0, "sampler_name": "euler", "scheduler": "normal", "denoise": 1.0,
+            "model": [ids[0], 0], "positive": [ids[1], 0], "negative": [ids[2], 0], "latent_image": [ids[3], 0]}}
+        prompt[ids[5]] = {"class_type": "VAEDecode", "inputs": {"samples": [ids[4], 0], "vae": [ids[0], 2]}}
+        prompt[ids[6]] = {"class_type": "SaveImage", "inputs": {"filename_prefix": "DreamLayer", "images": [ids[5], 0]}}
+    return prompt
+
+
+def time_validation(checkpoints, images, runs, warm):
+    timings = []
+    for run in range(runs):
+        if not warm:
+            execution.validation_cache.clear()
+        prompt = build_prompt(checkpoints, images, run)
+        gc.collect()
+        start = time.perf_counter()
+        valid = execution.validate_prompt(prompt)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert valid[0] is True, valid
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt validation on a 500 node graph")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--checkpoints", type=int, default=200, help="Number of files in the checkpoint list")
+    parser.add_argument("--input-images", type=int, default=500, help="Number of files in the input directory")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir, tempfile.TemporaryDirectory() as input_dir:
+        checkpoints = []
+        for i in range(options.checkpoints):
+            name = f"model_{i:04d}.safetensors"
+            open(os.path.join(checkpoint_dir, name), "wb").close()
+            checkpoints.append(name)
+        folder_paths.folder_names_and_paths["checkpoints"] = ([checkpoint_dir], folder_paths.supported_pt_extensions)
+        images = []
+        for i in range(options.input_images):
+            name = f"input_{i:04d}.png"
+            open(os.path.join(input_dir, name), "wb").close()
+            images.append(name)
+        folder_paths.set_input_directory(input_dir)
+
+        print(f"Validating {len(build_prompt(checkpoints, images, 0))} nodes, {options.runs} runs")  # noqa: T201
+        for label, warm in (("uncached", False), ("cached", True)):
+            execution.validation_cache.clear()
+            timings = time_validation(checkpoints, images, options.runs, warm)
+            # The first cached run fills the cache
+            steady = timings[1:] if warm and len(timings) > 1 else timings
+            print(f"{label:9} mean {statistics.mean(steady):8.2f} ms  median {statistics.median(steady):8.2f} ms  max {max(steady):8.2f} ms")  # noqa: T201
+        print(f"cache hits {execution.validation_cache.hits}, misses {execution.validation_cache.misses}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Benchmark harness for the DreamLayer backend, see run_benchmark.py"""
@@ -0,0 +1,286 @@
+"""
+Fake ComfyUI Server
+
+A stand-in for ComfyUI used by the benchmark harness. It implements just
+enough of ComfyUI's HTTP API for the DreamLayer backend to run end to end on
+a CPU-only box with no network:
+
+    GET  /                     liveness
+    POST /prompt               queue a prompt, returns prompt_id
+    GET  /queue                running and pending prompts
+    GET  /history/{prompt_id}  outputs of a finished prompt
+    GET  /ws                   websocket that sends a status message
+    GET  /models               model folders
+    GET  /models/{folder}      model filenames
+    POST /interrupt            no-op
+
+Prompts run one at a time, like ComfyUI. Each "execution" sleeps for
+execution_delay plus step_delay per sampler step and writes a small PNG for
+every SaveImage node into the output directory, where the backend expects it.
+"""
+
+import os
+import json
+import time
+import uuid
+import zlib
+import base64
+import struct
+import hashlib
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+DEFAULT_MODELS = {
+    "checkpoints": ["v1-6-pruned-emaonly-fp16.safetensors", "sdxl_base_1.0.safetensors"],
+    "loras": ["detail_tweaker.safetensors"],
+    "controlnet": ["control_v11p_sd15_canny.safetensors"],
+    "upscale_models": ["RealESRGAN_x4plus.pth"],
+    "vae": ["vae-ft-mse-840000-ema-pruned.safetensors"],
+}
+
+
+def make_png(width: int = 8, height: int = 8, color=(128, 64, 192)) -> bytes:
+    """Encode a solid-color RGB PNG using only the standard library"""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(color) * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+class FakeComfyUI:
+    """In-memory prompt queue and history with simulated execution time"""
+
+    def __init__(self, output_dir: str, execution_delay: float = 0.5, step_delay: float = 0.0,
+                 models: Optional[Dict[str, List[str]]] = None):
+        self.output_dir = output_dir
+        self.execution_delay = execution_delay
+        self.step_delay = step_delay
+        self.models = models or DEFAULT_MODELS
+        self.pending = deque()
+        self.running = None
+        self.history: Dict[str, Dict[str, Any]] = {}
+        self.number = 0
+        self.executed = 0
+        self.written_files: List[str] = []
+        self.cond = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="fake-comfyui-worker", daemon=True)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self):
+        self._worker.start()
+
+    def stop(self):
+        with self.cond:
+            self._stopped = True
+            self.cond.notify_all()
+
+    def queue_prompt(self, prompt: Dict[str, Any], extra_data: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_id = str(uuid.uuid4())
+        with self.cond:
+            number = self.number
+            self.number += 1
+            self.pending.append([number, prompt_id, prompt, extra_data, []])
+            self.cond.notify()
+        return {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+
+    def get_queue(self) -> Dict[str, Any]:
+        with self.cond:
+            return {
+                "queue_running": [self.running] if self.running else [],
+                "queue_pending": list(self.pending),
+            }
+
+    def get_history(self, prompt_id: str) -> Dict[str, Any]:
+        with self.cond:
+            if prompt_id in self.history:
+                return {prompt_id: self.history[prompt_id]}
+            return {}
+
+    def _execution_time(self, prompt: Dict[str, Any]) -> float:
+        steps = 0
+        for node in prompt.values():
+            if isinstance(node, dict) and "steps" in node.get("inputs", {}):
+                try:
+                    steps += int(node["inputs"]["steps"])
+                except (TypeError, ValueError):
+                    pass
+        return self.execution_delay + self.step_delay * steps
+
+    def _execute(self, item) -> Dict[str, Any]:
+        _, prompt_id, prompt, _, _ = item
+        start = time.time()
+        time.sleep(self._execution_time(prompt))
+
+        outputs = {}
+        for node_id, node in prompt.items():
+            if not isinstance(node, dict) or node.get("class_type") != "SaveImage":
+                continue
+            prefix = os.path.basename(str(node.get("inputs", {}).get("filename_prefix", "ComfyUI")))
+            filename = f"{prefix}_{prompt_id[:8]}_{node_id}_00001_.png"
+            path = os.path.join(self.output_dir, filename)
+            with open(path, "wb") as f:
+                f.write(make_png())
+            with self.cond:
+                self.written_files.append(path)
+            outputs[node_id] = {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+
+        return {
+            "prompt": item,
+            "outputs": outputs,
+            "status": {"status_str": "success", "completed": True, "messages": []},
+            "execution_time": time.time() - start,
+        }
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self._stopped:
+                    self.cond.wait()
+                if self._stopped:
+                    return
+                self.running = self.pending.popleft()
+                item = self.running
+            entry = self._execute(item)
+            with self.cond:
+                self.history[item[1]] = entry
+                self.running = None
+                self.executed += 1
+
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeComfyUI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def comfy(self) -> FakeComfyUI:
+        return self.server.comfy
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: Any, status: int = 200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/":
+            self._send_json({"status": "ok"})
+        elif path == "/queue":
+            self._send_json(self.comfy.get_queue())
+        elif path.startswith("/history/"):
+            self._send_json(self.comfy.get_history(path[len("/history/"):]))
+        elif path == "/models":
+            self._send_json(sorted(self.comfy.models.keys()))
+        elif path.startswith("/models/"):
+            folder = path[len("/models/"):]
+            if folder not in self.comfy.models:
+                self._send_json({"error": "not found"}, 404)
+            else:
+                self._send_json(self.comfy.models[folder])
+        elif path == "/ws":
+            self._handle_websocket()
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/prompt":
+            try:
+                data = self._read_json()
+            except json.JSONDecodeError:
+                self._send_json({"error": "invalid json"}, 400)
+                return
+            prompt = data.get("prompt")
+            if not isinstance(prompt, dict) or not prompt:
+                self._send_json({"error": {"type": "no_prompt", "message": "No prompt provided"}}, 400)
+                return
+            self._send_json(self.comfy.queue_prompt(prompt, data.get("extra_data", {})))
+        elif path == "/interrupt":
+            self._read_json()
+            self._send_json({})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _handle_websocket(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key:
+            self._send_json({"error": "websocket upgrade required"}, 400)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+
+        queue = self.comfy.get_queue()
+        message = json.dumps({"type": "status", "data": {"status": {"exec_info": {
+            "queue_remaining": len(queue["queue_running"]) + len(queue["queue_pending"])}},
+            "sid": str(uuid.uuid4())}}).encode("utf-8")
+        header = b"\x81" + (bytes([len(message)]) if len(message) < 126 else b"\x7e" + struct.pack(">H", len(message)))
+        self.wfile.write(header + message)
+        self.wfile.flush()
+        # Hold the connection until the client goes away
+        try:
+            while self.rfile.read(1):
+                pass
+        except OSError:
+            pass
+        self.close_connection = True
+
+
+def start_fake_comfyui(output_dir: str, host: str = "127.0.0.1", port: int = 8188,
+                       execution_delay: float = 0.5, step_delay: float = 0.0):
+    """
+    Start the fake server in a background thread.
+
+    Returns:
+        The ThreadingHTTPServer; call shutdown() and server.comfy.stop() to stop it
+    """
+    comfy = FakeComfyUI(output_dir, execution_delay=execution_delay, step_delay=step_delay)
+    comfy.start()
+    httpd = ThreadingHTTPServer((host, port), FakeComfyUIHandler)
+    httpd.daemon_threads = True
+    httpd.comfy = comfy
+    threading.Thread(target=httpd.serve_forever, name="fake-comfyui-http", daemon=True).start()
+    return httpd
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake ComfyUI server for benchmarking")
+    parser.add_argument("--output-dir", required=True, help="Directory SaveImage outputs are written to")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--execution-delay", type=float, default=0.5, help="Seconds per prompt")
+    parser.add_argument("--step-delay", type=float, default=0.0, help="Extra seconds per sampler step")
+    args = parser.parse_args()
+
+    httpd = start_fake_comfyui(args.output_dir, args.host, args.port, args.execution_delay, args.step_delay)
+    print(f"Fake ComfyUI listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        httpd.shutdown()
+        httpd.comfy.stop()
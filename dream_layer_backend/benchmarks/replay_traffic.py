@@ -0,0 +1,239 @@
+"""
+Traffic Replay Tool
+
+Re-issues requests captured by dream_layer_backend_utils.traffic_recorder
+(DREAMLAYER_RECORD_TRAFFIC) in their original order, either against the
+DreamLayer backend or directly against ComfyUI's /prompt, so cache hit rates,
+queue behaviour and latency can be compared across builds.
+
+Usage (from dream_layer_backend/):
+    python -m benchmarks.replay_traffic ARCHIVE_DIR --target backend
+    python -m benchmarks.replay_traffic ARCHIVE_DIR --target comfyui --speed 4
+    python -m benchmarks.replay_traffic ARCHIVE_DIR --speed 0 --output replay.json
+
+--speed 1 keeps the original inter-arrival times, --speed 4 replays four
+times faster and --speed 0 sends every request as soon as the previous one
+was sent. Requests are always started in recorded order.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from benchmarks.run_benchmark import COMFY_INPUT_DIR, compare_to_baseline, percentile
+from dream_layer_backend_utils.traffic_recorder import ARCHIVE_FILENAME
+
+DEFAULT_BACKEND_URLS = {
+    "/api/txt2img": "http://127.0.0.1:5001",
+    "/api/img2img": "http://127.0.0.1:5004",
+    "/api/extras/upscale": "http://127.0.0.1:5003",
+}
+DEFAULT_COMFY_URL = "http://127.0.0.1:8188"
+
+
+def load_records(archive_dir: str, endpoints: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Read recorded requests in start order, optionally keeping only some endpoints"""
+    records = []
+    with open(os.path.join(archive_dir, ARCHIVE_FILENAME), encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if endpoints and record["endpoint"] not in endpoints:
+                continue
+            records.append(record)
+    records.sort(key=lambda r: r["started_at"])
+    return records
+
+
+def _read_blob(archive_dir: str, ref: Dict[str, Any]) -> bytes:
+    with open(os.path.join(archive_dir, "blobs", ref["$blob"]), "rb") as f:
+        return f.read()
+
+
+def restore_blobs(archive_dir: str, value: Any) -> Any:
+    """Replace {"$blob": ...} references with the base64 strings they replaced"""
+    if isinstance(value, dict):
+        if "$blob" in value:
+            data = base64.b64encode(_read_blob(archive_dir, value)).decode()
+            if value.get("data_url"):
+                return f"data:{value.get('content_type', 'application/octet-stream')};base64,{data}"
+            return data
+        return {key: restore_blobs(archive_dir, item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [restore_blobs(archive_dir, item) for item in value]
+    return value
+
+
+def send_to_backend(archive_dir: str, record: Dict[str, Any], base_urls: Dict[str, str]) -> bool:
+    """Re-issue a recorded request to the backend endpoint it was captured from"""
+    url = base_urls[record["endpoint"]] + record["endpoint"]
+    payload = record["request"]
+    if "files" in payload and "form" in payload:
+        files = {
+            name: (ref.get("filename") or name, _read_blob(archive_dir, ref),
+                   ref.get("content_type", "application/octet-stream"))
+            for name, ref in payload["files"].items()
+        }
+        response = requests.post(url, data=payload["form"], files=files, timeout=3600)
+    else:
+        response = requests.post(url, json=restore_blobs(archive_dir, payload), timeout=3600)
+    return response.status_code == 200 and response.json().get("status") == "success"
+
+
+def prepare_comfy_prompt(archive_dir: str, recorded_prompt: Dict[str, Any], input_dir: str) -> Dict[str, Any]:
+    """
+    Restore the base64 data and the files a recorded prompt loads into
+    input_dir and point the prompt at them, so it runs even after the backend
+    cleaned its temp files up.
+    """
+    # restore_blobs returns a copy, the record is left as it is
+    prompt = restore_blobs(archive_dir, recorded_prompt["prompt"])
+    for location, ref in recorded_prompt.get("input_files", {}).items():
+        node_id, key = location.split(".", 1)
+        filename = os.path.basename(ref["path"])
+        path = os.path.join(input_dir, filename)
+        if not os.path.exists(path):
+            os.makedirs(input_dir, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(_read_blob(archive_dir, ref))
+        prompt[node_id]["inputs"][key] = path if os.path.isabs(ref["path"]) else filename
+    return prompt
+
+
+def wait_for_comfy_prompt(comfy_url: str, prompt_id: str, timeout: float = 3600) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        history = requests.get(f"{comfy_url}/history/{prompt_id}", timeout=30).json()
+        if prompt_id in history:
+            return history[prompt_id].get("status", {}).get("status_str", "success") == "success"
+        time.sleep(0.1)
+    return False
+
+
+def send_to_comfyui(archive_dir: str, record: Dict[str, Any], comfy_url: str, input_dir: str) -> bool:
+    """Queue the record's ComfyUI prompts one after another and wait for each"""
+    ok = bool(record["prompts"])
+    for recorded_prompt in record["prompts"]:
+        prompt = prepare_comfy_prompt(archive_dir, recorded_prompt, input_dir)
+        response = requests.post(f"{comfy_url}/prompt", json={"prompt": prompt}, timeout=60)
+        if response.status_code != 200 or "prompt_id" not in response.json():
+            return False
+        ok = wait_for_comfy_prompt(comfy_url, response.json()["prompt_id"]) and ok
+    return ok
+
+
+def replay(records: List[Dict[str, Any]], send, speed: float, max_in_flight: int) -> Dict[str, Any]:
+    """
+    Start each record at its original offset divided by speed and collect latencies.
+
+    Returns:
+        Summary with per-endpoint and overall latency percentiles and throughput
+    """
+    if not records:
+        return {"scenarios": {}}
+    results = [None] * len(records)
+    origin = records[0]["started_at"]
+
+    def run(index: int):
+        start = time.perf_counter()
+        try:
+            ok = send(records[index])
+        except Exception as e:
+            print(f"Request {index} ({records[index]['endpoint']}) failed: {e}")
+            ok = False
+        results[index] = (time.perf_counter() - start, ok)
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for index, record in enumerate(records):
+            if speed > 0:
+                delay = (record["started_at"] - origin) / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, index)
+    wall = time.perf_counter() - wall_start
+
+    by_endpoint: Dict[str, List] = {}
+    for record, result in zip(records, results):
+        by_endpoint.setdefault(record["endpoint"], []).append(result)
+        by_endpoint.setdefault("all", []).append(result)
+
+    summary = {}
+    for endpoint, endpoint_results in by_endpoint.items():
+        latencies = [latency * 1000 for latency, ok in endpoint_results if ok]
+        summary[endpoint] = {
+            "requests": len(endpoint_results),
+            "errors": sum(1 for _, ok in endpoint_results if not ok),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        }
+    return {"scenarios": summary, "wall_seconds": wall}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded DreamLayer generation traffic")
+    parser.add_argument("archive_dir", help="Directory given to DREAMLAYER_RECORD_TRAFFIC when recording")
+    parser.add_argument("--target", choices=["backend", "comfyui"], default="backend")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Pacing multiplier; 1 = original timing, 0 = as fast as possible")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="Maximum concurrent requests")
+    parser.add_argument("--endpoints", help="Comma-separated endpoints to replay (default: all)")
+    parser.add_argument("--backend-url", action="append", default=[], metavar="ENDPOINT=URL",
+                        help="Override a backend base URL, e.g. /api/txt2img=http://host:5001")
+    parser.add_argument("--comfy-url", default=DEFAULT_COMFY_URL)
+    parser.add_argument("--comfy-input-dir", default=COMFY_INPUT_DIR,
+                        help="Where recorded input files are restored for --target comfyui")
+    parser.add_argument("--output", help="Write the replay summary JSON here")
+    parser.add_argument("--baseline", help="Compare against a previous replay summary")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",")] if args.endpoints else None
+    records = load_records(args.archive_dir, endpoints)
+    print(f"Loaded {len(records)} recorded requests from {args.archive_dir}")
+
+    if args.target == "backend":
+        base_urls = dict(DEFAULT_BACKEND_URLS)
+        for override in args.backend_url:
+            endpoint, url = override.split("=", 1)
+            base_urls[endpoint] = url.rstrip("/")
+        send = lambda record: send_to_backend(args.archive_dir, record, base_urls)
+    else:
+        send = lambda record: send_to_comfyui(args.archive_dir, record, args.comfy_url, args.comfy_input_dir)
+
+    summary = replay(records, send, args.speed, args.max_in_flight)
+    summary.update({"target": args.target, "speed": args.speed, "archive": os.path.abspath(args.archive_dir)})
+
+    for endpoint, m in summary["scenarios"].items():
+        print(f"{endpoint:22} {m['requests'] - m['errors']:>4}/{m['requests']:<4} p50 {m['p50_ms']:9.1f} ms"
+              f"  p95 {m['p95_ms']:9.1f} ms  p99 {m['p99_ms']:9.1f} ms  {m['throughput_rps']:.2f} req/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(summary, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
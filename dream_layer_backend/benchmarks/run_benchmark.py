@@ -0,0 +1,367 @@
+"""
+Backend Benchmark Harness
+
+Starts the DreamLayer backend servers against the fake ComfyUI server and
+drives /api/txt2img, /api/img2img and /api/extras/upscale at a fixed
+concurrency. Reports p50/p95/p99 latency, throughput, backend CPU time and
+memory per scenario, and can save or compare against a JSON baseline.
+
+Usage (from dream_layer_backend/):
+    python -m benchmarks.run_benchmark --requests 20 --concurrency 4
+    python -m benchmarks.run_benchmark --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmark --baseline benchmarks/baseline.json
+
+Ports 8188 (fake ComfyUI), 5001, 5003 and 5004 must be free. Nothing is
+fetched from the network and no GPU is needed.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import base64
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+from benchmarks.fake_comfyui import make_png, start_fake_comfyui
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMFY_INPUT_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "ComfyUI", "input")
+SERVED_IMAGES_DIR = os.path.join(BACKEND_DIR, "served_images")
+
+# Scenario name -> (server script, port)
+SERVERS = {
+    "txt2img": ("txt2img_server.py", 5001),
+    "img2img": ("img2img_server.py", 5004),
+    "upscale": ("extras.py", 5003),
+}
+
+# Metrics where a higher value is better; everything else is lower-is-better
+HIGHER_IS_BETTER = {"throughput_rps"}
+COMPARED_METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_rps", "cpu_seconds_per_request", "rss_mb"]
+
+# Absolute differences below these are measurement noise, not regressions
+NOISE_FLOOR = {"p50_ms": 5.0, "p95_ms": 5.0, "p99_ms": 5.0, "cpu_seconds_per_request": 0.01, "rss_mb": 5.0}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def txt2img_request(base_url: str, index: int) -> requests.Response:
+    return requests.post(f"{base_url}/api/txt2img", json={
+        "prompt": f"benchmark prompt {index}, highly detailed",
+        "negative_prompt": "blurry",
+        "model_name": "v1-6-pruned-emaonly-fp16.safetensors",
+        "width": 512, "height": 512, "batch_size": 1, "steps": 20,
+        "cfg_scale": 7.0, "sampler_name": "euler", "scheduler": "normal",
+        "seed": index + 1,
+    }, timeout=600)
+
+
+def img2img_request(base_url: str, index: int) -> requests.Response:
+    image = "data:image/png;base64," + base64.b64encode(make_png(64, 64)).decode()
+    return requests.post(f"{base_url}/api/img2img", json={
+        "prompt": f"benchmark prompt {index}",
+        "negative_prompt": "blurry",
+        "input_image": image,
+        "denoising_strength": 0.75,
+        "model_name": "v1-6-pruned-emaonly-fp16.safetensors",
+        "width": 512, "height": 512, "batch_size": 1, "steps": 20,
+        "seed": index + 1,
+    }, timeout=600)
+
+
+def upscale_request(base_url: str, index: int) -> requests.Response:
+    return requests.post(
+        f"{base_url}/api/extras/upscale",
+        files={"image": (f"bench_{index}.png", make_png(64, 64), "image/png")},
+        data={"params": json.dumps({"upscaler_model": "RealESRGAN_x4plus.pth", "output_format": "png"})},
+        timeout=600)
+
+
+SCENARIOS: Dict[str, Callable[[str, int], requests.Response]] = {
+    "txt2img": txt2img_request,
+    "img2img": img2img_request,
+    "upscale": upscale_request,
+}
+
+
+def _process_tree(pid: int) -> List[Any]:
+    if psutil is None:
+        return []
+    try:
+        process = psutil.Process(pid)
+        return [process] + process.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def _cpu_seconds(processes: List[Any]) -> Optional[float]:
+    if psutil is None:
+        return None
+    total = 0.0
+    for process in processes:
+        try:
+            times = process.cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            pass
+    return total
+
+
+def _rss_mb(processes: List[Any]) -> Optional[float]:
+    if psutil is None:
+        return None
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+
+def _backend_output_dir() -> str:
+    """Ask the backend where ComfyUI outputs are expected (settings.json aware)"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", "from dream_layer import get_directories; print(get_directories()[0])"],
+        cwd=BACKEND_DIR, text=True)
+    return output.strip().splitlines()[-1]
+
+
+def _list_dir(path: str) -> set:
+    try:
+        return set(os.listdir(path))
+    except FileNotFoundError:
+        return set()
+
+
+# Files the img2img and upscale servers save into ComfyUI/input for each request
+INPUT_FILE_PREFIXES = ("input_", "upscale_input_")
+
+
+def remove_benchmark_files(written_files: List[str], served_before: set, input_before: set,
+                           input_dir: str = COMFY_INPUT_DIR) -> None:
+    """
+    Delete fake outputs, the served_images copies the backend made of them
+    and the request images the backend saved into the ComfyUI input directory
+    """
+    paths = list(written_files)
+    paths += [os.path.join(SERVED_IMAGES_DIR, name) for name in _list_dir(SERVED_IMAGES_DIR) - served_before]
+    paths += [os.path.join(input_dir, name) for name in _list_dir(input_dir) - input_before
+              if name.startswith(INPUT_FILE_PREFIXES)]
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def start_server(script: str, port: int, log_dir: str, timeout: float = 60.0) -> subprocess.Popen:
+    """Start a backend server script and wait until its port answers"""
+    log_file = open(os.path.join(log_dir, f"{os.path.splitext(script)[0]}.log"), "w")
+    process = subprocess.Popen([sys.executable, script], cwd=BACKEND_DIR,
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{script} exited with code {process.returncode}, see {log_file.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"{script} did not start on port {port} within {timeout}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    for child in _process_tree(process.pid)[1:]:
+        try:
+            child.terminate()
+        except Exception:
+            pass
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_scenario(name: str, base_url: str, server_pid: int, num_requests: int,
+                 concurrency: int, warmup: int) -> Dict[str, Any]:
+    """Drive one endpoint and collect latency, throughput and resource usage"""
+    send = SCENARIOS[name]
+    for i in range(warmup):
+        send(base_url, -1 - i)
+
+    def timed(index: int):
+        start = time.perf_counter()
+        try:
+            response = send(base_url, index)
+            ok = response.status_code == 200 and response.json().get("status") == "success"
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    processes = _process_tree(server_pid)
+    cpu_before = _cpu_seconds(processes)
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, range(num_requests)))
+    wall = time.perf_counter() - wall_start
+    cpu_after = _cpu_seconds(processes)
+
+    latencies = [latency * 1000 for latency, ok in results if ok]
+    cpu_seconds = None if cpu_before is None else cpu_after - cpu_before
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "errors": sum(1 for _, ok in results if not ok),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "cpu_seconds": cpu_seconds,
+        "cpu_seconds_per_request": None if cpu_seconds is None else cpu_seconds / num_requests,
+        "rss_mb": _rss_mb(processes),
+    }
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                        threshold: float) -> List[str]:
+    """
+    Compare scenario metrics with a baseline run.
+
+    Returns:
+        List of human-readable regressions larger than threshold (a fraction)
+    """
+    regressions = []
+    for name, metrics in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        for metric in COMPARED_METRICS:
+            new, old = metrics.get(metric), base.get(metric)
+            if new is None or old is None or old == 0:
+                continue
+            change = (new - old) / old
+            print(f"  {name:8} {metric:24} {old:10.2f} -> {new:10.2f} ({change:+.1%})")
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > threshold and abs(new - old) >= NOISE_FLOOR.get(metric, 0.0):
+                regressions.append(f"{name} {metric} regressed by {worse:.1%}")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(f"\n{'scenario':10}{'ok/total':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'req/s':>9}{'cpu s':>9}{'rss MB':>9}")
+    for name, m in results["scenarios"].items():
+        cpu = f"{m['cpu_seconds']:.2f}" if m["cpu_seconds"] is not None else "n/a"
+        rss = f"{m['rss_mb']:.0f}" if m["rss_mb"] is not None else "n/a"
+        print(f"{name:10}{m['requests'] - m['errors']:>5}/{m['requests']:<4}{m['p50_ms']:>10.1f}"
+              f"{m['p95_ms']:>10.1f}{m['p99_ms']:>10.1f}{m['throughput_rps']:>9.2f}{cpu:>9}{rss:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the DreamLayer backend against a fake ComfyUI")
+    parser.add_argument("--scenarios", default="txt2img,img2img,upscale",
+                        help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed requests per scenario")
+    parser.add_argument("--execution-delay", type=float, default=0.5, help="Fake ComfyUI seconds per prompt")
+    parser.add_argument("--step-delay", type=float, default=0.0, help="Fake ComfyUI seconds per sampler step")
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Compare against this results JSON")
+    parser.add_argument("--save-baseline", help="Write results JSON as a new baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed regression vs baseline before exiting non-zero (fraction)")
+    parser.add_argument("--log-dir", default=os.path.join(BACKEND_DIR, "benchmarks", "logs"))
+    parser.add_argument("--keep-outputs", action="store_true",
+                        help="Keep generated images in the output and served_images directories")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    os.makedirs(COMFY_INPUT_DIR, exist_ok=True)
+    output_dir = _backend_output_dir()
+    print(f"Fake ComfyUI writing outputs to {output_dir}")
+    served_before = _list_dir(SERVED_IMAGES_DIR)
+    input_before = _list_dir(COMFY_INPUT_DIR)
+    httpd = start_fake_comfyui(output_dir, execution_delay=args.execution_delay, step_delay=args.step_delay)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "execution_delay": args.execution_delay,
+            "step_delay": args.step_delay,
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            script, port = SERVERS[name]
+            print(f"\nStarting {script} on port {port}...")
+            server = start_server(script, port, args.log_dir)
+            try:
+                print(f"Running {name}: {args.requests} requests at concurrency {args.concurrency}")
+                results["scenarios"][name] = run_scenario(
+                    name, f"http://127.0.0.1:{port}", server.pid,
+                    args.requests, args.concurrency, args.warmup)
+            finally:
+                stop_server(server)
+    finally:
+        httpd.shutdown()
+        httpd.comfy.stop()
+        if not args.keep_outputs:
+            remove_benchmark_files(httpd.comfy.written_files, served_before, input_before)
+
+    print_report(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparison with {args.baseline}:")
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,7 @@ import json
 import subprocess
 from dream_layer_backend_utils.random_prompt_generator import fetch_positive_prompt, fetch_negative_prompt
 from dream_layer_backend_utils.fetch_advanced_models import get_lora_models, get_settings, is_valid_directory, get_upscaler_models, get_controlnet_models
+from dream_layer_backend_utils.retention_manager import create_default_retention_manager
 # Add ComfyUI directory to Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
@@ -92,6 +93,11 @@ if os.environ.get('DREAMLAYER_COMFYUI_CPU_MODE', 'false').lower() == 'true':
     print("Forcing ComfyUI to run in CPU mode as requested.")
     sys.argv.append('--cpu')
 
+# Persist node outputs such as text encodings and VAE encodes across ComfyUI restarts
+disk_cache_dir = os.environ.get('DREAMLAYER_COMFYUI_DISK_CACHE_DIR')
+if disk_cache_dir:
+    sys.argv.extend(['--disk-cache-dir', disk_cache_dir])
+
 # Allow WebSocket connections from frontend
 cors_origin = os.environ.get('COMFYUI_CORS_ORIGIN', 'http://localhost:8080')
 sys.argv.extend(['--enable-cors-header', cors_origin])
@@ -136,6 +142,12 @@ CORS(app, resources={
 
 COMFY_API_URL = "http://127.0.0.1:8188"
 
+# Keeps served_images, DreamLayer's temp inputs and (optionally) outputs under quota
+retention_manager = create_default_retention_manager(
+    served_images_dir=os.path.join(current_dir, 'served_images'),
+    comfy_input_dir=os.path.join(comfyui_dir, 'input'),
+    comfy_output_dir=output_dir)
+
 
 def get_available_models():
     """
@@ -385,6 +397,9 @@ def add_api_key():
         with open(env_path, 'w') as f:
             f.writelines(new_lines)
 
+        from dream_layer_backend_utils import invalidate_api_keys
+        invalidate_api_keys()
+
         return jsonify({"status": "success", "message": f"{alias} updated in .env"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -393,13 +408,16 @@ def add_api_key():
 @app.route('/api/fetch-prompt', methods=['GET'])
 def fetch_prompt():
     """
-    Endpoint to fetch random prompts
+    Endpoint to fetch random prompts, optionally filtered by ?keyword= or ?tag=
     """
 
     prompt_type = request.args.get('type')
+    keyword = request.args.get('keyword')
+    tag = request.args.get('tag')
     print(f"🎯 FETCH PROMPT CALLED - Type: {prompt_type}")
 
-    prompt = fetch_positive_prompt() if prompt_type == 'positive' else fetch_negative_prompt()
+    fetch = fetch_positive_prompt if prompt_type == 'positive' else fetch_negative_prompt
+    prompt = fetch(keyword=keyword, tag=tag)
     return jsonify({"status": "success", "prompt": prompt})
 
 
@@ -591,6 +609,15 @@ def serve_image(filename):
         }), 500
 
 
+@app.route('/api/retention/metrics', methods=['GET'])
+def get_retention_metrics():
+    """Get disk usage and eviction counts for retention-managed directories"""
+    return jsonify({
+        "status": "success",
+        "directories": retention_manager.get_metrics()
+    })
+
+
 @app.route('/api/controlnet/models', methods=['GET'])
 def get_controlnet_models_endpoint():
     """Get available ControlNet models"""
@@ -610,6 +637,7 @@ def get_controlnet_models_endpoint():
 if __name__ == "__main__":
     print("Starting Dream Layer backend services...")
     if start_comfy_server():
+        retention_manager.start()
         start_flask_server()
     else:
         print("Failed to start ComfyUI server. Exiting...")
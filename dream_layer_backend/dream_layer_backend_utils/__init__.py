@@ -1,6 +1,6 @@
 # This file makes the utils directory a Python package 
 
-from .api_key_injector import read_api_keys_from_env, inject_api_keys_into_workflow
+from .api_key_injector import read_api_keys_from_env, inject_api_keys_into_workflow, invalidate_api_keys
 from .fetch_advanced_models import (
     get_controlnet_models,
     get_lora_models,
@@ -12,6 +12,7 @@ from .workflow_execution import interrupt_workflow
 __all__ = [
     'read_api_keys_from_env',
     'inject_api_keys_into_workflow',
+    'invalidate_api_keys',
     'get_controlnet_models',
     'get_lora_models',
     'get_upscaler_models',
@@ -6,8 +6,9 @@ and inject them into ComfyUI workflows for API nodes.
 """
 
 import os
-from dotenv import load_dotenv
-from typing import Dict, Any
+import threading
+from dotenv import dotenv_values
+from typing import Dict, Any, FrozenSet, Optional, Set, Tuple
 
 # Global mapping of node classes to their required API keys
 NODE_TO_API_KEY_MAPPING = {
@@ -56,54 +57,138 @@ ENV_KEY_TO_EXTRA_DATA_MAPPING = {
 }
 
 
+class ApiKeyRegistry:
+    """
+    Caches API keys read from the project's .env file.
+
+    The file is parsed once and re-parsed only when its size or mtime changes,
+    or after invalidate() is called (e.g. by /api/add-api-key). Variables that
+    were already set in the process environment take precedence over .env,
+    matching load_dotenv(override=False); variables that came from .env are
+    updated or removed when the file changes.
+    """
+
+    def __init__(self, dotenv_path: str):
+        self.dotenv_path = dotenv_path
+        self._lock = threading.Lock()
+        self._signature = None
+        self._loaded = False
+        self._dotenv_keys: Set[str] = set()
+        self._api_keys: Dict[str, str] = {}
+
+    def _file_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.dotenv_path)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def invalidate(self) -> None:
+        """Force the next lookup to re-read the .env file"""
+        self._loaded = False
+
+    def get_api_keys(self) -> Dict[str, str]:
+        """Return a copy of the currently known API keys"""
+        signature = self._file_signature()
+        if not self._loaded or signature != self._signature:
+            with self._lock:
+                if not self._loaded or signature != self._signature:
+                    self._reload(signature)
+        return dict(self._api_keys)
+
+    def _reload(self, signature: Optional[Tuple[int, int]]) -> None:
+        values = dotenv_values(self.dotenv_path) if signature is not None else {}
+
+        # Drop variables that were removed from .env since the last load
+        for key in self._dotenv_keys - set(values):
+            os.environ.pop(key, None)
+
+        dotenv_keys = set()
+        for key, value in values.items():
+            if value is None:
+                continue
+            if key in os.environ and key not in self._dotenv_keys:
+                continue
+            os.environ[key] = value
+            dotenv_keys.add(key)
+        self._dotenv_keys = dotenv_keys
+
+        api_keys = {}
+        for env_key in ENV_KEY_TO_EXTRA_DATA_MAPPING.keys():
+            api_key = os.getenv(env_key)
+            if api_key:
+                api_keys[env_key] = api_key
+                # Safely truncate for display without assuming length
+                display_key = api_key[:8] + "..." + \
+                    api_key[-4:] if len(api_key) > 12 else api_key
+                print(f"[DEBUG] Found {env_key}: {display_key}")
+            else:
+                print(f"[DEBUG] No {env_key} found in environment")
+
+        print(f"[DEBUG] Total API keys loaded: {len(api_keys)}")
+        self._api_keys = api_keys
+        self._signature = signature
+        self._loaded = True
+
+
+# The .env file lives in the project's root directory
+_registry = ApiKeyRegistry(os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), '.env'))
+
+
 def read_api_keys_from_env() -> Dict[str, str]:
     """
-    Read all API keys from environment variables.
+    Read all API keys from environment variables and the project's .env file.
+
+    The .env file is only re-parsed when it changes, see ApiKeyRegistry.
 
     Returns:
         Dict containing environment variable names mapped to their values.
         Example: {"BFL_API_KEY": "sk-bfl-...", "OPENAI_API_KEY": "sk-openai-..."}
     """
-    # Get the path to the project's root directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(os.path.dirname(current_dir))
-
-    # Construct the path to the .env file in the root directory
-    dotenv_path = os.path.join(project_root, '.env')
-
-    # Load environment variables from the .env file in the project root
-    load_dotenv(dotenv_path=dotenv_path)
-
-    api_keys = {}
-
-    # Read all API keys defined in the mapping
-    for env_key in ENV_KEY_TO_EXTRA_DATA_MAPPING.keys():
-        api_key = os.getenv(env_key)
-        if api_key:
-            api_keys[env_key] = api_key
-            # Safely truncate for display without assuming length
-            display_key = api_key[:8] + "..." + \
-                api_key[-4:] if len(api_key) > 12 else api_key
-            print(f"[DEBUG] Found {env_key}: {display_key}")
-        else:
-            print(f"[DEBUG] No {env_key} found in environment")
+    return _registry.get_api_keys()
+
 
-    print(f"[DEBUG] Total API keys loaded: {len(api_keys)}")
-    return api_keys
+def invalidate_api_keys() -> None:
+    """Force API keys to be re-read, e.g. after the .env file was written"""
+    _registry.invalidate()
 
 
-def inject_api_keys_into_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
+def get_api_node_classes(workflow: Dict[str, Any]) -> FrozenSet[str]:
+    """
+    Return the API node classes used by a workflow: the keys of
+    NODE_TO_API_KEY_MAPPING and any Stability AI node.
+
+    Workflow templates precompute this once when they are loaded, see
+    workflow_loader.load_workflow_template.
+    """
+    return frozenset(
+        node_data.get('class_type')
+        for node_data in workflow.get('prompt', {}).values()
+        if isinstance(node_data, dict) and _is_api_node(node_data.get('class_type'))
+    )
+
+
+def _is_api_node(class_type: Any) -> bool:
+    return isinstance(class_type, str) and (class_type in NODE_TO_API_KEY_MAPPING or class_type.startswith("Stability"))
+
+
+def inject_api_keys_into_workflow(workflow: Dict[str, Any],
+                                  api_node_classes: Optional[FrozenSet[str]] = None) -> Dict[str, Any]:
     """
     Inject API keys from environment variables into workflow extra_data based on nodes present.
 
     Args:
         workflow: The workflow dictionary to inject keys into
+        api_node_classes: API node classes present in the workflow, if already
+            known (e.g. precomputed for its template). Scanned from the workflow
+            when omitted.
 
     Returns:
         Workflow with appropriate API keys added to extra_data
     """
-    # Read all available API keys from environment
-    all_api_keys = read_api_keys_from_env()
+    if api_node_classes is None:
+        api_node_classes = get_api_node_classes(workflow)
 
     # Create a copy to avoid modifying the original
     workflow_with_keys = workflow.copy()
@@ -115,38 +200,40 @@ def inject_api_keys_into_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
     else:
         print("[DEBUG] Using existing extra_data section")
 
-    # Scan workflow for node types and determine which API keys are needed
+    # Local workflows need no keys, so skip the key lookup entirely
+    if not api_node_classes:
+        print("[DEBUG] No API nodes found in workflow")
+        return workflow_with_keys
+
+    # Read all available API keys from environment
+    all_api_keys = read_api_keys_from_env()
+
+    # Determine which API keys are needed by the API nodes present
     needed_env_keys = set()
-    workflow_prompt = workflow.get('prompt', {})
-
-    print("[DEBUG] Scanning workflow for API nodes...")
-    for node_id, node_data in workflow_prompt.items():
-        if isinstance(node_data, dict):
-            class_type = node_data.get('class_type')
-            if class_type in NODE_TO_API_KEY_MAPPING:
-                required_env_key = NODE_TO_API_KEY_MAPPING[class_type]
-                needed_env_keys.add(required_env_key)
-                print(
-                    f"[DEBUG] Found {class_type} node - needs {required_env_key}")
+    for class_type in api_node_classes:
+        # Stability AI nodes that aren't listed use the Stability key as well
+        required_env_key = NODE_TO_API_KEY_MAPPING.get(class_type, "STABILITY_API_KEY")
+        needed_env_keys.add(required_env_key)
+        print(f"[DEBUG] Found {class_type} node - needs {required_env_key}")
+
     # Decide which key to use for api_key_comfy_org
     api_key_comfy_org = None
     print(f"[DEBUG] needed_env_keys: {needed_env_keys}")
     print(f"[DEBUG] all_api_keys keys: {all_api_keys.keys()}")
-    if needed_env_keys:
-        # If we have multiple keys that map to api_key_comfy_org, choose one
-        # Priority: BFL_API_KEY first, then OPENAI_API_KEY, then IDEOGRAM_API_KEY
-        if "BFL_API_KEY" in needed_env_keys and "BFL_API_KEY" in all_api_keys:
-            api_key_comfy_org = all_api_keys["BFL_API_KEY"]
-            print(f"[DEBUG] Using BFL_API_KEY for api_key_comfy_org")
-        elif "OPENAI_API_KEY" in needed_env_keys and "OPENAI_API_KEY" in all_api_keys:
-            api_key_comfy_org = all_api_keys["OPENAI_API_KEY"]
-            print(f"[DEBUG] Using OPENAI_API_KEY for api_key_comfy_org")
-        elif "IDEOGRAM_API_KEY" in needed_env_keys and "IDEOGRAM_API_KEY" in all_api_keys:
-            api_key_comfy_org = all_api_keys["IDEOGRAM_API_KEY"]
-            print(f"[DEBUG] Using IDEOGRAM_API_KEY for api_key_comfy_org")
-        else:
-            print(
-                f"[DEBUG] No available API keys for needed services: {needed_env_keys}")
+    # If we have multiple keys that map to api_key_comfy_org, choose one
+    # Priority: BFL_API_KEY first, then OPENAI_API_KEY, then IDEOGRAM_API_KEY
+    if "BFL_API_KEY" in needed_env_keys and "BFL_API_KEY" in all_api_keys:
+        api_key_comfy_org = all_api_keys["BFL_API_KEY"]
+        print(f"[DEBUG] Using BFL_API_KEY for api_key_comfy_org")
+    elif "OPENAI_API_KEY" in needed_env_keys and "OPENAI_API_KEY" in all_api_keys:
+        api_key_comfy_org = all_api_keys["OPENAI_API_KEY"]
+        print(f"[DEBUG] Using OPENAI_API_KEY for api_key_comfy_org")
+    elif "IDEOGRAM_API_KEY" in needed_env_keys and "IDEOGRAM_API_KEY" in all_api_keys:
+        api_key_comfy_org = all_api_keys["IDEOGRAM_API_KEY"]
+        print(f"[DEBUG] Using IDEOGRAM_API_KEY for api_key_comfy_org")
+    else:
+        print(
+            f"[DEBUG] No available API keys for needed services: {needed_env_keys}")
 
     # Add the chosen key to extra_data
     if api_key_comfy_org:
@@ -154,24 +241,16 @@ def inject_api_keys_into_workflow(workflow: Dict[str, Any]) -> Dict[str, Any]:
         print(f"[DEBUG] Injected api_key_comfy_org into workflow")
 
     # Special handling for Stability AI nodes - inject stability_api_key directly
-    has_stability_nodes = False
-    for node_id, node_data in workflow.get("prompt", {}).items():
-        class_type = node_data.get("class_type", "")
-        if class_type.startswith("Stability"):
-            has_stability_nodes = True
-            # For Stability nodes, inject the stability API key directly
-            if "STABILITY_API_KEY" in all_api_keys:
-                stability_key = all_api_keys["STABILITY_API_KEY"]
-                if "extra_data" not in workflow_with_keys:
-                    workflow_with_keys["extra_data"] = {}
-                workflow_with_keys["extra_data"]["stability_api_key"] = stability_key
-                print(f"[DEBUG] Injected stability_api_key for {class_type}")
-            else:
-                print(f"[DEBUG] STABILITY_API_KEY not found for {class_type}")
-
-    if not has_stability_nodes:
+    stability_classes = [c for c in api_node_classes if c.startswith("Stability")]
+    if stability_classes:
+        if "STABILITY_API_KEY" in all_api_keys:
+            workflow_with_keys["extra_data"]["stability_api_key"] = all_api_keys["STABILITY_API_KEY"]
+            print(f"[DEBUG] Injected stability_api_key for {', '.join(sorted(stability_classes))}")
+        else:
+            print(f"[DEBUG] STABILITY_API_KEY not found for {', '.join(sorted(stability_classes))}")
+    else:
         print("[DEBUG] No Stability AI nodes found in workflow")
 
-    print(f"[DEBUG] Final extra_data: {workflow_with_keys['extra_data']}")
+    print(f"[DEBUG] Final extra_data keys: {list(workflow_with_keys['extra_data'].keys())}")
 
     return workflow_with_keys
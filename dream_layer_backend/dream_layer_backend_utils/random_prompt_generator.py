@@ -1,63 +1,189 @@
 import random
 import os
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
 from typing import Optional
 
 
-def fetch_positive_prompt() -> Optional[str]:
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'random_prompts')
+
+# Number of keyword/tag match lists kept per corpus
+MAX_CACHED_FILTERS = 64
+
+
+class _Index:
+    """One loaded version of a prompt file"""
+
+    def __init__(self, signature, file, mm, starts, ends, tags):
+        self.signature = signature
+        self.file = file
+        self.mmap = mm
+        self.starts = starts
+        self.ends = ends
+        self.tags = tags
+
+    def line(self, index: int) -> str:
+        return self.mmap[self.starts[index]:self.ends[index]].decode('utf-8', errors='replace')
+
+
+class PromptCorpus:
     """
-    Reads all positive prompts from the file and returns a random one.
-    
-    Returns:
-        str: A random positive prompt, or None if file not found or empty
+    Line-offset index over a prompt file.
+
+    The file is memory-mapped once and an index of where each non-empty line
+    starts and ends is built in a single pass, so sampling is O(1) and never
+    re-reads the file. The same pass builds an index from each tag to the
+    lines that have it. The index is rebuilt when the file's size or mtime
+    changes. Keyword filters are resolved to a list of matching line numbers
+    the first time they are used, without holding the lock, and cached until
+    the next reload.
+
+    Tags are the comma-separated segments of a prompt, e.g. "fantasy art" in
+    "a majestic dragon, highly detailed, fantasy art".
     """
-    try:
-        # Get the directory where this script is located
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(current_dir, 'random_prompts', 'positive_prompts.txt')
-        
-        # Read all prompts from the file
-        with open(file_path, 'r', encoding='utf-8') as file:
-            prompts = [line.strip() for line in file if line.strip()]
-        
-        # Return a random prompt if any exist
-        if prompts:
-            return random.choice(prompts)
-        else:
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._index = None
+        self._filters = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded().starts)
+
+    def _ensure_loaded(self) -> _Index:
+        stat = os.stat(self.file_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        index = self._index
+        if index is not None and index.signature == signature:
+            return index
+        with self._lock:
+            if self._index is None or self._index.signature != signature:
+                # The previous mmap isn't closed, samplers may still be reading it. It's closed once unreferenced.
+                self._index = self._load(signature)
+                self._filters.clear()
+            return self._index
+
+    def _load(self, signature) -> _Index:
+        starts = array('Q')
+        ends = array('Q')
+        tags = {}
+        file = open(self.file_path, 'rb')
+        mm = None
+        if signature[0] > 0:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            offset = 0
+            for line in iter(mm.readline, b''):
+                stripped = line.strip()
+                if stripped:
+                    start = offset + line.index(stripped[:1])
+                    number = len(starts)
+                    starts.append(start)
+                    ends.append(start + len(stripped))
+                    text = stripped.decode('utf-8', errors='replace').lower()
+                    for segment in set(segment.strip() for segment in text.split(',')):
+                        tags.setdefault(segment, array('Q')).append(number)
+                offset += len(line)
+        return _Index(signature, file, mm, starts, ends, tags)
+
+    def _matches(self, index: _Index, keyword: Optional[str], tag: Optional[str]) -> array:
+        if not keyword:
+            return index.tags.get(tag, array('Q'))
+
+        key = (keyword, tag)
+        with self._lock:
+            matches = self._filters.get(key) if self._index is index else None
+            if matches is not None:
+                self._filters.move_to_end(key)
+                return matches
+
+        # Keywords match anywhere in a line, so they need a scan. It runs outside the lock so that sampling
+        # isn't blocked by it.
+        candidates = index.tags.get(tag, array('Q')) if tag else range(len(index.starts))
+        matches = array('Q', (number for number in candidates if keyword in index.line(number).lower()))
+
+        with self._lock:
+            if self._index is index:
+                self._filters[key] = matches
+                if len(self._filters) > MAX_CACHED_FILTERS:
+                    self._filters.popitem(last=False)
+        return matches
+
+    def sample(self, keyword: Optional[str] = None, tag: Optional[str] = None,
+               rng: Optional[random.Random] = None) -> Optional[str]:
+        """
+        Return a random prompt, optionally restricted to prompts containing
+        keyword or having tag as one of their comma-separated segments.
+
+        Returns:
+            str: A random prompt, or None if the corpus has no matching prompt
+        """
+        rng = rng or random
+        keyword = keyword.strip().lower() if keyword else None
+        tag = tag.strip().lower() if tag else None
+
+        index = self._ensure_loaded()
+        if keyword or tag:
+            candidates = self._matches(index, keyword, tag)
+            if not candidates:
+                return None
+            return index.line(candidates[rng.randrange(len(candidates))])
+        if not index.starts:
             return None
-            
+        return index.line(rng.randrange(len(index.starts)))
+
+
+_corpora = {}
+_corpora_lock = threading.Lock()
+
+
+def get_prompt_corpus(name: str) -> PromptCorpus:
+    """Get the shared corpus for random_prompts/<name>_prompts.txt"""
+    with _corpora_lock:
+        corpus = _corpora.get(name)
+        if corpus is None:
+            corpus = PromptCorpus(os.path.join(PROMPTS_DIR, f'{name}_prompts.txt'))
+            _corpora[name] = corpus
+        return corpus
+
+
+def _fetch_prompt(name: str, keyword: Optional[str], tag: Optional[str]) -> Optional[str]:
+    corpus = get_prompt_corpus(name)
+    try:
+        return corpus.sample(keyword=keyword, tag=tag)
     except FileNotFoundError:
-        print(f"Error: positive_prompts.txt not found at {file_path}")
+        print(f"Error: {name}_prompts.txt not found at {corpus.file_path}")
         return None
     except Exception as e:
-        print(f"Error reading positive prompts: {e}")
+        print(f"Error reading {name} prompts: {e}")
         return None
 
 
-def fetch_negative_prompt() -> Optional[str]:
+def fetch_positive_prompt(keyword: Optional[str] = None, tag: Optional[str] = None) -> Optional[str]:
     """
-    Reads all negative prompts from the file and returns a random one.
-    
+    Returns a random positive prompt from the indexed prompt corpus.
+
+    Args:
+        keyword: Only consider prompts containing this text (case-insensitive)
+        tag: Only consider prompts with this comma-separated segment
+
     Returns:
-        str: A random negative prompt, or None if file not found or empty
+        str: A random positive prompt, or None if file not found or nothing matches
     """
-    try:
-        # Get the directory where this script is located
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(current_dir, 'random_prompts', 'negative_prompts.txt')
-        
-        # Read all prompts from the file
-        with open(file_path, 'r', encoding='utf-8') as file:
-            prompts = [line.strip() for line in file if line.strip()]
-        
-        # Return a random prompt if any exist
-        if prompts:
-            return random.choice(prompts)
-        else:
-            return None
-            
-    except FileNotFoundError:
-        print(f"Error: negative_prompts.txt not found at {file_path}")
-        return None
-    except Exception as e:
-        print(f"Error reading negative prompts: {e}")
-        return None
+    return _fetch_prompt('positive', keyword, tag)
+
+
+def fetch_negative_prompt(keyword: Optional[str] = None, tag: Optional[str] = None) -> Optional[str]:
+    """
+    Returns a random negative prompt from the indexed prompt corpus.
+
+    Args:
+        keyword: Only consider prompts containing this text (case-insensitive)
+        tag: Only consider prompts with this comma-separated segment
+
+    Returns:
+        str: A random negative prompt, or None if file not found or nothing matches
+    """
+    return _fetch_prompt('negative', keyword, tag)
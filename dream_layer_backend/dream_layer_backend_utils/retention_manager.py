@@ -0,0 +1,328 @@
+"""
+Retention Manager Utility
+
+This module keeps the directories DreamLayer writes into (served_images, the
+timestamped temp files in ComfyUI/input and optionally ComfyUI's output
+directory) below a byte quota and an age limit.
+
+Eviction is least-recently-served first. Serving an image bumps the file's
+atime explicitly (see record_access), so the ordering is shared between the
+txt2img/img2img/extras processes and survives restarts. Files referenced by a
+queued or running ComfyUI prompt are never deleted, and the manager works one
+directory and a bounded number of files per tick instead of a big sweep.
+"""
+
+import os
+import time
+import fnmatch
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+COMFY_API_URL = "http://127.0.0.1:8188"
+
+# Files younger than this are never evicted. This covers inputs that have been
+# written but not queued yet and outputs of a prompt that is still saving.
+DEFAULT_GRACE_SECONDS = 300
+
+# Upper bound on deletions per tick so one tick never turns into a full sweep
+DEFAULT_BATCH_SIZE = 50
+
+# Seconds between ticks; each tick handles a single directory
+DEFAULT_INTERVAL_SECONDS = 30.0
+
+# Temp files DreamLayer drops into ComfyUI/input
+INPUT_TEMP_PATTERNS = [
+    "controlnet_unit_*",
+    "controlnet_*",
+    "upscale_input_*",
+    "input_*",
+]
+
+MB = 1024 * 1024
+HOUR = 60 * 60
+
+
+def _env_number(name: str, default: float) -> float:
+    """Read a numeric environment variable, falling back to default"""
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid value for {name}: {value}")
+        return default
+
+
+def fetch_queued_file_references(comfy_api_url: str = COMFY_API_URL) -> Set[str]:
+    """
+    Collect the basenames of every string input of queued and running prompts.
+
+    Returns:
+        Set of file basenames that must not be deleted.
+
+    Raises:
+        Exception if the ComfyUI queue cannot be read. Callers must treat this
+        as "everything is referenced" rather than "nothing is referenced".
+    """
+    import requests
+
+    response = requests.get(f"{comfy_api_url}/queue", timeout=5)
+    response.raise_for_status()
+    queue_data = response.json()
+
+    referenced = set()
+    for item in queue_data.get('queue_running', []) + queue_data.get('queue_pending', []):
+        # Queue items are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+        if len(item) < 3 or not isinstance(item[2], dict):
+            continue
+        for node in item[2].values():
+            if not isinstance(node, dict):
+                continue
+            for value in node.get('inputs', {}).values():
+                if isinstance(value, str) and value:
+                    referenced.add(os.path.basename(value))
+    return referenced
+
+
+def record_access(filepath: str) -> None:
+    """
+    Mark a file as just served.
+
+    The access time is set explicitly so that relatime/noatime mounts do not
+    hide reads, while the modification time is left untouched.
+    """
+    try:
+        stat = os.stat(filepath)
+        os.utime(filepath, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError as e:
+        logger.debug(f"Could not record access for {filepath}: {e}")
+
+
+class RetentionManager:
+    """Evicts files from managed directories under per-directory quotas"""
+
+    def __init__(self,
+                 referenced_files_provider: Optional[Callable[[], Iterable[str]]] = None,
+                 interval: float = DEFAULT_INTERVAL_SECONDS,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 grace_seconds: float = DEFAULT_GRACE_SECONDS):
+        self.referenced_files_provider = referenced_files_provider or fetch_queued_file_references
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self.directories: Dict[str, Dict[str, Any]] = {}
+        self._order: List[str] = []
+        self._next_index = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_directory(self, name: str, path: str, max_bytes: int = 0,
+                      max_age_seconds: float = 0, patterns: Optional[List[str]] = None) -> None:
+        """
+        Register a directory to manage.
+
+        Args:
+            name: Short name used in metrics
+            path: Directory to manage (not recursed into)
+            max_bytes: Byte quota, 0 disables the quota
+            max_age_seconds: Maximum file age, 0 disables the age limit
+            patterns: Optional filename globs; only matching files are managed
+        """
+        with self._lock:
+            if name not in self.directories:
+                self._order.append(name)
+            self.directories[name] = {
+                "path": os.path.abspath(path),
+                "max_bytes": int(max_bytes),
+                "max_age_seconds": float(max_age_seconds),
+                "patterns": patterns,
+                "metrics": {
+                    "bytes": 0,
+                    "files": 0,
+                    "evicted_files": 0,
+                    "evicted_bytes": 0,
+                    "evicted_for_age": 0,
+                    "evicted_for_quota": 0,
+                    "skipped_referenced": 0,
+                    "errors": 0,
+                    "last_run": None,
+                },
+            }
+
+    def _scan(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        entries = []
+        patterns = config["patterns"]
+        try:
+            with os.scandir(config["path"]) as it:
+                for entry in it:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    if patterns and not any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    entries.append({
+                        "name": entry.name,
+                        "path": entry.path,
+                        "size": stat.st_size,
+                        "mtime": stat.st_mtime,
+                        # A file that was never served ranks by when it was written
+                        "last_used": max(stat.st_atime, stat.st_mtime),
+                    })
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _select_evictions(self, config: Dict[str, Any], entries: List[Dict[str, Any]],
+                          referenced: Set[str], now: float) -> List[Dict[str, Any]]:
+        max_bytes = config["max_bytes"]
+        max_age = config["max_age_seconds"]
+        metrics = config["metrics"]
+
+        total_bytes = sum(e["size"] for e in entries)
+        selected = []
+        for entry in sorted(entries, key=lambda e: e["last_used"]):
+            if len(selected) >= self.batch_size:
+                break
+            expired = max_age > 0 and now - entry["last_used"] > max_age
+            over_quota = max_bytes > 0 and total_bytes > max_bytes
+            if not expired and not over_quota:
+                # Sorted by last use, so nothing later can have expired either
+                break
+            if now - entry["mtime"] < self.grace_seconds:
+                continue
+            if entry["name"] in referenced:
+                metrics["skipped_referenced"] += 1
+                continue
+            entry["reason"] = "age" if expired else "quota"
+            selected.append(entry)
+            total_bytes -= entry["size"]
+        return selected
+
+    def run_once(self, name: Optional[str] = None) -> int:
+        """
+        Process one directory: the named one, or the next in round-robin order.
+
+        Returns:
+            Number of files evicted
+        """
+        with self._lock:
+            if not self._order:
+                return 0
+            if name is None:
+                name = self._order[self._next_index % len(self._order)]
+                self._next_index += 1
+            config = self.directories[name]
+
+        metrics = config["metrics"]
+        now = time.time()
+        entries = self._scan(config)
+        metrics["bytes"] = sum(e["size"] for e in entries)
+        metrics["files"] = len(entries)
+        metrics["last_run"] = now
+
+        candidates = self._select_evictions(config, entries, set(), now)
+        if not candidates:
+            return 0
+
+        try:
+            referenced = set(self.referenced_files_provider())
+        except Exception as e:
+            # Without the queue we cannot prove a file is unused, so keep everything
+            logger.warning(f"Skipping eviction in {name}, could not read ComfyUI queue: {e}")
+            metrics["errors"] += 1
+            return 0
+
+        evicted = 0
+        for entry in self._select_evictions(config, entries, referenced, now):
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Failed to evict {entry['path']}: {e}")
+                metrics["errors"] += 1
+                continue
+            evicted += 1
+            metrics["evicted_files"] += 1
+            metrics["evicted_bytes"] += entry["size"]
+            metrics["evicted_for_" + entry["reason"]] += 1
+            metrics["bytes"] -= entry["size"]
+            metrics["files"] -= 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} files from {name} ({config['path']})")
+        return evicted
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Return disk usage and eviction counters for every managed directory"""
+        with self._lock:
+            return {
+                name: {
+                    "path": config["path"],
+                    "max_bytes": config["max_bytes"],
+                    "max_age_seconds": config["max_age_seconds"],
+                    **config["metrics"],
+                }
+                for name, config in self.directories.items()
+            }
+
+    def _loop(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Retention tick failed: {e}")
+
+    def start(self) -> None:
+        """Start the background eviction thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background eviction thread"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+
+def create_default_retention_manager(served_images_dir: str, comfy_input_dir: str,
+                                     comfy_output_dir: str) -> RetentionManager:
+    """
+    Build a RetentionManager for DreamLayer's directories.
+
+    Limits come from environment variables (0 disables a limit):
+        DREAMLAYER_RETENTION_SERVED_MAX_MB / _SERVED_MAX_AGE_HOURS  (2048 MB / 168 h)
+        DREAMLAYER_RETENTION_INPUT_MAX_MB / _INPUT_MAX_AGE_HOURS    (1024 MB / 24 h)
+        DREAMLAYER_RETENTION_OUTPUT_MAX_MB / _OUTPUT_MAX_AGE_HOURS  (disabled)
+        DREAMLAYER_RETENTION_INTERVAL_SECONDS                       (30 s)
+    """
+    manager = RetentionManager(
+        interval=_env_number("DREAMLAYER_RETENTION_INTERVAL_SECONDS", DEFAULT_INTERVAL_SECONDS))
+
+    manager.add_directory(
+        "served_images", served_images_dir,
+        max_bytes=_env_number("DREAMLAYER_RETENTION_SERVED_MAX_MB", 2048) * MB,
+        max_age_seconds=_env_number("DREAMLAYER_RETENTION_SERVED_MAX_AGE_HOURS", 168) * HOUR)
+    manager.add_directory(
+        "comfy_input", comfy_input_dir,
+        max_bytes=_env_number("DREAMLAYER_RETENTION_INPUT_MAX_MB", 1024) * MB,
+        max_age_seconds=_env_number("DREAMLAYER_RETENTION_INPUT_MAX_AGE_HOURS", 24) * HOUR,
+        patterns=INPUT_TEMP_PATTERNS)
+    # Outputs are the user's images, so they are only evicted when configured
+    manager.add_directory(
+        "comfy_output", comfy_output_dir,
+        max_bytes=_env_number("DREAMLAYER_RETENTION_OUTPUT_MAX_MB", 0) * MB,
+        max_age_seconds=_env_number("DREAMLAYER_RETENTION_OUTPUT_MAX_AGE_HOURS", 0) * HOUR)
+    return manager
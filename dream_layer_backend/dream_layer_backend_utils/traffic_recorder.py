@@ -0,0 +1,275 @@
+"""
+Traffic Recorder Utility
+
+Opt-in capture of generation requests for replay (see
+benchmarks/replay_traffic.py). Set DREAMLAYER_RECORD_TRAFFIC to an archive
+directory to enable it. Each request to /api/txt2img, /api/img2img or
+/api/extras/upscale is appended as one JSON line to <archive>/traffic.jsonl
+together with the ComfyUI prompts it generated and their timings.
+
+Payloads are sanitized before they are written:
+    - base64 images and uploaded files are stored once under <archive>/blobs/
+      by SHA-256 and replaced with {"$blob": "<sha256>"}
+    - API keys, tokens and ComfyUI extra_data are stripped
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import threading
+from functools import wraps
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RECORD_TRAFFIC_ENV = "DREAMLAYER_RECORD_TRAFFIC"
+ARCHIVE_FILENAME = "traffic.jsonl"
+RECORD_VERSION = 1
+
+# Keys whose values are secrets and must never reach the archive
+_SECRET_KEY_PATTERN = re.compile(r"(api[_-]?key|auth[_-]?token|access[_-]?token|secret|password|authorization)", re.IGNORECASE)
+
+# Strings at least this long that decode as base64 are treated as image data
+_MIN_BLOB_LENGTH = 256
+_DATA_URL_PATTERN = re.compile(r"^data:([\w/+.-]+);base64,(.*)$", re.DOTALL)
+
+_SEED_INPUTS = ("seed", "noise_seed")
+
+COMFY_INPUT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ComfyUI", "input")
+
+# Inputs of ComfyUI loader nodes that pick a file from the input directory
+_INPUT_FILE_INPUTS = {
+    "LoadImage": ("image",),
+    "LoadImageMask": ("image",),
+    "LoadLatent": ("latent",),
+    "LoadAudio": ("audio",),
+    "LoadVideo": ("file",),
+    "Load3D": ("model_file",),
+}
+
+
+def _find_seed(prompt: Dict[str, Any]) -> Optional[int]:
+    for node in prompt.values():
+        if not isinstance(node, dict):
+            continue
+        for key in _SEED_INPUTS:
+            value = node.get("inputs", {}).get(key)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+class TrafficRecorder:
+    """Appends sanitized request records to a JSONL archive"""
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.blob_dir = os.path.join(self.archive_dir, "blobs")
+        self.archive_path = os.path.join(self.archive_dir, ARCHIVE_FILENAME)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._local = threading.local()
+
+    def store_blob(self, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """Store data by content hash and return the reference that replaces it"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.blob_dir, digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        ref = {"$blob": digest, "size": len(data)}
+        if content_type:
+            ref["content_type"] = content_type
+        return ref
+
+    def load_blob(self, ref: Dict[str, Any]) -> bytes:
+        with open(os.path.join(self.blob_dir, ref["$blob"]), "rb") as f:
+            return f.read()
+
+    def _sanitize_string(self, value: str) -> Any:
+        match = _DATA_URL_PATTERN.match(value)
+        if match:
+            try:
+                ref = self.store_blob(base64.b64decode(match.group(2)), match.group(1))
+                ref["data_url"] = True
+                return ref
+            except (ValueError, TypeError):
+                return value
+        if len(value) >= _MIN_BLOB_LENGTH and " " not in value:
+            try:
+                return self.store_blob(base64.b64decode(value, validate=True))
+            except (ValueError, TypeError):
+                return value
+        return value
+
+    def sanitize(self, value: Any) -> Any:
+        """Return a copy of value with secrets removed and images moved to blobs"""
+        if isinstance(value, dict):
+            return {
+                key: self.sanitize(item)
+                for key, item in value.items()
+                if key != "extra_data" and not _SECRET_KEY_PATTERN.search(str(key))
+            }
+        if isinstance(value, list):
+            return [self.sanitize(item) for item in value]
+        if isinstance(value, str):
+            return self._sanitize_string(value)
+        return value
+
+    def start_request(self, endpoint: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Begin a record for the current thread's request"""
+        record = {
+            "version": RECORD_VERSION,
+            "id": uuid.uuid4().hex,
+            "endpoint": endpoint,
+            "started_at": time.time(),
+            "request": self.sanitize(payload),
+            "prompts": [],
+        }
+        self._local.record = record
+        return record
+
+    def add_prompt(self, prompt: Dict[str, Any], prompt_id: Optional[str],
+                   submitted_at: float, completed_at: Optional[float]) -> None:
+        """Attach a ComfyUI prompt generated while handling the current request"""
+        record = getattr(self._local, "record", None)
+        if record is None:
+            return
+        prompt = prompt.get("prompt", prompt)
+        record["prompts"].append({
+            "prompt_id": prompt_id,
+            "prompt": self.sanitize(prompt),
+            "input_files": self._capture_input_files(prompt),
+            "submitted_at": submitted_at,
+            "completed_at": completed_at,
+            "duration": None if completed_at is None else completed_at - submitted_at,
+        })
+        # Pin random seeds so that replaying through the backend is deterministic
+        request = record["request"]
+        if len(record["prompts"]) == 1 and isinstance(request, dict) and "seed" in request:
+            seed = _find_seed(prompt)
+            if seed is not None:
+                request["seed"] = seed
+
+    def _capture_input_files(self, prompt: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Store the files the prompt's loader nodes pick from the ComfyUI input
+        directory (e.g. LoadImage inputs written by the backend) so the prompt
+        can be replayed after they are cleaned up.
+
+        Returns:
+            Mapping of "<node_id>.<input>" to the original value plus blob reference
+        """
+        files = {}
+        input_dir = os.path.realpath(COMFY_INPUT_DIR)
+        for node_id, node in prompt.items():
+            if not isinstance(node, dict):
+                continue
+            inputs = node.get("inputs", {})
+            for key in _INPUT_FILE_INPUTS.get(node.get("class_type"), ()):
+                value = inputs.get(key)
+                if not isinstance(value, str) or not value:
+                    continue
+                # Only files inside the input directory, whatever else a string input names
+                path = os.path.realpath(os.path.join(input_dir, value))
+                if os.path.commonpath((input_dir, path)) != input_dir or not os.path.isfile(path):
+                    continue
+                with open(path, "rb") as f:
+                    files[f"{node_id}.{key}"] = {"path": value, **self.store_blob(f.read())}
+        return files
+
+    def finish_request(self, status_code: int) -> None:
+        """Complete the current thread's record and append it to the archive"""
+        record = getattr(self._local, "record", None)
+        self._local.record = None
+        if record is None:
+            return
+        record["status"] = status_code
+        record["duration"] = time.time() - record["started_at"]
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        # A single O_APPEND write keeps lines from different servers intact
+        fd = os.open(self.archive_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_traffic_recorder() -> Optional[TrafficRecorder]:
+    """Return the process-wide recorder, or None when recording is disabled"""
+    global _recorder
+    archive_dir = os.environ.get(RECORD_TRAFFIC_ENV)
+    if not archive_dir:
+        return None
+    with _recorder_lock:
+        if _recorder is None or _recorder.archive_dir != os.path.abspath(archive_dir):
+            _recorder = TrafficRecorder(archive_dir)
+            logger.info(f"Recording generation traffic to {_recorder.archive_path}")
+        return _recorder
+
+
+def record_comfy_prompt(prompt: Dict[str, Any], prompt_id: Optional[str],
+                        submitted_at: float, completed_at: Optional[float] = None) -> None:
+    """Attach a submitted ComfyUI prompt to the request being recorded, if any"""
+    recorder = get_traffic_recorder()
+    if recorder is None:
+        return
+    try:
+        recorder.add_prompt(prompt, prompt_id, submitted_at, completed_at)
+    except Exception as e:
+        logger.warning(f"Failed to record ComfyUI prompt: {e}")
+
+
+def record_traffic(view):
+    """
+    Flask view decorator that records the request when recording is enabled.
+
+    JSON bodies are recorded as-is; multipart requests are recorded as
+    {"form": {...}, "files": {...}} with file contents stored as blobs.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import request, make_response
+
+        recorder = get_traffic_recorder()
+        if recorder is None or request.method != "POST":
+            return view(*args, **kwargs)
+
+        try:
+            if request.is_json:
+                payload = request.get_json(silent=True) or {}
+            else:
+                files = {}
+                for name, storage in request.files.items():
+                    data = storage.stream.read()
+                    storage.stream.seek(0)
+                    files[name] = {"filename": storage.filename,
+                                   **recorder.store_blob(data, storage.content_type)}
+                payload = {"form": request.form.to_dict(), "files": files}
+            recorder.start_request(request.path, payload)
+        except Exception as e:
+            logger.warning(f"Failed to start traffic record: {e}")
+            return view(*args, **kwargs)
+
+        status_code = 500
+        try:
+            response = make_response(view(*args, **kwargs))
+            status_code = response.status_code
+            return response
+        finally:
+            try:
+                recorder.finish_request(status_code)
+            except Exception as e:
+                logger.warning(f"Failed to write traffic record: {e}")
+    return wrapper
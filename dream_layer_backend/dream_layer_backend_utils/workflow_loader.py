@@ -6,12 +6,20 @@ and inject user parameters into them.
 """
 
 import os
+import copy
 import json
 import logging
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, FrozenSet, Optional, Tuple
+
+from .api_key_injector import get_api_node_classes
 
 logger = logging.getLogger(__name__)
 
+# Parsed templates keyed by path: (mtime_ns, workflow, api_node_classes)
+_template_cache: Dict[str, Tuple[int, Dict[str, Any], FrozenSet[str]]] = {}
+_template_cache_lock = threading.Lock()
+
 
 def _determine_workflow_path(workflow_request: Dict[str, Any]) -> str:
     """Determine the workflow file path based on request parameters."""
@@ -56,6 +64,24 @@ def _load_workflow_json(workflow_path: str) -> Dict[str, Any]:
         return json.load(file)
 
 
+def load_workflow_template(workflow_path: str) -> Tuple[Dict[str, Any], FrozenSet[str]]:
+    """
+    Load a workflow template, parsing it only when the file changes.
+
+    Returns:
+        Tuple of a private copy of the workflow (safe to modify) and the API
+        node classes present in the template, for inject_api_keys_into_workflow.
+    """
+    mtime_ns = os.stat(workflow_path).st_mtime_ns
+    with _template_cache_lock:
+        cached = _template_cache.get(workflow_path)
+        if cached is None or cached[0] != mtime_ns:
+            workflow = _load_workflow_json(workflow_path)
+            cached = (mtime_ns, workflow, get_api_node_classes(workflow))
+            _template_cache[workflow_path] = cached
+    return copy.deepcopy(cached[1]), cached[2]
+
+
 def load_workflow(workflow_request: Dict[str, Any]) -> Dict[str, Any]:
     """
     Load and configure a workflow based on the request parameters.
@@ -70,11 +96,19 @@ def load_workflow(workflow_request: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dict: Loaded workflow configuration
     """
+    return load_workflow_with_api_nodes(workflow_request)[0]
+
+
+def load_workflow_with_api_nodes(workflow_request: Dict[str, Any]) -> Tuple[Dict[str, Any], FrozenSet[str]]:
+    """
+    Like load_workflow, but also returns the API node classes precomputed for
+    the template so inject_api_keys_into_workflow does not have to scan it.
+    """
     try:
         workflow_path = _determine_workflow_path(workflow_request)
-        workflow = _load_workflow_json(workflow_path)
+        workflow, api_node_classes = load_workflow_template(workflow_path)
         logger.info(f"Successfully loaded workflow: {workflow_path}")
-        return workflow
+        return workflow, api_node_classes
     except Exception as e:
         logger.error(f"Error loading workflow: {str(e)}")
         raise
@@ -8,6 +8,7 @@ from flask_cors import CORS
 import tempfile
 import shutil
 from dream_layer import get_directories
+from dream_layer_backend_utils.traffic_recorder import record_comfy_prompt, record_traffic
 
 # Create Flask app
 app = Flask(__name__)
@@ -87,6 +88,7 @@ def wait_for_upscaled_image(image_file, params: dict) -> dict:
         workflow = construct_upscale_workflow(input_path, params)
         
         # Send the workflow to ComfyUI
+        submitted_at = time.time()
         response = requests.post(
             f"{COMFY_API_URL}/prompt",
             json={"prompt": workflow}
@@ -137,6 +139,7 @@ def wait_for_upscaled_image(image_file, params: dict) -> dict:
                             
                             shutil.copy2(absolute_image_path, output_path)
                             print(f"Copy complete. Output exists: {os.path.exists(output_path)}")
+                            record_comfy_prompt(workflow, prompt_id, submitted_at, time.time())
                             
                             # Clean up the temporary input image
                             if input_path and os.path.exists(input_path):
@@ -264,6 +267,7 @@ def construct_upscale_workflow(image_path: str, params: dict) -> dict:
     return workflow
 
 @app.route('/api/extras/upscale', methods=['POST'])
+@record_traffic
 def upscale_image():
     """Handle image upscaling request"""
     try:
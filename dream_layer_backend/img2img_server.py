@@ -11,6 +11,7 @@ from shared_utils import send_to_comfyui
 from img2img_workflow import transform_to_img2img_workflow
 from shared_utils import COMFY_API_URL
 from dream_layer_backend_utils.fetch_advanced_models import get_controlnet_models
+from dream_layer_backend_utils.traffic_recorder import record_traffic
 
 # Configure logging
 logging.basicConfig(
@@ -62,6 +63,7 @@ verify_input_directory()
 # Using shared functions from shared_utils.py
 
 @app.route('/api/img2img', methods=['POST', 'OPTIONS'])
+@record_traffic
 def handle_img2img():
     if request.method == 'OPTIONS':
         # Handle preflight request
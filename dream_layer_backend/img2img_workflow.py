@@ -4,7 +4,7 @@ from dream_layer_backend_utils.update_custom_workflow import update_image_paths_
 from dream_layer_backend_utils.update_custom_workflow import validate_custom_workflow
 from dream_layer_backend_utils.img2img_controlnet_processor import process_controlnet_images, inject_controlnet_into_workflow, validate_controlnet_config
 from dream_layer_backend_utils.api_key_injector import inject_api_keys_into_workflow
-from dream_layer_backend_utils.workflow_loader import load_workflow
+from dream_layer_backend_utils.workflow_loader import load_workflow_template
 from dream_layer_backend_utils.shared_workflow_parameters import (
     inject_face_restoration_parameters,
     inject_tiling_parameters,
@@ -37,9 +37,8 @@ def transform_to_img2img_workflow(data):
     workflow_template_path = get_img2img_workflow_template(
         model_name, use_controlnet, use_lora)
 
-    # Load the workflow from the template file
-    with open(workflow_template_path, 'r') as f:
-        workflow = json.load(f)
+    # Load the workflow from the template file (parsed once, copied per request)
+    workflow, api_node_classes = load_workflow_template(workflow_template_path)
 
     # Log the raw incoming data
     logger.info("Raw data received in transform_to_img2img_workflow:")
@@ -151,6 +150,8 @@ def transform_to_img2img_workflow(data):
         try:
             # Update the custom workflow with the current parameters
             workflow = update_custom_workflow(workflow, custom_workflow)
+            # The custom workflow may use different nodes than the template
+            api_node_classes = None
             logger.info(
                 "Successfully updated custom workflow with current parameters")
         except Exception as e:
@@ -183,7 +184,7 @@ def transform_to_img2img_workflow(data):
             "No ControlNet data provided - skipping ControlNet injection")
 
     # Inject API keys from environment variables into the workflow
-    workflow = inject_api_keys_into_workflow(workflow)
+    workflow = inject_api_keys_into_workflow(workflow, api_node_classes)
 
     # Extract advanced option data (mirroring txt2img)
     face_restoration_data = {
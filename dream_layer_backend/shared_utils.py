@@ -9,6 +9,8 @@ from pathlib import Path
 from dream_layer import get_directories
 from dream_layer_backend_utils.update_custom_workflow import find_save_node
 from dream_layer_backend_utils.shared_workflow_parameters import increment_seed_in_workflow
+from dream_layer_backend_utils.retention_manager import record_access
+from dream_layer_backend_utils.traffic_recorder import record_comfy_prompt
 
 # Global constants
 COMFY_API_URL = "http://127.0.0.1:8188"
@@ -187,6 +189,7 @@ def send_to_comfyui(workflow: Dict[str, Any]) -> Dict[str, Any]:
             current_workflow = increment_seed_in_workflow(copy.deepcopy(workflow), i) if i > 0 else workflow
             
             # Send to ComfyUI
+            submitted_at = time.time()
             response = requests.post(f"{COMFY_API_URL}/prompt", json=current_workflow)
             
             if response.status_code == 200:
@@ -196,6 +199,7 @@ def send_to_comfyui(workflow: Dict[str, Any]) -> Dict[str, Any]:
                     save_node_id = find_save_node(current_workflow) or "9"
                     print(f"🔍 Found save node ID: {save_node_id}")
                     images = wait_for_image(response_data["prompt_id"], save_node_id)
+                    record_comfy_prompt(current_workflow, response_data["prompt_id"], submitted_at, time.time())
                     if images:
                         all_images.extend(images)
                     print(f"Iteration {i+1}/{iterations} completed")
@@ -233,6 +237,7 @@ def serve_image(filename: str) -> Any:
         served_filepath = os.path.join(SERVED_IMAGES_DIR, filename)
         
         if os.path.exists(served_filepath):
+            record_access(served_filepath)
             return send_file(served_filepath, mimetype='image/png')
         
         # If not found in served_images, check in ComfyUI input directory (for ControlNet images)
@@ -242,6 +247,7 @@ def serve_image(filename: str) -> Any:
         input_filepath = os.path.join(input_dir, filename)
         
         if os.path.exists(input_filepath):
+            record_access(input_filepath)
             return send_file(input_filepath, mimetype='image/png')
         
         # If not found in either location, check ComfyUI output directory
@@ -249,6 +255,7 @@ def serve_image(filename: str) -> Any:
         output_filepath = os.path.join(output_dir, filename)
         
         if os.path.exists(output_filepath):
+            record_access(output_filepath)
             return send_file(output_filepath, mimetype='image/png')
         
         # If still not found, return 404
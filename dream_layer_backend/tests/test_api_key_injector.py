@@ -0,0 +1,119 @@
+"""
+Test cached API key resolution in api_key_injector.py
+"""
+
+import os
+import pytest
+
+from dream_layer_backend_utils import api_key_injector
+from dream_layer_backend_utils.api_key_injector import (
+    ApiKeyRegistry,
+    get_api_node_classes,
+    inject_api_keys_into_workflow,
+)
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    """Remove any real API keys from the environment for the test"""
+    for env_key in api_key_injector.ENV_KEY_TO_EXTRA_DATA_MAPPING:
+        monkeypatch.delenv(env_key, raising=False)
+    yield
+    for env_key in api_key_injector.ENV_KEY_TO_EXTRA_DATA_MAPPING:
+        os.environ.pop(env_key, None)
+
+
+def _write_env(path, content, mtime_offset_ns=0):
+    path.write_text(content)
+    if mtime_offset_ns:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset_ns))
+
+
+class TestApiKeyRegistry:
+    """Test ApiKeyRegistry caching and change detection"""
+
+    def test_parses_env_file_once(self, tmp_path, clean_env, mocker):
+        """Test that an unchanged .env file is not re-parsed"""
+        env_file = tmp_path / ".env"
+        _write_env(env_file, "OPENAI_API_KEY=sk-openai-123456789\n")
+        parse = mocker.spy(api_key_injector, "dotenv_values")
+
+        registry = ApiKeyRegistry(str(env_file))
+        assert registry.get_api_keys() == {"OPENAI_API_KEY": "sk-openai-123456789"}
+        assert registry.get_api_keys() == {"OPENAI_API_KEY": "sk-openai-123456789"}
+        assert parse.call_count == 1
+
+    def test_reloads_when_file_changes(self, tmp_path, clean_env):
+        """Test that edited and removed keys are picked up"""
+        env_file = tmp_path / ".env"
+        _write_env(env_file, "OPENAI_API_KEY=old-key\nBFL_API_KEY=bfl-key\n")
+        registry = ApiKeyRegistry(str(env_file))
+        assert registry.get_api_keys() == {"OPENAI_API_KEY": "old-key", "BFL_API_KEY": "bfl-key"}
+
+        _write_env(env_file, "OPENAI_API_KEY=new-key\n", mtime_offset_ns=1_000_000_000)
+        assert registry.get_api_keys() == {"OPENAI_API_KEY": "new-key"}
+        assert "BFL_API_KEY" not in os.environ
+
+    def test_invalidate_forces_reload(self, tmp_path, clean_env, mocker):
+        """Test that invalidate() re-reads an otherwise unchanged file"""
+        env_file = tmp_path / ".env"
+        _write_env(env_file, "IDEOGRAM_API_KEY=ideogram-key\n")
+        parse = mocker.spy(api_key_injector, "dotenv_values")
+
+        registry = ApiKeyRegistry(str(env_file))
+        registry.get_api_keys()
+        registry.invalidate()
+        registry.get_api_keys()
+        assert parse.call_count == 2
+
+    def test_process_environment_takes_precedence(self, tmp_path, clean_env, monkeypatch):
+        """Test that variables set outside .env are not overridden"""
+        monkeypatch.setenv("STABILITY_API_KEY", "from-shell")
+        env_file = tmp_path / ".env"
+        _write_env(env_file, "STABILITY_API_KEY=from-dotenv\n")
+
+        registry = ApiKeyRegistry(str(env_file))
+        assert registry.get_api_keys() == {"STABILITY_API_KEY": "from-shell"}
+
+
+class TestInjectApiKeys:
+    """Test inject_api_keys_into_workflow with precomputed node classes"""
+
+    def test_detects_api_node_classes(self):
+        """Test that only mapped API node classes are reported"""
+        workflow = {"prompt": {
+            "1": {"class_type": "OpenAIDalle3", "inputs": {}},
+            "2": {"class_type": "SaveImage", "inputs": {}},
+        }}
+        assert get_api_node_classes(workflow) == frozenset({"OpenAIDalle3"})
+
+    def test_local_workflow_skips_key_lookup(self, mocker):
+        """Test that workflows without API nodes never read keys"""
+        read_keys = mocker.patch.object(api_key_injector, "read_api_keys_from_env")
+        result = inject_api_keys_into_workflow({"prompt": {}}, frozenset())
+        assert result["extra_data"] == {}
+        read_keys.assert_not_called()
+
+    def test_injects_keys_for_precomputed_classes(self, mocker):
+        """Test that keys are injected for the given API node classes"""
+        mocker.patch.object(api_key_injector, "read_api_keys_from_env", return_value={
+            "BFL_API_KEY": "bfl-key",
+            "STABILITY_API_KEY": "stability-key",
+        })
+        result = inject_api_keys_into_workflow(
+            {"prompt": {}}, frozenset({"FluxProUltraImageNode", "StabilityUpscaleFastNode"}))
+        assert result["extra_data"] == {
+            "api_key_comfy_org": "bfl-key",
+            "stability_api_key": "stability-key",
+        }
+
+    def test_injects_stability_key_for_unlisted_stability_nodes(self, mocker):
+        """Test that any Stability AI node gets the Stability key, not just the mapped ones"""
+        mocker.patch.object(api_key_injector, "read_api_keys_from_env", return_value={
+            "STABILITY_API_KEY": "stability-key",
+        })
+        workflow = {"prompt": {"1": {"class_type": "StabilityTextToAudio", "inputs": {}}}}
+        assert get_api_node_classes(workflow) == frozenset({"StabilityTextToAudio"})
+        result = inject_api_keys_into_workflow(workflow)
+        assert result["extra_data"] == {"stability_api_key": "stability-key"}
@@ -0,0 +1,99 @@
+"""
+Test the fake ComfyUI server and result helpers used by the benchmark harness
+"""
+
+import time
+import pytest
+import requests
+
+from benchmarks.fake_comfyui import start_fake_comfyui
+from benchmarks import run_benchmark
+from benchmarks.run_benchmark import compare_to_baseline, percentile, remove_benchmark_files
+
+
+@pytest.fixture
+def fake_comfyui(tmp_path):
+    httpd = start_fake_comfyui(str(tmp_path), port=0, execution_delay=0.05)
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", httpd
+    httpd.shutdown()
+    httpd.comfy.stop()
+
+
+class TestFakeComfyUI:
+    """Test the ComfyUI endpoints the backend relies on"""
+
+    def test_prompt_runs_and_lands_in_history(self, fake_comfyui, tmp_path):
+        """Test that a queued prompt produces SaveImage outputs on disk"""
+        base_url, _ = fake_comfyui
+        prompt = {
+            "3": {"class_type": "KSampler", "inputs": {"steps": 20}},
+            "9": {"class_type": "SaveImage", "inputs": {"filename_prefix": "DreamLayer"}},
+        }
+        prompt_id = requests.post(f"{base_url}/prompt", json={"prompt": prompt}).json()["prompt_id"]
+
+        deadline = time.time() + 5
+        history = {}
+        while time.time() < deadline and prompt_id not in history:
+            time.sleep(0.02)
+            history = requests.get(f"{base_url}/history/{prompt_id}").json()
+
+        images = history[prompt_id]["outputs"]["9"]["images"]
+        assert (tmp_path / images[0]["filename"]).exists()
+        queue = requests.get(f"{base_url}/queue").json()
+        assert queue == {"queue_running": [], "queue_pending": []}
+
+    def test_rejects_empty_prompt(self, fake_comfyui):
+        """Test that an empty prompt is rejected like ComfyUI does"""
+        base_url, _ = fake_comfyui
+        assert requests.post(f"{base_url}/prompt", json={"prompt": {}}).status_code == 400
+
+    def test_lists_models(self, fake_comfyui):
+        """Test the /models endpoints"""
+        base_url, _ = fake_comfyui
+        assert "checkpoints" in requests.get(f"{base_url}/models").json()
+        assert requests.get(f"{base_url}/models/checkpoints").json()
+        assert requests.get(f"{base_url}/models/unknown").status_code == 404
+
+
+class TestResultHelpers:
+    """Test percentile and baseline comparison"""
+
+    @pytest.mark.parametrize("pct,expected", [(50, 5), (95, 10), (99, 10), (10, 1)])
+    def test_percentile_nearest_rank(self, pct, expected):
+        assert percentile(list(range(10, 0, -1)), pct) == expected
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        baseline = {"scenarios": {"txt2img": {"p95_ms": 1000.0, "throughput_rps": 2.0}}}
+        results = {"scenarios": {"txt2img": {"p95_ms": 1200.0, "throughput_rps": 1.9}}}
+        regressions = compare_to_baseline(results, baseline, threshold=0.10)
+        assert len(regressions) == 1
+        assert "p95_ms" in regressions[0]
+
+    def test_compare_ignores_noise(self):
+        baseline = {"scenarios": {"upscale": {"cpu_seconds_per_request": 0.010}}}
+        results = {"scenarios": {"upscale": {"cpu_seconds_per_request": 0.012}}}
+        assert compare_to_baseline(results, baseline, threshold=0.10) == []
+
+
+def test_remove_benchmark_files(tmp_path, monkeypatch):
+    """Test that outputs, served copies and request images from the run are deleted"""
+    served_dir = tmp_path / "served"
+    input_dir = tmp_path / "input"
+    served_dir.mkdir()
+    input_dir.mkdir()
+    monkeypatch.setattr(run_benchmark, "SERVED_IMAGES_DIR", str(served_dir))
+    (served_dir / "old.png").write_bytes(b"")
+    (input_dir / "input_1.png").write_bytes(b"")
+    output = tmp_path / "DreamLayer_00001_.png"
+    output.write_bytes(b"")
+    served_before = {"old.png"}
+    input_before = {"input_1.png"}
+
+    (served_dir / "new.png").write_bytes(b"")
+    for name in ("input_2.png", "upscale_input_3.png", "user_upload.png"):
+        (input_dir / name).write_bytes(b"")
+    remove_benchmark_files([str(output)], served_before, input_before, str(input_dir))
+
+    assert not output.exists()
+    assert sorted(p.name for p in served_dir.iterdir()) == ["old.png"]
+    assert sorted(p.name for p in input_dir.iterdir()) == ["input_1.png", "user_upload.png"]
@@ -0,0 +1,96 @@
+"""
+Test the indexed prompt corpus in random_prompt_generator.py
+"""
+
+import os
+import random
+import threading
+import pytest
+
+from dream_layer_backend_utils import random_prompt_generator
+from dream_layer_backend_utils.random_prompt_generator import PromptCorpus
+
+
+@pytest.fixture
+def prompt_file(tmp_path):
+    path = tmp_path / "positive_prompts.txt"
+    path.write_text(
+        "a majestic dragon, highly detailed, fantasy art\n"
+        "\n"
+        "  portrait of a cyberpunk warrior, neon lights  \n"
+        "serene landscape, cherry blossoms, fantasy art\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+class TestPromptCorpus:
+    """Test PromptCorpus sampling and reloading"""
+
+    def test_indexes_non_empty_stripped_lines(self, prompt_file):
+        """Test that blank lines are skipped and whitespace is stripped"""
+        corpus = PromptCorpus(str(prompt_file))
+        assert len(corpus) == 3
+        samples = {corpus.sample(rng=random.Random(seed)) for seed in range(50)}
+        assert "portrait of a cyberpunk warrior, neon lights" in samples
+        assert all(s == s.strip() and s for s in samples)
+
+    def test_keyword_filter(self, prompt_file):
+        """Test that keyword sampling only returns matching prompts"""
+        corpus = PromptCorpus(str(prompt_file))
+        for seed in range(20):
+            assert "dragon" in corpus.sample(keyword="DRAGON", rng=random.Random(seed))
+        assert corpus.sample(keyword="spaceship") is None
+
+    def test_tag_filter_matches_whole_segments(self, prompt_file):
+        """Test that tags match comma-separated segments exactly"""
+        corpus = PromptCorpus(str(prompt_file))
+        samples = {corpus.sample(tag="fantasy art", rng=random.Random(seed)) for seed in range(50)}
+        assert samples == {
+            "a majestic dragon, highly detailed, fantasy art",
+            "serene landscape, cherry blossoms, fantasy art",
+        }
+        assert corpus.sample(tag="fantasy") is None
+
+    def test_keyword_scan_does_not_block_sampling(self, prompt_file, monkeypatch):
+        """Test that a keyword scan of the corpus runs without holding the lock"""
+        corpus = PromptCorpus(str(prompt_file))
+        assert len(corpus) == 3
+        scanning = threading.Event()
+        release = threading.Event()
+        line = random_prompt_generator._Index.line
+
+        def slow_line(index, number):
+            if threading.current_thread().name == "scan":
+                scanning.set()
+                release.wait(5)
+            return line(index, number)
+
+        monkeypatch.setattr(random_prompt_generator._Index, "line", slow_line)
+        scan = threading.Thread(target=corpus.sample, kwargs={"keyword": "dragon"}, name="scan")
+        scan.start()
+        assert scanning.wait(5)
+        # Tags come from the index built at load time
+        assert corpus.sample(tag="neon lights") == "portrait of a cyberpunk warrior, neon lights"
+        assert corpus.sample(keyword="nothing") is None
+        release.set()
+        scan.join()
+
+    def test_reloads_when_file_changes(self, prompt_file):
+        """Test that edits to the prompt file are picked up"""
+        corpus = PromptCorpus(str(prompt_file))
+        assert len(corpus) == 3
+
+        prompt_file.write_text("only prompt\n", encoding="utf-8")
+        stat = os.stat(prompt_file)
+        os.utime(prompt_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        assert len(corpus) == 1
+        assert corpus.sample() == "only prompt"
+        assert corpus.sample(keyword="dragon") is None
+
+    def test_empty_file(self, tmp_path):
+        """Test that an empty corpus yields None"""
+        path = tmp_path / "empty.txt"
+        path.write_text("", encoding="utf-8")
+        assert PromptCorpus(str(path)).sample() is None
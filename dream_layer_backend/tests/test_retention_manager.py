@@ -0,0 +1,115 @@
+"""
+Test quota and age based eviction in retention_manager.py
+"""
+
+import os
+import time
+import pytest
+
+from dream_layer_backend_utils.retention_manager import RetentionManager, record_access
+
+
+def _write_file(directory, name, size, age_seconds=3600, accessed_seconds_ago=None):
+    """Create a file of the given size with backdated timestamps"""
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    now = time.time()
+    mtime = now - age_seconds
+    atime = now - (accessed_seconds_ago if accessed_seconds_ago is not None else age_seconds)
+    os.utime(path, (atime, mtime))
+    return path
+
+
+@pytest.fixture
+def managed_dir(tmp_path):
+    return str(tmp_path)
+
+
+class TestRetentionManager:
+    """Test RetentionManager eviction rules"""
+
+    def test_evicts_least_recently_served_first(self, managed_dir):
+        """Test that quota eviction removes the file served longest ago"""
+        _write_file(managed_dir, 'a.png', 100, accessed_seconds_ago=10)
+        _write_file(managed_dir, 'b.png', 100, accessed_seconds_ago=3000)
+        _write_file(managed_dir, 'c.png', 100, accessed_seconds_ago=20)
+
+        manager = RetentionManager(referenced_files_provider=lambda: set(), grace_seconds=60)
+        manager.add_directory('served', managed_dir, max_bytes=250)
+
+        assert manager.run_once('served') == 1
+        assert sorted(os.listdir(managed_dir)) == ['a.png', 'c.png']
+
+    def test_evicts_expired_files(self, managed_dir):
+        """Test that files past the age limit are removed"""
+        _write_file(managed_dir, 'old.png', 10, age_seconds=7200)
+        _write_file(managed_dir, 'new.png', 10, age_seconds=600)
+
+        manager = RetentionManager(referenced_files_provider=lambda: set(), grace_seconds=60)
+        manager.add_directory('served', managed_dir, max_age_seconds=3600)
+
+        manager.run_once('served')
+        assert os.listdir(managed_dir) == ['new.png']
+        assert manager.get_metrics()['served']['evicted_for_age'] == 1
+
+    def test_never_evicts_referenced_files(self, managed_dir):
+        """Test that files used by a queued prompt survive eviction"""
+        _write_file(managed_dir, 'queued.png', 100, age_seconds=7200)
+
+        manager = RetentionManager(referenced_files_provider=lambda: {'queued.png'}, grace_seconds=60)
+        manager.add_directory('input', managed_dir, max_bytes=1, max_age_seconds=60)
+
+        assert manager.run_once('input') == 0
+        assert os.listdir(managed_dir) == ['queued.png']
+        assert manager.get_metrics()['input']['skipped_referenced'] == 1
+
+    def test_keeps_everything_when_queue_unavailable(self, managed_dir):
+        """Test that an unreachable ComfyUI queue disables eviction"""
+        _write_file(managed_dir, 'a.png', 100, age_seconds=7200)
+
+        def unavailable():
+            raise ConnectionError("ComfyUI is down")
+
+        manager = RetentionManager(referenced_files_provider=unavailable, grace_seconds=60)
+        manager.add_directory('served', managed_dir, max_bytes=1)
+
+        assert manager.run_once('served') == 0
+        assert os.listdir(managed_dir) == ['a.png']
+        assert manager.get_metrics()['served']['errors'] == 1
+
+    def test_respects_grace_period_and_patterns(self, managed_dir):
+        """Test that fresh files and non-matching files are left alone"""
+        _write_file(managed_dir, 'controlnet_unit_0_1.png', 100, age_seconds=5)
+        _write_file(managed_dir, 'user_upload.png', 100, age_seconds=7200)
+
+        manager = RetentionManager(referenced_files_provider=lambda: set(), grace_seconds=60)
+        manager.add_directory('input', managed_dir, max_bytes=1, patterns=['controlnet_unit_*'])
+
+        assert manager.run_once('input') == 0
+        assert sorted(os.listdir(managed_dir)) == ['controlnet_unit_0_1.png', 'user_upload.png']
+
+    def test_batch_size_bounds_work_per_tick(self, managed_dir):
+        """Test that a single tick never deletes more than batch_size files"""
+        for i in range(5):
+            _write_file(managed_dir, f'{i}.png', 10, age_seconds=7200)
+
+        manager = RetentionManager(referenced_files_provider=lambda: set(), batch_size=2, grace_seconds=60)
+        manager.add_directory('served', managed_dir, max_age_seconds=60)
+
+        assert manager.run_once() == 2
+        assert len(os.listdir(managed_dir)) == 3
+        metrics = manager.get_metrics()['served']
+        assert metrics['files'] == 3
+        assert metrics['bytes'] == 30
+
+    def test_record_access_keeps_mtime(self, managed_dir):
+        """Test that serving a file updates atime but not mtime"""
+        path = _write_file(managed_dir, 'a.png', 10, age_seconds=7200)
+        mtime_before = os.stat(path).st_mtime_ns
+
+        record_access(path)
+
+        stat = os.stat(path)
+        assert stat.st_mtime_ns == mtime_before
+        assert time.time() - stat.st_atime < 60
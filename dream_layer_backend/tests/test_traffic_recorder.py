@@ -0,0 +1,155 @@
+"""
+Test traffic recording and the replay helpers
+"""
+
+import os
+import json
+import base64
+import pytest
+
+from benchmarks.fake_comfyui import make_png
+from benchmarks.replay_traffic import load_records, prepare_comfy_prompt, restore_blobs
+from dream_layer_backend_utils import traffic_recorder
+from dream_layer_backend_utils.traffic_recorder import TrafficRecorder, get_traffic_recorder
+
+
+@pytest.fixture
+def recorder(tmp_path):
+    return TrafficRecorder(str(tmp_path / "archive"))
+
+
+def _read_archive(recorder):
+    with open(recorder.archive_path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestSanitize:
+    """Test what is stripped and what is moved to blobs"""
+
+    def test_strips_secrets_and_extra_data(self, recorder):
+        """Test that API keys and ComfyUI extra_data never reach the archive"""
+        payload = {
+            "prompt": "a cat",
+            "api_key": "sk-123",
+            "OPENAI_API_KEY": "sk-456",
+            "nested": {"auth_token": "abc", "steps": 20},
+            "extra_data": {"api_key_comfy_org": "secret"},
+        }
+        sanitized = recorder.sanitize(payload)
+        assert sanitized == {"prompt": "a cat", "nested": {"steps": 20}}
+        assert "sk-" not in json.dumps(sanitized)
+
+    def test_images_stored_once_by_hash(self, recorder):
+        """Test that identical base64 images share one blob"""
+        data = make_png() + os.urandom(1024)
+        image = base64.b64encode(data).decode()
+        sanitized = recorder.sanitize({
+            "input_image": f"data:image/png;base64,{image}",
+            "controlnet": {"units": [{"input_image": image}]},
+        })
+
+        data_url_ref = sanitized["input_image"]
+        raw_ref = sanitized["controlnet"]["units"][0]["input_image"]
+        assert data_url_ref["$blob"] == raw_ref["$blob"]
+        assert data_url_ref["data_url"] and "data_url" not in raw_ref
+        assert recorder.load_blob(raw_ref) == data
+        assert restore_blobs(recorder.archive_dir, sanitized) == {
+            "input_image": f"data:image/png;base64,{image}",
+            "controlnet": {"units": [{"input_image": image}]},
+        }
+
+    def test_short_strings_untouched(self, recorder):
+        """Test that prompts and filenames are not mistaken for base64"""
+        assert recorder.sanitize({"prompt": "abcd", "model": "x.safetensors"}) == {
+            "prompt": "abcd", "model": "x.safetensors"}
+
+
+class TestRecording:
+    """Test request records written to the archive"""
+
+    def test_record_with_prompt_pins_seed(self, recorder, tmp_path, monkeypatch):
+        """Test that a random seed is replaced by the one ComfyUI actually got"""
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        (input_dir / "upscale_input_1.png").write_bytes(make_png())
+        monkeypatch.setattr(traffic_recorder, "COMFY_INPUT_DIR", str(input_dir))
+
+        recorder.start_request("/api/txt2img", {"prompt": "a cat", "seed": -1})
+        prompt = {
+            "1": {"class_type": "LoadImage", "inputs": {"image": "upscale_input_1.png"}},
+            "3": {"class_type": "KSampler", "inputs": {"seed": 1234, "steps": 20}},
+        }
+        recorder.add_prompt({"prompt": prompt, "extra_data": {"api_key_comfy_org": "x"}}, "pid", 1.0, 3.5)
+        recorder.finish_request(200)
+
+        [record] = _read_archive(recorder)
+        assert record["endpoint"] == "/api/txt2img"
+        assert record["status"] == 200
+        assert record["request"]["seed"] == 1234
+        assert record["prompts"][0]["prompt"] == prompt
+        assert record["prompts"][0]["duration"] == 2.5
+        assert "1.image" in record["prompts"][0]["input_files"]
+
+        replay_dir = tmp_path / "replay_input"
+        replayed = prepare_comfy_prompt(recorder.archive_dir, record["prompts"][0], str(replay_dir))
+        assert replayed["1"]["inputs"]["image"] == "upscale_input_1.png"
+        assert (replay_dir / "upscale_input_1.png").read_bytes() == make_png()
+
+    def test_replayed_prompt_gets_blobs_back(self, recorder, tmp_path):
+        """Test that base64 data moved to blobs is sent to ComfyUI as recorded"""
+        image = base64.b64encode(make_png() + os.urandom(1024)).decode()
+        prompt = {
+            "1": {"class_type": "LoadImageBase64", "inputs": {"image": image}},
+            "2": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20}},
+        }
+        recorder.start_request("/api/img2img", {"prompt": "a cat"})
+        recorder.add_prompt({"prompt": prompt}, "pid", 1.0, 2.0)
+        recorder.finish_request(200)
+
+        [record] = _read_archive(recorder)
+        assert "$blob" in record["prompts"][0]["prompt"]["1"]["inputs"]["image"]
+        replayed = prepare_comfy_prompt(recorder.archive_dir, record["prompts"][0], str(tmp_path / "replay_input"))
+        assert replayed == prompt
+
+    def test_only_captures_loader_files_in_input_dir(self, recorder, tmp_path, monkeypatch):
+        """Test that only files picked by loader nodes inside the input directory are archived"""
+        input_dir = tmp_path / "input"
+        input_dir.mkdir()
+        (input_dir / "input_1.png").write_bytes(make_png())
+        outside = tmp_path / "secret.txt"
+        outside.write_text("not an input")
+        monkeypatch.setattr(traffic_recorder, "COMFY_INPUT_DIR", str(input_dir))
+
+        recorder.start_request("/api/img2img", {"prompt": "a cat"})
+        prompt = {
+            "1": {"class_type": "LoadImage", "inputs": {"image": str(input_dir / "input_1.png")}},
+            "2": {"class_type": "LoadImage", "inputs": {"image": "../secret.txt"}},
+            "3": {"class_type": "LoadImageMask", "inputs": {"image": str(outside)}},
+            "4": {"class_type": "CLIPTextEncode", "inputs": {"text": str(input_dir / "input_1.png")}},
+        }
+        recorder.add_prompt({"prompt": prompt}, "pid", 1.0, 2.0)
+        recorder.finish_request(200)
+
+        [record] = _read_archive(recorder)
+        assert list(record["prompts"][0]["input_files"]) == ["1.image"]
+
+    def test_records_append_in_order(self, recorder):
+        """Test that records accumulate as JSON lines and load in start order"""
+        for endpoint in ("/api/txt2img", "/api/img2img"):
+            recorder.start_request(endpoint, {"prompt": endpoint})
+            recorder.finish_request(200)
+
+        records = load_records(recorder.archive_dir)
+        assert [r["endpoint"] for r in records] == ["/api/txt2img", "/api/img2img"]
+        assert [r["endpoint"] for r in load_records(recorder.archive_dir, ["/api/img2img"])] == ["/api/img2img"]
+
+    def test_prompt_without_request_is_ignored(self, recorder):
+        """Test that prompts submitted outside a recorded request are dropped"""
+        recorder.add_prompt({"1": {"inputs": {}}}, "pid", 0.0, 1.0)
+        recorder.finish_request(200)
+        assert not os.path.exists(recorder.archive_path)
+
+    def test_disabled_without_env(self, monkeypatch):
+        """Test that recording is off unless the env var is set"""
+        monkeypatch.delenv(traffic_recorder.RECORD_TRAFFIC_ENV, raising=False)
+        assert get_traffic_recorder() is None
@@ -8,6 +8,7 @@ from shared_utils import  send_to_comfyui
 from dream_layer_backend_utils.fetch_advanced_models import get_controlnet_models
 from PIL import Image, ImageDraw
 from txt2img_workflow import transform_to_txt2img_workflow
+from dream_layer_backend_utils.traffic_recorder import record_traffic
 
 app = Flask(__name__)
 CORS(app, resources={
@@ -26,6 +27,7 @@ os.makedirs(SERVED_IMAGES_DIR, exist_ok=True)
 
 
 @app.route('/api/txt2img', methods=['POST', 'OPTIONS'])
+@record_traffic
 def handle_txt2img():
     """Handle text-to-image generation requests"""
     if request.method == 'OPTIONS':
@@ -2,7 +2,7 @@ import json
 import random
 import os
 import json
-from dream_layer_backend_utils.workflow_loader import load_workflow
+from dream_layer_backend_utils.workflow_loader import load_workflow_with_api_nodes
 from dream_layer_backend_utils.api_key_injector import inject_api_keys_into_workflow
 from dream_layer_backend_utils.update_custom_workflow import override_workflow
 from dream_layer_backend_utils.update_custom_workflow import update_custom_workflow, validate_custom_workflow
@@ -166,11 +166,11 @@ def transform_to_txt2img_workflow(data):
         print(f"📄 Workflow request: {workflow_request}")
 
         # Load workflow using the workflow loader
-        workflow = load_workflow(workflow_request)
+        workflow, api_node_classes = load_workflow_with_api_nodes(workflow_request)
         print(f"✅ Workflow loaded successfully")
 
         # Inject API keys if needed (for DALL-E, FLUX, etc.)
-        workflow = inject_api_keys_into_workflow(workflow)
+        workflow = inject_api_keys_into_workflow(workflow, api_node_classes)
         print(f"✅ API keys injected")
 
         # Custom workflow support from smallFeatures